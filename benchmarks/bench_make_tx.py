@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+
+"""比较 make_raw_tx 与 TxTemplate 的签名速度. 用法: PYTHONPATH=src python benchmarks/bench_make_tx.py"""
+import timeit
+
+from cita.make_tx import SignerSecp256k1, TxTemplate
+from cita import encode_param, join_param, param_to_bytes
+
+
+N = 5000
+
+signer = SignerSecp256k1()
+private_key = param_to_bytes(signer.generate_account()[0])
+contract_addr = b'\x11' * 20
+code = param_to_bytes(join_param('0xa9059cbb', encode_param('(address,uint256)', ('0x' + '22' * 20, 100))))  # transfer(address,uint256)
+template = TxTemplate(signer, contract_addr, quota=1000000)
+
+signer.for_key(private_key)  # 两种方式都使用缓存的私钥上下文, 只比较交易的构造和序列化
+
+t_protobuf = timeit.timeit(lambda: signer.make_raw_tx(private_key, contract_addr, code, 100, 0, 1000000), number=N)
+t_template = timeit.timeit(lambda: template.make_raw_tx(private_key, code, 100), number=N)
+
+print(f'make_raw_tx: {t_protobuf / N * 1e6:8.1f} us/tx')
+print(f'TxTemplate:  {t_template / N * 1e6:8.1f} us/tx')
+print(f'speedup:     {t_protobuf / t_template:8.2f}x')
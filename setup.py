@@ -55,6 +55,7 @@ setup(
     python_requires='>=3.7, <4',
     setup_requires=setup_requires,
     install_requires=install_requires,
+    extras_require={'async': ['aiohttp>=3.6']},
 
     include_package_data=True,  # automatically include any data files it finds inside your package directories that are specified by your MANIFEST.in file
     zip_safe=False,  # this project CANNOT be safely installed and run from a zip file
@@ -1,4 +1,15 @@
-from .sdk import CitaClient, ContractClass, ContractProxy
+from .sdk import CitaClient, ContractClass, ContractProxy, Multicall
+from .async_sdk import AsyncCitaClient, AsyncContractClass, AsyncContractProxy, AsyncMulticall
+from .cache import CallCache, DataCacheBase, DataCache
+from .batch import encode_batch_calls, BatchSubmitter, BatchSubmitError, BatchChunk
+from .tracker import BlockHeightTracker, PollScheduler
+from .watch import ReceiptWatcher, AsyncReceiptWatcher
+from .scan import BlockIterator, AsyncBlockIterator, LogIterator, AsyncLogIterator
+from .follow import ChainFollower, AsyncChainFollower, FileCursor
+from .events import Event, EventABI, EventArgs, EventDecoder, EventRegistry, event_registry, LogPoller, AsyncLogPoller, parse_events, make_log_filter
+from .store import ChainStore
+from .jsoncodec import JSONCodec, OrjsonCodec, UjsonCodec, get_json_codec, set_json_codec
+from .transport import TransportBase, HttpTransport, AsyncTransportBase, AsyncHttpTransport
 from .util import join_param, equal_param, encode_param, decode_param, param_to_bytes, param_to_str, DEFAULT_QUOTA, LATEST_VERSION
 
 __version__ = '0.1.0'
@@ -7,6 +18,12 @@ __description__ = 'CITA Python SDK.'
 __email__ = 'shenlei@funji.club'
 __url__ = 'https://github.com/citahub/cita-sdk-python'
 
-__all__ = ['CitaClient', 'ContractClass', 'ContractProxy',
+__all__ = ['CitaClient', 'ContractClass', 'ContractProxy', 'Multicall',
+           'AsyncCitaClient', 'AsyncContractClass', 'AsyncContractProxy', 'AsyncMulticall',
+           'BlockHeightTracker', 'PollScheduler', 'ReceiptWatcher', 'AsyncReceiptWatcher', 'BlockIterator', 'AsyncBlockIterator', 'ChainFollower', 'AsyncChainFollower', 'FileCursor',
+           'Event', 'EventABI', 'EventArgs', 'EventDecoder', 'EventRegistry', 'event_registry', 'LogIterator', 'AsyncLogIterator', 'LogPoller', 'AsyncLogPoller', 'parse_events', 'make_log_filter', 'CallCache', 'DataCacheBase', 'DataCache', 'ChainStore',
+           'TransportBase', 'HttpTransport', 'AsyncTransportBase', 'AsyncHttpTransport',
+           'JSONCodec', 'OrjsonCodec', 'UjsonCodec', 'get_json_codec', 'set_json_codec',
+           'encode_batch_calls', 'BatchSubmitter', 'BatchSubmitError', 'BatchChunk',
            'join_param', 'equal_param', 'encode_param', 'decode_param', 'param_to_bytes', 'param_to_str',
            'DEFAULT_QUOTA']
@@ -0,0 +1,751 @@
+"""
+基于asyncio的CitaClient.
+
+接口与 :class:`~cita.CitaClient` 保持一致, 会发起JSON RPC调用的方法都改为协程. 需要安装 ``aiohttp``.
+"""
+from typing import Iterable, Dict, List, Tuple, Optional, Union, Sequence, Callable, Any, cast
+import asyncio
+import time
+
+from .util import PARAM, DEFAULT_QUOTA, LATEST_VERSION, param_to_str, param_to_bytes, join_param, encode_param
+from .tracker import BlockHeightTracker, PollScheduler
+from .cache import CallCache, DataCacheBase
+from .scan import AsyncBlockIterator, AsyncLogIterator
+from .follow import AsyncChainFollower, FileCursor
+from .watch import AsyncReceiptWatcher
+from .events import AsyncLogPoller, make_log_filter, event_registry
+from .jsoncodec import JSONCodec
+from .transport import AsyncTransportBase, AsyncHttpTransport
+from .endpoint import Node, WRITE_METHODS, IDEMPOTENT_METHODS
+from .sdk import ClientBase, STORE_ABI_ADDR, BATCH_TX_ADDR, BATCH_TX_CALL, ContractClass, ContractProxy, Multicall, make_call_request, make_batch_tx_data
+
+
+class AsyncCitaClient(ClientBase):
+    """
+    CitaClient的asyncio版本.
+
+    同一个事件循环中可以并发发起大量调用, 它们共享transport的连接池.
+    """
+    def __init__(self, url: Union[str, Sequence[str]], timeout: int = 10, call_mode: str = 'latest', crypto_method: str = 'secp256k1', version: int = LATEST_VERSION, chain_id: int = 1,
+                 transport: Optional[AsyncTransportBase] = None, height_tracker: Optional[BlockHeightTracker] = None,
+                 poll_scheduler: Optional[PollScheduler] = None, write_policy: str = 'pinned', hedge_percentile: Optional[float] = None,
+                 call_cache: Optional[CallCache] = None, data_cache: Optional[DataCacheBase] = None,
+                 json_codec: Optional[JSONCodec] = None):
+        """
+        指定cita环境.
+
+        :param url: cita后端服务的url. 也可以是多个节点的url列表, 读请求发给负载最低, 延迟最小的健康节点
+        :param call_mode: 调用时使用已确认区块 `latest` , 还是待确认区块 `pending`
+        :param timeout: JSON RPC的调用超时时间, 单位秒
+        :param crypto_method: 加密机制. 默认secp256k1
+        :param version: 链的版本, 默认为 2
+        :param chain_id: 链id, 默认为 1
+        :param transport: JSON RPC的异步传输层. 默认创建一个AsyncHttpTransport
+        :param height_tracker: 区块高度的缓存. 指定后, 发送交易时使用缓存的高度计算 ``valid_until_block`` , 不再每次都调用 ``blockNumber``
+        :param poll_scheduler: 等待回执时安排轮询时间. 默认根据链的出块间隔自动调整
+        :param write_policy: 有多个节点时, 发送交易的策略. ``pinned`` 发给第一个健康节点; ``balanced`` 与读请求相同; ``broadcast`` 发给所有健康节点
+        :param hedge_percentile: 有多个节点时, 幂等的只读请求如果在最近响应时间的该分位数 (如0.95) 内没有返回, 再发给另一个节点, 使用先返回的结果
+        :param call_cache: 只读调用的结果缓存. 默认不缓存
+        :param data_cache: 区块, 交易和合约代码等不可变数据的缓存. 默认不缓存. 由调用方负责关闭
+        :param json_codec: JSON RPC报文的编解码器. 默认安装了orjson或ujson时使用它们, 否则使用标准库json
+        """
+        super().__init__(url, timeout, call_mode, crypto_method, version, chain_id, height_tracker, poll_scheduler, write_policy, hedge_percentile,
+                         call_cache, data_cache, json_codec)
+        # 外部传入的transport可能被多个client共享, 由调用方负责关闭.
+        self.transport = transport if transport is not None else AsyncHttpTransport()
+        self._own_transport = transport is None
+        # 所有等待回执的协程共享一个跟踪最新区块的轮询任务, 而不是每个交易各自轮询.
+        self.receipt_watcher = AsyncReceiptWatcher(self)
+
+    async def close(self):
+        """关闭client持有的连接池, 停止等待回执."""
+        await self.receipt_watcher.close()
+        if self._own_transport:
+            await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _post_to(self, node: Node, data: bytes) -> Tuple[int, bytes]:
+        """向一个节点发送请求, 并更新节点的统计信息."""
+        t0 = self.nodes.begin(node)
+        try:
+            status, content = await self.transport.post(node.url, data, self.timeout)
+        except asyncio.CancelledError:  # 被取消的对冲请求不算失败
+            self.nodes.cancel(node)
+            raise
+        except Exception:
+            self.nodes.end(node, t0, False)
+            raise
+        self.nodes.end(node, t0, status < 500)
+        return status, content
+
+    async def _post(self, data: bytes, write: bool = False, idempotent: bool = False, node: Optional[Node] = None) -> Tuple[int, bytes]:
+        """
+        选择节点发送请求. 连接失败, 超时或HTTP 5xx时, 依次尝试下一个节点.
+
+        :param data: 编码后的请求体
+        :param write: 是否为写请求
+        :param idempotent: 是否为幂等的只读请求, 可以发出对冲请求
+        :param node: 只发给这个节点, 比如过滤器相关的请求
+        :return: (HTTP状态码, 响应体)
+        """
+        if node is not None:
+            return await self._post_to(node, data)
+        if write and self.nodes.write_policy == 'broadcast' and len(self.nodes.nodes) > 1:
+            return await self._broadcast(data)
+
+        hedge, candidates = self._failover_plan(write, idempotent)
+        last_resp: Optional[Tuple[int, bytes]] = None
+        last_error: Optional[Exception] = None
+        if hedge is not None:
+            try:
+                status, content = await self._hedge(data, *hedge)
+                if status < 500:
+                    return status, content
+                last_resp = (status, content)
+            except Exception as e:
+                last_error = e
+
+        for node in candidates:
+            try:
+                status, content = await self._post_to(node, data)
+            except Exception as e:
+                last_error = e
+                continue
+            if status < 500:
+                return status, content
+            last_resp = (status, content)
+        if last_resp is not None:
+            return last_resp
+        raise cast(Exception, last_error)
+
+    async def _hedge(self, data: bytes, primary: Node, secondary: Node, delay: float) -> Tuple[int, bytes]:
+        """
+        先把请求发给primary, 超过delay没有返回 (或者已经失败) 时, 再发给secondary, 使用先成功的结果, 并取消另一个请求.
+        """
+        pending = {asyncio.ensure_future(self._post_to(primary, data))}
+        hedged = False
+        last: Optional[asyncio.Future] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if hedged else delay, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    last = task
+                    if task.exception() is None and task.result()[0] < 500:
+                        return task.result()
+                if not hedged:  # 超时, 或者primary已经失败
+                    pending.add(asyncio.ensure_future(self._post_to(secondary, data)))
+                    hedged = True
+            return cast(asyncio.Future, last).result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _broadcast(self, data: bytes) -> Tuple[int, bytes]:
+        """把写请求同时发给所有健康节点, 返回最先成功的响应."""
+        first: Optional[Tuple[int, bytes]] = None
+        last_error: Optional[Exception] = None
+        for coro in asyncio.as_completed([self._post_to(node, data) for node in self._broadcast_nodes()]):
+            try:
+                status, content = await coro
+            except Exception as e:
+                last_error = e
+                continue
+            if self._accepted(status, content):
+                return status, content
+            first = first or (status, content)
+        if first is not None:
+            return first
+        raise cast(Exception, last_error)
+
+    async def _jsonrpc(self, method: str, params: List, node: Optional[Node] = None) -> Union[None, str, Dict, List]:
+        """
+        执行jsonrpc调用.
+
+        :param method: JSON RPC的方法名
+        :param params: 被调方法的实参列表
+        :param node: 只发给这个节点. 默认由节点池选择
+        :return: JSON
+        """
+        req = self._rpc_request(method, params)
+        status, content = await self._post(self.json_codec.dumps(req), method in WRITE_METHODS, method in IDEMPOTENT_METHODS, node)
+        return self._rpc_result(req, status, content)
+
+    async def multi_call(self, calls: List[Tuple[str, List]]) -> List[Union[None, str, Dict, List]]:
+        """
+        在一个HTTP请求中执行多个jsonrpc调用 (JSON-RPC 2.0 batch).
+
+        :param calls: [(方法名, 实参列表), ...]
+        :return: 与calls一一对应的结果列表
+        """
+        if not calls:
+            return []
+
+        req = self._batch_request(calls)
+        status, content = await self._post(self.json_codec.dumps(req), *self._batch_route(calls))
+        return self._batch_results(calls, req, status, content)
+
+    async def get_peer_count(self) -> int:
+        """兄弟节点个数."""
+        return self._parse_quantity(await self._jsonrpc('peerCount', []))
+
+    async def get_peers(self) -> Dict[str, str]:
+        """
+        获取兄弟节点信息.
+
+        :return: 各个节点的信息, {节点名: 节点ip, ...}
+        """
+        r = await self._jsonrpc('peersInfo', [])
+        r = cast(Dict, r)
+        return r.get('peers', {})
+
+    async def get_latest_block_number(self) -> int:
+        """最新区块的高度."""
+        return self._observe_head(self._parse_quantity(await self._jsonrpc('blockNumber', [])))
+
+    async def get_block_by_hash(self, hash: PARAM, tx_detail: bool = False) -> Dict:
+        """
+        根据区块hash获取区块详情.
+
+        :param hash: 32字节的hash
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :return: 区块详情
+        """
+        hash_str, key = self._blockhash_key(hash, tx_detail)
+        r = self._cache_get(key)
+        if r is not None:
+            return r
+        return self._got_block(await self._jsonrpc('getBlockByHash', [hash_str, tx_detail]), tx_detail)
+
+    async def get_block_by_number(self, height: int, tx_detail: bool = False) -> Dict:
+        """
+        根据区块id获取区块详情.
+
+        :param height: 区块高度, 从0起
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :return: 区块详情
+        """
+        _, keys = self._block_keys([height], tx_detail)
+        r = self._cache_get(keys[0])
+        if r is not None:
+            return r
+        return self._got_block(await self._jsonrpc('getBlockByNumber', ['0x%02x' % height, tx_detail]), tx_detail)
+
+    async def get_blocks_by_number(self, heights: Iterable[int], tx_detail: bool = False) -> List[Dict]:
+        """
+        批量获取区块详情, 只需要一次网络往返. 指定了data_cache时, 只有没有缓存的区块会发给节点.
+
+        :param heights: 区块高度列表
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :return: 与heights一一对应的区块详情
+        """
+        heights, keys = self._block_keys(heights, tx_detail)
+        result, missing = self._cache_many(keys)
+        blocks = cast(List[Dict], await self.multi_call([('getBlockByNumber', ['0x%02x' % heights[i], tx_detail]) for i in missing]))
+        for i, block in zip(missing, blocks):
+            result[i] = block
+        self._cache_blocks(blocks, tx_detail)
+        return cast(List[Dict], result)
+
+    def iter_blocks(self, start: int, end: Optional[int] = None, tx_detail: bool = False, workers: int = 4, batch_size: int = 10) -> AsyncBlockIterator:
+        """
+        并发获取区块 [start, end), 按高度顺序返回. 最多workers个batch请求同时进行, 调用方取走区块后才发出新的请求.
+
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :param workers: 同时进行的请求数
+        :param batch_size: 每个请求包含的区块数
+        :return: AsyncBlockIterator, 使用 ``async for`` 按高度顺序返回区块详情
+        """
+        return AsyncBlockIterator(self, start, end, tx_detail, workers, batch_size)
+
+    async def get_meta_data(self) -> Dict:
+        """
+        查询链上元数据.
+        """
+        r = await self._jsonrpc('getMetaData', [self.call_mode])
+        return cast(Dict, r)
+
+    async def get_block_interval(self) -> float:
+        """出块间隔, 单位秒."""
+        r = await self.get_meta_data()
+        return r['blockInterval'] / 1000
+
+    async def send_raw_transaction(self, data: PARAM) -> str:
+        """
+        发送原始交易数据.
+
+        :param data: 待发送的数据.
+        :return: 交易hash.
+        """
+        r = await self._jsonrpc('sendRawTransaction', [param_to_str(data)])
+        return cast(Dict, r)['hash']
+
+    async def send_transaction(self, private_key: PARAM, to_addr: PARAM, code: PARAM, value: int = 0, quota: int = DEFAULT_QUOTA, max_wait_block: int = 88) -> str:
+        """
+        发送完整交易数据.
+
+        :param private_key: 私钥.
+        :param to_addr: 接收方地址. 如果是合约部署, 则为b''.
+        :param code: 字节码.
+        :param value: 金额.
+        :param quota: 调用配额.
+        :param max_wait_block: 交易至多等待多少个区块. 默认88.
+        :return: 交易hash.
+        """
+        block_number = self._tracked_height()
+        if block_number is None:
+            block_number = await self.get_latest_block_number()
+        return await self.send_raw_transaction(self._make_raw_tx(private_key, to_addr, code, block_number + max_wait_block, value, quota))
+
+    async def deploy_contract(self, private_key: PARAM, code: PARAM, param: PARAM = b'') -> str:
+        """
+        部署合约.
+
+        :param private_key: 私钥
+        :param code: 编译后的合约
+        :param params: 合约构造函数的参数经encode_param编码后的bytes. 无参数用 b''
+        :return: 交易hash.
+        """
+        return await self.send_transaction(private_key, b'', param_to_bytes(join_param(code, param)))
+
+    async def confirm_transaction(self, tx_hash: PARAM, timeout: int = -1) -> Dict:
+        """
+        等待交易完成.
+
+        由receipt_watcher统一跟踪最新区块: 观察到区块h+1时, 区块h中所有等待确认的交易一起返回.
+
+        :param tx_hash: 交易hash.
+        :param timeout: 等待回执的时间, 单位秒. -1: 一直等待回执; 0: 无论是否达成共识, 直接返回; 其他值表示超时时间
+        :return: 回执结果.
+        """
+        if timeout == 0:
+            return await self.get_transaction_receipt(tx_hash, 0)
+        # cita是先共识交易顺序, 后执行交易, 下个块公布上次答案, 所以会差1个块.
+        return (await self.receipt_watcher.wait([tx_hash], timeout, confirm=True))[0]
+
+    async def _poll_delay(self) -> float:
+        """按出块间隔计算到下一次轮询的延迟. 第一次调用时获取出块间隔."""
+        if self.poll_scheduler.interval is None:
+            try:
+                self.poll_scheduler.set_interval(await self.get_block_interval())
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # 获取失败 (RPC错误, 连接失败, 返回格式不对等) 时按1秒计算, 之后由区块时间戳修正
+                self.poll_scheduler.set_interval(1.0)
+        return self.poll_scheduler.next_delay()
+
+    async def get_transaction_receipt(self, tx_hash: PARAM, timeout: int = -1) -> Dict:
+        """
+        查看回执结果.
+
+        :param tx_hash: 交易hash.
+        :param timeout: 等待回执的时间, 单位秒. -1: 一直等待回执; 0: 无论有无回执, 直接返回; 其他值表示超时时间
+        :return: 回执结果. 如果交易还没执行且timeout=0, 则返回{}. 否则表示在pending区块中已经加入此交易, 期待共识
+        """
+        t0 = time.time()
+        (h,), (key,) = self._receipt_keys([tx_hash])
+        r = self._cache_get(key)
+
+        while not r:
+            r = self._got_receipt(key, await self._jsonrpc('getTransactionReceipt', [h]))
+            if timeout == 0 or r:
+                break
+
+            t1 = time.time()
+            if t1 - t0 >= timeout and timeout != -1:
+                raise RuntimeError('timeout')
+            await asyncio.sleep(await self._poll_delay())
+        return self._check_receipt(r)
+
+    async def get_transaction_receipts(self, tx_hash_list: Iterable[PARAM]) -> List[Dict]:
+        """
+        批量查看回执结果, 只需要一次网络往返. 不等待, 也不因交易失败抛出异常.
+
+        :param tx_hash_list: 交易hash列表
+        :return: 与tx_hash_list一一对应的回执. 还没有回执的交易返回{}, 交易失败的原因见回执中的 ``errorMessage``
+        """
+        hashes, keys = self._receipt_keys(tx_hash_list)
+        result, missing = self._cache_many(keys)
+        receipts = await self.multi_call([('getTransactionReceipt', [hashes[i]]) for i in missing])
+        return self._got_receipts(keys, result, missing, receipts)
+
+    async def _call_block(self, height: Optional[int]) -> Tuple[str, Optional[int]]:
+        """
+        确定只读调用使用的区块.
+
+        :param height: 指定的区块高度, None表示按call_mode
+        :return: (JSON RPC的区块参数, 缓存使用的区块高度). 不使用缓存时, 高度为None
+        """
+        r = self._fixed_call_block(height)
+        if r is not None:
+            return r
+        tracker = self.call_cache.tracker  # type: ignore
+        if tracker.expired:
+            tracker.update(await self.get_latest_block_number())
+        return self._head_call_block(tracker.height)
+
+    async def call_readonly_func(self, contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', from_addr: PARAM = b'', height: Optional[int] = None) -> bytes:
+        """
+        调用合约的只读函数. 指定了call_cache时, 优先使用缓存的结果.
+
+        :param contract_addr: 合约地址, 20字节
+        :param func_addr: 合约内的函数地址, 4字节
+        :param param: 合约构造函数的参数经encode_param编码后的bytes. 无参数用 b''
+        :param from_addr: 调用者的地址, 默认是 b''
+        :param height: 在指定高度的区块上调用. 默认按call_mode
+        :return: 返回值编码的bytes
+        """
+        req = make_call_request(contract_addr, func_addr, param, from_addr)
+        block, cache_height = await self._call_block(height)
+        keys, result, missing = self._cached_calls([req], cache_height)
+        if missing:
+            self._got_calls(keys, result, missing, [await self._jsonrpc('call', [req, block])], height is not None)
+        return cast(bytes, result[0])
+
+    async def call_readonly_funcs(self, call_list: Iterable[Tuple[PARAM, PARAM, PARAM]], from_addr: PARAM = b'', height: Optional[int] = None) -> List[bytes]:
+        """
+        批量调用合约的只读函数, 只需要一次网络往返. 指定了call_cache时, 只有没有缓存的调用会发给节点.
+
+        :param call_list: [(合约地址, 函数地址, 编码后的参数), ...]
+        :param from_addr: 调用者的地址, 默认是 b''
+        :param height: 在指定高度的区块上调用. 默认按call_mode
+        :return: 与call_list一一对应的返回值编码的bytes
+        """
+        req_list = [make_call_request(contract_addr, func_addr, param, from_addr) for contract_addr, func_addr, param in call_list]
+        block, cache_height = await self._call_block(height)
+        keys, result, missing = self._cached_calls(req_list, cache_height)
+        values = await self.multi_call([('call', [req_list[i], block]) for i in missing])
+        return self._got_calls(keys, result, missing, values, height is not None)
+
+    def multicall(self, height: Optional[int] = None, from_addr: PARAM = b'', batch_size: int = 500) -> 'AsyncMulticall':
+        """
+        合并多个只读合约调用. 用法见 :class:`AsyncMulticall` .
+
+        :param height: 在指定高度的区块上调用. 默认按call_mode
+        :param from_addr: 调用者的地址, 默认是 b''
+        :param batch_size: 每个请求最多包含多少个调用
+        :return: AsyncMulticall, 在async with块中使用
+        """
+        return AsyncMulticall(self, height, from_addr, batch_size)
+
+    async def call_func(self, private_key: PARAM, contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', quota: int = DEFAULT_QUOTA) -> str:
+        """
+        调用合约的函数.
+
+        :param private_key: 私钥
+        :param contract_addr: 合约地址
+        :param func_addr: 合约内的函数地址
+        :param param: 编码后的函数参数列表
+        """
+        return await self.send_transaction(private_key, contract_addr, param_to_bytes(func_addr) + param_to_bytes(param), quota=quota)
+
+    async def batch_call_func(self, private_key: PARAM, tx_code_list: List[PARAM], quota: int = DEFAULT_QUOTA) -> str:
+        """
+        发起批量交易.
+
+        :param private_key: 私钥.
+        :param tx_code_list: 由ContractClass.get_tx_code生成的交易数据.
+        :return: 交易hash
+        """
+        return await self.batch_call_func_raw(private_key, make_batch_tx_data(tx_code_list), quota=quota)
+
+    async def batch_call_func_raw(self, private_key: PARAM, batch_data: bytes, quota: int = DEFAULT_QUOTA) -> str:
+        """
+        发起批量交易.
+
+        :param private_key: 私钥.
+        :param batch_data: 由make_batch_tx_data或encode_batch_calls生成的 ``multiTxs`` 参数.
+        :return: 交易hash
+        """
+        # 调用 BatchTx 合约的 multiTxs 方法.
+        return await self.call_func(private_key,
+                                    BATCH_TX_ADDR,
+                                    BATCH_TX_CALL,
+                                    encode_param('bytes', batch_data),
+                                    quota=quota)
+
+    async def get_code(self, contract_addr: PARAM) -> bytes:
+        """
+        获取合约代码.
+
+        :param contract_addr: 合约地址, 20字节
+        :return: 合约代码bytes
+        """
+        addr, key = self._code_key(contract_addr)
+        r = self._cache_get(key)
+        if r is None:
+            r = await self._jsonrpc('getCode', [addr, self.call_mode])
+        return self._got_code(key, r)
+
+    async def get_abi(self, contract_addr: PARAM) -> List:
+        """
+        获取合约的ABI.
+
+        :param contract_addr: 合约地址, 20字节
+        :return: ABI的json
+        """
+        addr = self._contract_addr(contract_addr)
+        return self._parse_abi_result(await self._jsonrpc('getAbi', [addr, self.call_mode]))  # store_abi可以更新ABI, 所以不缓存
+
+    async def store_abi(self, private_key: PARAM, contract_addr: PARAM, abi: str) -> str:
+        """
+        将ABI追加给指定的合约.
+
+        :param private_key: 私钥
+        :param contract_addr: 合约地址
+        :param abi: ABI的json的字符串形式
+        :return: 交易hash
+        """
+        abi_data = encode_param('string', abi)
+        return await self.send_transaction(private_key, STORE_ABI_ADDR, join_param(contract_addr, abi_data))
+
+    async def get_transaction(self, tx_hash: PARAM) -> Dict:
+        """
+        获取交易详情.
+
+        :param tx_hash: 交易hash, 32字节
+        :return: JSON结构的交易详情
+        """
+        h, key = self._tx_key(tx_hash)
+        r = self._cache_get(key)
+        if r is not None:
+            return r
+        return self._got_transaction(key, await self._jsonrpc('getTransaction', [h]))
+
+    async def get_transaction_count(self, addr: PARAM) -> int:
+        """
+        获取指定账户发起的交易数量.
+
+        :param addr: 账户地址, 20字节
+        :return: 交易数量
+        """
+        return self._parse_count(await self._jsonrpc('getTransactionCount', self._count_params(addr, self.call_mode)))
+
+    async def get_logs(self, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                       from_block: Union[None, int, str] = None, to_block: Union[None, int, str] = None) -> List[Dict]:
+        """
+        查询符合条件的log.
+
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 可以是None (任意), 一个topic, 或topic的列表 (任意一个)
+        :param from_block: 起始区块高度, 或 ``latest`` , ``earliest``
+        :param to_block: 结束区块高度 (包含), 或 ``latest``
+        :return: log列表
+        """
+        r = await self._jsonrpc('getLogs', [make_log_filter(address, topics, from_block, to_block)])
+        return cast(List[Dict], r)
+
+    async def new_filter(self, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                         from_block: Union[None, int, str] = None, to_block: Union[None, int, str] = None) -> str:
+        """
+        在节点上创建log过滤器. 过滤器保存在节点本地, 之后对它的请求都发给同一个节点.
+
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同get_logs
+        :param from_block: 起始区块高度, 或 ``latest`` , ``earliest``
+        :param to_block: 结束区块高度 (包含), 或 ``latest``
+        :return: 过滤器id
+        """
+        node = self.nodes.candidates()[0]
+        r = await self._jsonrpc('newFilter', [make_log_filter(address, topics, from_block, to_block)], node)
+        filter_id = cast(str, r)
+        self._filter_nodes[filter_id] = node
+        return filter_id
+
+    async def get_filter_changes(self, filter_id: str) -> List[Dict]:
+        """
+        查询过滤器上次查询之后的新log.
+
+        :param filter_id: new_filter返回的过滤器id
+        :return: log列表
+        """
+        r = await self._jsonrpc('getFilterChanges', [filter_id], self._filter_nodes.get(filter_id))
+        return cast(List[Dict], r)
+
+    async def uninstall_filter(self, filter_id: str) -> bool:
+        """
+        删除过滤器.
+
+        :param filter_id: new_filter返回的过滤器id
+        :return: 是否删除成功
+        """
+        r = await self._jsonrpc('uninstallFilter', [filter_id], self._filter_nodes.pop(filter_id, None))
+        return bool(r)
+
+    def iter_logs(self, start: int, end: Optional[int] = None, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                  decoder: Optional[Callable[[Dict], Any]] = None, workers: int = 4, chunk_size: int = 1000) -> AsyncLogIterator:
+        """
+        并发查询区块 [start, end) 中的log, 按区块顺序返回. 区块范围按chunk_size分段, 最多workers段同时查询.
+
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同get_logs
+        :param decoder: 解码log的函数, 比如EventDecoder. 解码结果为None的log会被丢弃
+        :param workers: 同时进行的请求数
+        :param chunk_size: 每个请求查询的区块数
+        :return: AsyncLogIterator, 返回log或解码后的事件
+        """
+        return AsyncLogIterator(self, start, end, address, topics, decoder, workers, chunk_size)
+
+    def poll_logs(self, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                  decoder: Optional[Callable[[Dict], Any]] = None, poll_interval: Optional[float] = None) -> AsyncLogPoller:
+        """
+        通过过滤器持续获取新的log. 用法见 :class:`~cita.AsyncLogPoller` .
+
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同get_logs
+        :param decoder: 解码log的函数, 比如EventDecoder. 解码结果为None的log会被丢弃
+        :param poll_interval: 轮询间隔, 单位秒. None表示根据出块间隔安排
+        :return: AsyncLogPoller, 每轮返回一批新的log或事件
+        """
+        return AsyncLogPoller(self, address, topics, decoder, poll_interval)
+
+    def follow(self, start: Optional[int] = None, cursor: Union[None, str, FileCursor] = None, tx_detail: bool = False, confirmations: int = 1,
+               workers: int = 4, batch_size: int = 10, poll_interval: Optional[float] = None) -> AsyncChainFollower:
+        """
+        按高度顺序持续获取已确认的区块. 用法见 :class:`~cita.AsyncChainFollower` .
+
+        :param start: 第一个区块的高度. cursor中有进度时忽略. None表示从最新的已确认区块开始
+        :param cursor: 保存进度的FileCursor, 或文件路径. None表示不保存进度
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :param confirmations: 与最新区块之间保留的区块数. 默认1, 即区块h在h+1出块后返回
+        :param workers: 落后时同时进行的请求数
+        :param batch_size: 每个请求包含的区块数
+        :param poll_interval: 追上后查询新区块的间隔, 单位秒. None表示根据出块间隔安排
+        :return: AsyncChainFollower
+        """
+        return AsyncChainFollower(self, start, cursor, tx_detail, confirmations, workers, batch_size, poll_interval)
+
+
+class AsyncContractClass(ContractClass):
+    """ContractClass的asyncio版本. 部署合约的方法都是协程, bind得到AsyncContractProxy."""
+
+    def __init__(self, sol_file, client: AsyncCitaClient, func_name2quota: Optional[Dict[str, int]] = None):
+        """
+        生成ABI定义好的合约调用对象.
+
+        :param sol_file: ``.sol`` 合约文件路径, 参考ContractClass
+        :param client: AsyncCitaClient.
+        :param func_name2quota: 方法名->最大Quota.
+        """
+        super().__init__(sol_file, client, func_name2quota)  # type: ignore
+
+    async def instantiate_raw(self, private_key: PARAM, *args) -> str:  # type: ignore
+        """
+        部署合约, 不等待交易回执.
+
+        :param private_key: 用于部署合约的私钥.
+        :param args: 合约构造函数的参数.
+        :return: 部署交易hash.
+        """
+        param = self.func_mapping[''].encode_args(args)
+        return await self.client.deploy_contract(private_key, self.bytecode, param)  # type: ignore
+
+    async def instantiate(self, private_key: PARAM, *args) -> Tuple['AsyncContractProxy', str, str]:  # type: ignore
+        """
+        部署合约, 等待交易回执.
+
+        :param private_key: 用于部署合约的私钥
+        :param args: 合约构造函数的参数.
+        :return: (合约实例的封装, 合约地址, 部署交易hash)
+        """
+        tx_hash = await self.instantiate_raw(private_key, *args)
+        r = await self.client.get_transaction_receipt(tx_hash)  # type: ignore
+        contract_addr = r['contractAddress']
+        proxy = self.bind(contract_addr, private_key)
+        return proxy, contract_addr, tx_hash
+
+    async def batch_instantiate(self, private_key: PARAM, param_list: Iterable) -> List[Tuple['AsyncContractProxy', str, str]]:  # type: ignore
+        """
+        批量的部署合约, 等待交易回执.
+
+        :param private_key: 用于部署合约的私钥
+        :param param_list: 每个合约构造函数的参数
+        :return: (合约实例的封装, 合约地址, 部署交易hash)
+        """
+        tx_hash_list = await asyncio.gather(*[self.instantiate_raw(private_key, *args if isinstance(args, tuple) else (args,)) for args in param_list])
+        # 所有部署交易一起等待, 而不是逐个轮询
+        receipts = await self.client.receipt_watcher.wait(tx_hash_list, self.client.timeout)  # type: ignore
+        return [(self.bind(r['contractAddress'], private_key), r['contractAddress'], tx_hash)
+                for tx_hash, r in zip(tx_hash_list, receipts)]
+
+    def bind(self, contract_addr: PARAM, private_key: PARAM) -> 'AsyncContractProxy':
+        """
+        绑定到一个以部署的合约地址.
+
+        合约的事件会被注册到全局的 ``event_registry`` 中.
+
+        :param private_key: 用于部署合约的私钥
+        :return: 合约实例的封装
+        """
+        event_registry.register(contract_addr, self.events.values())
+        return AsyncContractProxy(self.name, self.func_mapping, self.client, private_key, contract_addr, self.events)  # type: ignore
+
+
+class AsyncContractProxy(ContractProxy):
+    """ContractProxy的asyncio版本. ``proxy.func(...)`` 返回协程, 需要await."""
+
+    async def do_call_func__(self, func_addr: str, args):  # type: ignore
+        """
+        执行合约方法调用.
+
+        :param func_addr: 合约方法地址.
+        :param args: 参数, 需配合合约方法的 param_type.
+        :return: 对普通方法返回tx_hash, 对只读方法返回解码后的返回值.
+        """
+        abi = self.func_mapping__[func_addr]
+        arg_bytes = abi.encode_args(args)
+
+        client = cast(AsyncCitaClient, self.client__)
+        if abi.mutable:  # 普通方法调用, 返回回执哈希
+            return await client.call_func(self.private_key__, self.contract_addr__, func_addr, param=arg_bytes, quota=abi.quota)
+
+        # 只读方法调用, 返回结果
+        return_bytes = await client.call_readonly_func(self.contract_addr__, func_addr, param=arg_bytes)
+        return abi.return_codec.decode(return_bytes)
+
+
+class AsyncMulticall(Multicall):
+    """
+    Multicall的asyncio版本. 在 ``async with`` 块中使用, 返回asyncio.Future, 多个请求并发发送::
+
+        async with client.multicall() as m:
+            a = m(token).balanceOf(addr1)
+        print(await a)
+    """
+
+    def _new_future(self):
+        return asyncio.get_event_loop().create_future()
+
+    async def execute(self):  # type: ignore
+        """发送所有已加入的调用. 退出async with块时会自动执行."""
+        client = cast(AsyncCitaClient, self.client)
+        chunks, height = self._take(), self.height
+        if len(chunks) > 1 and height is None and client.call_mode == 'latest':
+            height = await client.get_latest_block_number()
+        results = await asyncio.gather(*[client.call_readonly_funcs([i[0] for i in chunk], self.from_addr, height) for chunk in chunks],
+                                       return_exceptions=True)
+        for chunk, r in zip(chunks, results):
+            if isinstance(r, BaseException):
+                self._settle(chunk, None, r)
+            else:
+                self._settle(chunk, r, None)
+
+    def __enter__(self):
+        raise TypeError('use `async with` instead')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.execute()
+        else:
+            self.cancel()
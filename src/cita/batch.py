@@ -0,0 +1,323 @@
+"""
+BatchTx 批量交易的编码.
+
+BatchTx 合约 ``multiTxs`` 方法的参数由多个子调用拼接而成, 每个子调用为 (合约地址 + 4字节的长度 + 方法地址和参数).
+"""
+from typing import Sequence, Union, Optional, List, Any, Dict, Tuple, Iterable, Iterator, Deque, TYPE_CHECKING
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+
+from .util import PARAM, DEFAULT_QUOTA, StaticCodec, get_codec, param_to_bytes
+from .util import _UINT, _INT, _ADDRESS, _BOOL
+
+if TYPE_CHECKING:
+    from .sdk import CitaClient, ABI
+
+try:
+    import numpy as np
+except ImportError:  # 没有numpy时, 逐行编码
+    np = None
+
+BATCH_QUOTA = 200000000  # BatchSubmitter默认的每个交易的quota上限, 小于cita默认的账户quota上限268435456
+
+
+def encode_batch_calls(contract_addr: Union[PARAM, Sequence[PARAM], Any], func_addr: PARAM, param_types: str, columns: Sequence[Sequence] = ()) -> bytes:
+    """
+    按列批量编码对同一个合约方法的多次调用, 直接生成 ``multiTxs`` 的参数, 不经过hex字符串.
+
+    结果与 ``make_batch_tx_data([proxy.get_tx_code(func, row) for row in rows])`` 一致.
+
+    如果参数全部是静态基本类型, 所有子调用写入同一块预先分配的缓冲区.
+    如果安装了numpy, 且每一列都是类型匹配的numpy数组 (整数: 不超过64位的整数数组; address: ``S20`` ; bool: ``bool`` ; bytes<N>: 不超过 ``S<N>`` ), 则整列一起编码.
+
+    :param contract_addr: 合约地址. 可以是一个地址, 也可以是每个子调用各自的地址列表, 或 ``S20`` 的numpy数组
+    :param func_addr: 合约方法地址, 4字节
+    :param param_types: 方法的参数类型, 如 ``address,uint256``
+    :param columns: 每个参数一列, 每列的长度等于子调用的个数
+    :return: ``multiTxs`` 方法的bytes参数
+    """
+    selector = param_to_bytes(func_addr)
+    assert len(selector) == 4
+    codec = get_codec(param_types)
+
+    per_row_addr = not isinstance(contract_addr, (str, bytes))
+    if columns:
+        n = len(columns[0])
+        assert all(len(col) == n for col in columns), 'columns must have the same length'
+    elif per_row_addr:
+        n = len(contract_addr)
+    else:
+        raise ValueError('cannot infer the number of calls: no columns and only one contract_addr')
+    if per_row_addr:
+        assert len(contract_addr) == n, 'contract_addr must have the same length as columns'
+
+    static = codec.static
+    if static is None:  # 有动态类型, 逐行编码后拼接
+        addrs = _addr_list(contract_addr, n)
+        data: List[bytes] = []
+        for addr, row in zip(addrs, zip(*_to_lists(columns)) if columns else [()] * n):
+            arg_bytes = codec.encode(row) if row else b''
+            data += [addr, (4 + len(arg_bytes)).to_bytes(4, byteorder='big'), selector, arg_bytes]
+        return b''.join(data)
+
+    arg_size = static.size if columns else 0
+    record_size = 20 + 4 + 4 + arg_size
+    if np is not None:
+        r = _encode_numpy(contract_addr, per_row_addr, selector, static, columns, n, record_size)
+        if r is not None:
+            return r
+
+    buf = bytearray(n * record_size)
+    header = (4 + arg_size).to_bytes(4, byteorder='big') + selector
+    pos = 0
+    rows = zip(*_to_lists(columns)) if columns else [()] * n
+    for addr, row in zip(_addr_list(contract_addr, n), rows):
+        buf[pos:pos + 20] = addr
+        buf[pos + 20:pos + 28] = header
+        if row and not static.encode_into(buf, pos + 28, row):
+            buf[pos + 28:pos + record_size] = codec.encode(row)  # 由eth_abi处理, 非法参数会在这里报错
+        pos += record_size
+    return bytes(buf)
+
+
+def _to_lists(columns: Sequence[Sequence]) -> List[Sequence]:
+    """把numpy数组转为python list, 使其元素是int, bytes等python类型."""
+    return [_column_to_list(col) if np is not None and isinstance(col, np.ndarray) else col for col in columns]
+
+
+def _column_to_list(col) -> List:
+    """tolist()会去掉 ``S<N>`` 元素末尾的\\0, 所以定长bytes按原始宽度补回."""
+    if col.dtype.kind == 'S':
+        return [x.ljust(col.itemsize, b'\0') for x in col.tolist()]
+    return col.tolist()
+
+
+def _addr_list(contract_addr, n: int) -> List[bytes]:
+    """把合约地址展开为每个子调用的20字节地址."""
+    if isinstance(contract_addr, (str, bytes)):
+        addr = param_to_bytes(contract_addr)
+        assert len(addr) == 20, 'bad contract_addr'
+        return [addr] * n
+
+    result = [param_to_bytes(i) for i in _to_lists([contract_addr])[0]]
+    assert all(len(i) == 20 for i in result), 'bad contract_addr'
+    return result
+
+
+def _encode_numpy(contract_addr, per_row_addr: bool, selector: bytes, static: StaticCodec, columns: Sequence[Sequence], n: int, record_size: int) -> Optional[bytes]:
+    """按列编码. 如果有某一列不满足条件, 返回None, 由调用方逐行编码."""
+    records = np.zeros((n, record_size), dtype=np.uint8)
+
+    if per_row_addr:
+        if not (isinstance(contract_addr, np.ndarray) and contract_addr.dtype == np.dtype('S20')):
+            return None
+        records[:, :20] = _byte_matrix(contract_addr, 20)
+    else:
+        addr = param_to_bytes(contract_addr)
+        assert len(addr) == 20, 'bad contract_addr'
+        records[:, :20] = np.frombuffer(addr, dtype=np.uint8)
+    records[:, 20:28] = np.frombuffer((record_size - 24).to_bytes(4, byteorder='big') + selector, dtype=np.uint8)
+
+    for i, ((kind, size), col) in enumerate(zip(static.fields, columns)):
+        if not isinstance(col, np.ndarray) or col.shape != (n,):
+            return None
+        word = records[:, 28 + 32 * i:28 + 32 * (i + 1)]
+        dtype = col.dtype
+        if kind in (_UINT, _INT) and dtype.kind in 'iu' and dtype.itemsize <= 8:
+            if n == 0:
+                continue
+            lo, hi = int(col.min()), int(col.max())
+            if kind == _UINT and (lo < 0 or hi >> size):
+                return None
+            if kind == _INT and not (-(1 << (size - 1)) <= lo and hi < (1 << (size - 1))):
+                return None
+            word[:, 24:] = _byte_matrix(col.astype('>i8' if dtype.kind == 'i' else '>u8'), 8)
+            if dtype.kind == 'i':  # 负数需要符号扩展
+                word[:, :24] = np.where(col < 0, 0xff, 0).astype(np.uint8)[:, None]
+        elif kind == _ADDRESS and dtype == np.dtype('S20'):
+            word[:, 12:] = _byte_matrix(col, 20)
+        elif kind == _BOOL and dtype.kind == 'b':
+            word[:, 31] = col
+        elif kind not in (_UINT, _INT, _ADDRESS, _BOOL) and dtype.kind == 'S' and dtype.itemsize <= size:
+            word[:, :dtype.itemsize] = _byte_matrix(col, dtype.itemsize)
+        else:
+            return None
+    return records.tobytes()
+
+
+def _byte_matrix(col, width: int):
+    """把定长元素的numpy数组看作 (n, width) 的uint8矩阵."""
+    return np.ascontiguousarray(col).view(np.uint8).reshape(len(col), width)
+
+
+@dataclass
+class BatchChunk:
+    tx_hash: str  # BatchTx交易的hash
+    indices: range  # 包含的子调用在输入中的序号
+    quota: int  # 交易的调用配额
+    size: int  # multiTxs参数的字节数
+
+
+class BatchSubmitError(RuntimeError):
+    """
+    BatchSubmitter发送交易失败.
+
+    出错后不再发送新的交易. 出错时已经发出的交易都会等待其结果, 已经上链的交易在submitted中, 调用方需要据此对账.
+    """
+
+    def __init__(self, message: str, submitted: List[BatchChunk], failed: List[BatchChunk]):
+        """
+        初始化.
+
+        :param message: 错误信息
+        :param submitted: 已经发送成功, 但还没有返回给调用方的BatchChunk
+        :param failed: 发送失败的BatchChunk, tx_hash为空字符串
+        """
+        super().__init__(message)
+        self.submitted = submitted
+        self.failed = failed
+
+
+class BatchSubmitter:
+    """
+    把任意多个tx_code自动拆分成多个BatchTx交易并发送.
+
+    每个BatchTx交易的 ``multiTxs`` 参数不超过max_bytes字节, 子调用的quota之和不超过max_quota.
+    子调用的quota来自register注册的ABI.quota, 或者与tx_code一起传入. 发送是流水线式的, 不等待回执.
+    ABI.quota默认是DEFAULT_QUOTA, 它是单个交易的上限而不是子调用的实际消耗, 需要在ContractClass的func_name2quota中指定才会被注册.
+    """
+
+    def __init__(self, client: 'CitaClient', private_key: PARAM, max_bytes: int = 32 * 1024, max_quota: int = BATCH_QUOTA, default_quota: int = 100000, max_in_flight: int = 4):
+        """
+        初始化.
+
+        :param client: CitaClient
+        :param private_key: 发送交易的私钥
+        :param max_bytes: 每个BatchTx交易中 ``multiTxs`` 参数的字节数上限
+        :param max_quota: 每个BatchTx交易的quota上限
+        :param default_quota: 没有注册quota的子调用所使用的quota
+        :param max_in_flight: 同时在发送中的交易数
+        """
+        self.client = client
+        self.private_key = private_key
+        self.max_bytes = max_bytes
+        self.max_quota = max_quota
+        self.default_quota = default_quota
+        self.max_in_flight = max_in_flight
+        self.func_quota: Dict[Tuple[bytes, bytes], int] = {}  # (合约地址, 方法地址) -> quota
+        self.abandoned: List[BatchChunk] = []  # 上次submit提前停止时, 已经发送但没有返回给调用方的BatchChunk
+        self.selector_quota: Dict[bytes, int] = {}  # 方法地址 -> quota
+
+    def register(self, func_mapping: Dict[str, 'ABI'], contract_addr: Optional[PARAM] = None):
+        """
+        注册合约方法的quota. quota仍是默认值DEFAULT_QUOTA的方法不注册, 使用default_quota.
+
+        :param func_mapping: ContractClass.func_mapping 或 ContractProxy.func_mapping__
+        :param contract_addr: 合约地址. 如果指定, 只对这个合约生效; 否则对所有合约的同名方法生效
+        """
+        for abi in func_mapping.values():
+            if not abi.func_name or abi.quota == DEFAULT_QUOTA:  # 构造函数, 或没有指定quota
+                continue
+            selector = param_to_bytes(abi.func_addr)
+            if contract_addr is None:
+                self.selector_quota[selector] = abi.quota
+            else:
+                self.func_quota[(param_to_bytes(contract_addr), selector)] = abi.quota
+
+    def get_quota(self, tx_code: bytes) -> int:
+        """
+        查找子调用的quota.
+
+        :param tx_code: 子调用, (合约地址 + 方法地址 + 编码后的参数)
+        :return: quota
+        """
+        head, selector = tx_code[:20], tx_code[20:24]
+        quota = self.func_quota.get((head, selector))
+        if quota is None:
+            quota = self.selector_quota.get(selector, self.default_quota)
+        return quota
+
+    def submit(self, tx_codes: Iterable[Union[PARAM, Tuple[PARAM, int]]]) -> Iterator[BatchChunk]:
+        """
+        拆分并发送子调用.
+
+        单个子调用超过max_bytes或max_quota时, 单独作为一个交易发送.
+        某个交易发送失败时, 不再发送新的交易, 等待其他已经发出的交易后抛出BatchSubmitError.
+        调用方提前停止遍历时, 已经发出但没有返回的交易记录在 ``abandoned`` 中.
+
+        :param tx_codes: 由ContractProxy.get_tx_code生成的tx_code, 或者 (tx_code, quota)
+        :return: 按输入顺序返回每个BatchTx交易的BatchChunk
+        :raises BatchSubmitError: 有交易发送失败
+        """
+        self.abandoned = []
+        executor = ThreadPoolExecutor(self.max_in_flight)
+        pending: Deque[Tuple[Future, BatchChunk]] = deque()
+
+        def send(parts: List[bytes], start: int, end: int, quota: int, size: int) -> Iterator[BatchChunk]:
+            if any(future.done() and future.exception() is not None for future, _ in pending):
+                self._fail(pending)
+            future = executor.submit(self.client.batch_call_func_raw, self.private_key, b''.join(parts), quota)
+            pending.append((future, BatchChunk('', range(start, end), quota, size)))
+            while len(pending) >= self.max_in_flight:
+                yield self._finish(pending)
+
+        try:
+            parts: List[bytes] = []
+            start = size = quota = 0
+            index = 0
+            for index, item in enumerate(tx_codes):
+                if isinstance(item, tuple):
+                    c, sub_quota = param_to_bytes(item[0]), item[1]
+                else:
+                    c = param_to_bytes(item)
+                    sub_quota = self.get_quota(c)
+                assert len(c) >= 24, 'bad tx_code'
+                sub_size = len(c) + 4
+
+                if parts and (size + sub_size > self.max_bytes or quota + sub_quota > self.max_quota):
+                    yield from send(parts, start, index, quota, size)
+                    parts, start, size, quota = [], index, 0, 0
+
+                parts += [c[:20], (len(c) - 20).to_bytes(4, byteorder='big'), c[20:]]
+                size += sub_size
+                quota += sub_quota
+
+            if parts:
+                yield from send(parts, start, index + 1, quota, size)
+            while pending:
+                yield self._finish(pending)
+        finally:
+            if pending:  # 调用方提前停止, 或读取tx_codes出错
+                self.abandoned, _ = self._drain(pending)
+            executor.shutdown()
+
+    def _finish(self, pending: Deque[Tuple[Future, BatchChunk]]) -> BatchChunk:
+        future, chunk = pending[0]
+        if future.exception() is not None:
+            self._fail(pending)
+        pending.popleft()
+        chunk.tx_hash = future.result()
+        return chunk
+
+    def _fail(self, pending: Deque[Tuple[Future, BatchChunk]]):
+        """等待所有已经发出的交易, 抛出BatchSubmitError."""
+        submitted, failed = self._drain(pending)
+        error = failed[0][0]
+        raise BatchSubmitError(f'failed to send {len(failed)} batch transactions: {error!r}',
+                               submitted, [chunk for _, chunk in failed]) from error
+
+    @staticmethod
+    def _drain(pending: Deque[Tuple[Future, BatchChunk]]) -> Tuple[List[BatchChunk], List[Tuple[BaseException, BatchChunk]]]:
+        """等待并取出所有已经发出的交易, 返回发送成功的BatchChunk, 以及发送失败的 (异常, BatchChunk)."""
+        submitted: List[BatchChunk] = []
+        failed: List[Tuple[BaseException, BatchChunk]] = []
+        while pending:
+            future, chunk = pending.popleft()
+            error = future.exception()
+            if error is None:
+                chunk.tx_hash = future.result()
+                submitted.append(chunk)
+            else:
+                failed.append((error, chunk))
+        return submitted, failed
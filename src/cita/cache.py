@@ -0,0 +1,251 @@
+"""
+只读调用和不可变数据的缓存.
+"""
+from typing import Dict, List, Tuple, Optional, Iterable, Any
+from collections import OrderedDict
+import threading
+import sqlite3
+
+from .tracker import BlockHeightTracker
+from .jsoncodec import get_json_codec
+
+CALL_KEY = Tuple[str, str, str, int]  # (合约地址, calldata, 调用者地址, 区块高度)
+
+
+class CallCache:
+    """
+    合约只读调用的LRU缓存.
+
+    只读调用的结果只会随区块变化, 所以按 (合约地址, calldata, 调用者地址, 区块高度) 缓存.
+    不指定高度时, 使用tracker缓存的最新区块高度发起调用, 最新区块变化后, 旧高度上的这类结果被清除;
+    指定高度的结果不会过期, 只会被LRU淘汰.
+    tracker的ttl决定了结果最多落后多久, 也可以与client共用一个tracker.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 1.0, tracker: Optional[BlockHeightTracker] = None):
+        """
+        初始化.
+
+        :param maxsize: 最多缓存多少个结果
+        :param ttl: 没有指定tracker时, 新建tracker的有效期, 单位秒
+        :param tracker: 最新区块高度的缓存
+        """
+        self.maxsize = maxsize
+        self.tracker = tracker if tracker is not None else BlockHeightTracker(ttl)
+        self.head = -1  # 最新区块高度
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[CALL_KEY, bytes]' = OrderedDict()
+        self._head_keys: List[CALL_KEY] = []  # 在最新区块上缓存的key, 最新区块变化后清除
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(req: Dict[str, str], height: int) -> CALL_KEY:
+        """
+        生成缓存的key.
+
+        :param req: make_call_request生成的CallRequest
+        :param height: 区块高度
+        :return: key
+        """
+        return req['to'].lower(), req['data'].lower(), req.get('from', '').lower(), height
+
+    def advance(self, head: int):
+        """
+        记录最新区块高度. 高度增长时, 清除在旧的最新区块上缓存的结果.
+
+        :param head: 最新区块高度
+        """
+        with self._lock:
+            if head <= self.head:
+                return
+            self.head = head
+            for key in self._head_keys:
+                self._entries.pop(key, None)
+            self._head_keys = []
+
+    def get(self, key: CALL_KEY) -> Optional[bytes]:
+        """
+        查找缓存, 并计入命中率统计.
+
+        :param key: make_key生成的key
+        :return: 缓存的结果, 没有缓存时返回None
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: CALL_KEY, value: bytes, pinned: bool = False):
+        """
+        缓存结果.
+
+        :param key: make_key生成的key
+        :param value: 调用结果
+        :param pinned: 是否为指定高度的调用. False时, 结果在最新区块变化后清除
+        """
+        with self._lock:
+            if not pinned:
+                if key[3] != self.head:  # 最新区块已经变化
+                    return
+                self._head_keys.append(key)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清除所有缓存和统计."""
+        with self._lock:
+            self._entries.clear()
+            self._head_keys = []
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        """命中率统计."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+
+class DataCacheBase:
+    """
+    不可变数据缓存的接口定义.
+
+    CitaClient用它缓存不会再变化的查询结果: 已出块的区块, 已上链的交易和合约代码.
+    key是字符串, value是JSON RPC返回的可以json序列化的结果. 可以替换为自定义的实现, 比如使用redis.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        查找缓存.
+
+        :param key: 缓存的key, 如 ``block:100:0``
+        :return: 缓存的结果, 没有缓存时返回None
+        """
+        raise NotImplementedError('virtual method')
+
+    def put(self, key: str, value: Any):
+        """
+        缓存结果.
+
+        :param key: 缓存的key
+        :param value: 可以json序列化的结果
+        """
+        raise NotImplementedError('virtual method')
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        """
+        缓存多个结果.
+
+        :param items: [(key, value), ...]
+        """
+        for key, value in items:
+            self.put(key, value)
+
+    def close(self):
+        """释放缓存持有的资源, 比如文件."""
+        pass
+
+
+class DataCache(DataCacheBase):
+    """
+    两级的不可变数据缓存.
+
+    内存中是按字节数限制大小的LRU, 保存json序列化后的结果, 每次读取都返回新的对象, 调用方修改结果不会影响缓存.
+    指定path时, 还会把所有结果写入sqlite文件, 内存中淘汰的结果以及进程重启之后都可以从文件中读取.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: Optional[str] = None):
+        """
+        初始化.
+
+        :param max_bytes: 内存中缓存的字节数上限
+        :param path: sqlite文件的路径. None表示只使用内存
+        """
+        self.max_bytes = max_bytes
+        self.size = 0  # 内存中缓存的字节数
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._json = get_json_codec()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')  # 缓存丢失只会导致重新查询, 不需要每次fsync
+            self._db.execute('CREATE TABLE IF NOT EXISTS data (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+            self._db.commit()
+
+    def _remember(self, key: str, data: bytes):
+        """加入内存中的LRU. 调用方持有锁."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(key) + len(old)
+        if len(key) + len(data) > self.max_bytes:
+            return
+        self._entries[key] = data
+        self.size += len(key) + len(data)
+        while self.size > self.max_bytes:
+            k, v = self._entries.popitem(last=False)
+            self.size -= len(k) + len(v)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute('SELECT value FROM data WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    data = bytes(row[0])
+                    self._remember(key, data)
+            if data is None:
+                self.misses += 1
+                return None
+        return self._json.loads(data)
+
+    def put(self, key: str, value: Any):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        dumps = self._json.dumps
+        rows = [(key, dumps(value)) for key, value in items]
+        with self._lock:
+            for key, data in rows:
+                self._remember(key, data)
+            if self._db is not None and rows:
+                self._db.executemany('INSERT OR REPLACE INTO data (key, value) VALUES (?, ?)', rows)
+                self._db.commit()
+
+    def clear(self):
+        """清除所有缓存和统计, 包括sqlite文件中的结果."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = self.disk_hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM data')
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict:
+        """命中率统计. hits是内存中的命中, disk_hits是sqlite文件中的命中."""
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {'size': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'disk_hits': self.disk_hits,
+                    'misses': self.misses, 'hit_rate': (self.hits + self.disk_hits) / total if total else 0.0}
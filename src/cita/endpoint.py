@@ -0,0 +1,158 @@
+"""
+多节点的选择.
+
+client可以连接多个节点. 读请求发给负载最低, 延迟最小的健康节点; 连续失败的节点被暂时摘除, 过一段时间后重新尝试.
+"""
+from typing import List, Dict, Sequence, Optional
+from collections import deque
+import threading
+import time
+
+WRITE_METHODS = frozenset(['sendRawTransaction'])  # 会改变链上状态的JSON RPC方法
+# 幂等的只读方法, 可以同时发给多个节点. 过滤器保存在节点本地, 不在其中
+IDEMPOTENT_METHODS = frozenset(['peerCount', 'peersInfo', 'blockNumber', 'getBlockByHash', 'getBlockByNumber', 'getMetaData',
+                                'getTransactionReceipt', 'call', 'getCode', 'getAbi', 'getTransaction', 'getTransactionCount',
+                                'getBalance', 'getTransactionProof', 'getBlockHeader', 'getStateProof', 'getStorageAt',
+                                'getVersion', 'estimateQuota', 'getLogs'])
+WRITE_POLICIES = ('pinned', 'balanced', 'broadcast')
+
+
+class Node:
+    """一个节点的统计信息."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = 0.0  # 响应时间的指数加权平均, 单位秒. 0表示还没有统计
+        self.in_flight = 0  # 正在处理的请求数
+        self.failures = 0  # 连续失败的次数
+        self.ejected_until = 0.0  # 摘除到什么时刻
+
+    def __repr__(self):
+        return f'Node({self.url!r}, latency={self.latency:.3f}, in_flight={self.in_flight}, failures={self.failures})'
+
+
+class NodePool:
+    """
+    按健康状况选择节点.
+
+    节点的得分为 ``延迟 * (正在处理的请求数 + 1)`` , 读请求按得分从低到高依次尝试.
+    写请求 (发送交易) 的策略:
+
+    - ``pinned`` : 按url列表的顺序, 总是发给第一个健康节点.
+    - ``balanced`` : 与读请求相同.
+    - ``broadcast`` : 同时发给所有健康节点, 使用最先成功的结果. 同一个交易在各节点上的hash相同.
+
+    指定hedge_percentile后, 幂等的只读请求如果在最近响应时间的该分位数内没有返回, 会再发给下一个节点, 使用先返回的结果.
+    """
+
+    def __init__(self, urls: Sequence[str], write_policy: str = 'pinned', alpha: float = 0.2, max_failures: int = 3, eject_time: float = 10.0,
+                 hedge_percentile: Optional[float] = None, hedge_window: int = 256, hedge_min_samples: int = 20):
+        """
+        初始化.
+
+        :param urls: 节点的url列表
+        :param write_policy: 写请求的策略, ``pinned`` , ``balanced`` 或 ``broadcast``
+        :param alpha: 更新延迟时, 指数加权平均的权重
+        :param max_failures: 连续失败多少次后摘除节点
+        :param eject_time: 摘除节点的时间, 单位秒. 之后节点重新参与选择, 再次失败则重新摘除
+        :param hedge_percentile: 发出对冲请求的响应时间分位数, 如0.95. None表示不发对冲请求
+        :param hedge_window: 统计响应时间分位数时, 使用最近多少个请求
+        :param hedge_min_samples: 响应时间的样本少于这个数量时, 不发对冲请求
+        """
+        assert len(urls) > 0, 'at least one url is required'
+        if write_policy not in WRITE_POLICIES:
+            raise ValueError(f'write_policy must be one of {WRITE_POLICIES}')
+        self.nodes = [Node(url) for url in urls]
+        self.write_policy = write_policy
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        assert hedge_percentile is None or 0 < hedge_percentile < 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._samples: deque = deque(maxlen=hedge_window)  # 最近请求的响应时间
+        self._lock = threading.Lock()
+
+    def healthy(self) -> List[Node]:
+        """没有被摘除的节点, 按url列表的顺序."""
+        now = time.monotonic()
+        with self._lock:
+            return [i for i in self.nodes if i.ejected_until <= now]
+
+    def candidates(self, write: bool = False) -> List[Node]:
+        """
+        按优先级排列的节点. 被摘除的节点排在最后, 作为所有健康节点都失败时的最后尝试.
+
+        :param write: 是否为写请求
+        :return: 节点列表
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = [i for i in self.nodes if i.ejected_until <= now]
+            ejected = sorted((i for i in self.nodes if i.ejected_until > now), key=lambda i: i.ejected_until)
+            if not (write and self.write_policy == 'pinned'):
+                healthy.sort(key=lambda i: i.latency * (i.in_flight + 1))
+        return healthy + ejected
+
+    def begin(self, node: Node) -> float:
+        """
+        开始向节点发送请求.
+
+        :param node: 节点
+        :return: 开始时刻, 交给end计算延迟
+        """
+        with self._lock:
+            node.in_flight += 1
+        return time.monotonic()
+
+    def end(self, node: Node, t0: float, ok: bool):
+        """
+        请求结束, 更新节点的统计信息.
+
+        :param node: 节点
+        :param t0: begin返回的开始时刻
+        :param ok: 请求是否成功. 连接失败, 超时和HTTP 5xx都算失败
+        """
+        now = time.monotonic()
+        with self._lock:
+            node.in_flight -= 1
+            if ok:
+                elapsed = now - t0
+                self._samples.append(elapsed)
+                node.latency = elapsed if node.latency == 0 else node.latency + self.alpha * (elapsed - node.latency)
+                node.failures = 0
+                node.ejected_until = 0.0
+            else:
+                node.failures += 1
+                if node.failures >= self.max_failures:
+                    node.ejected_until = now + self.eject_time
+
+    def cancel(self, node: Node):
+        """
+        放弃请求, 比如对冲请求中较慢的一个. 不计入节点的统计信息.
+
+        :param node: 节点
+        """
+        with self._lock:
+            node.in_flight -= 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        发出对冲请求之前等待的时间.
+
+        :return: 最近响应时间的hedge_percentile分位数, 单位秒. 不需要对冲时返回None
+        """
+        if self.hedge_percentile is None or len(self.nodes) < 2:
+            return None
+        with self._lock:
+            if len(self._samples) < self.hedge_min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile))]
+
+    def stats(self) -> List[Dict]:
+        """各节点的统计信息."""
+        now = time.monotonic()
+        with self._lock:
+            return [{'url': i.url, 'latency': i.latency, 'in_flight': i.in_flight, 'failures': i.failures,
+                     'ejected': i.ejected_until > now} for i in self.nodes]
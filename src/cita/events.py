@@ -0,0 +1,452 @@
+"""
+合约事件的解码与订阅.
+"""
+from typing import Dict, List, Tuple, Optional, Union, Any, Iterable, Iterator, AsyncIterator, Callable, Mapping, TYPE_CHECKING
+from dataclasses import dataclass, field
+import asyncio
+import json
+import time
+
+import sha3  # type: ignore
+from eth_abi.exceptions import DecodingError
+
+from .util import PARAM, ABICodec, param_to_bytes, param_to_str, get_codec
+
+if TYPE_CHECKING:
+    from .sdk import CitaClient
+    from .async_sdk import AsyncCitaClient
+
+# 参数值不是直接放在topic中的类型. 作为indexed参数时, topic是值的keccak256 hash
+_HASHED_TYPES = ('string', 'bytes')
+
+
+@dataclass
+class Event:
+    name: str  # 事件名
+    args: Mapping[str, Any]  # 参数名 -> 解码后的值. indexed的string, bytes, 数组参数是值的hash
+    address: str  # 合约地址
+    block_number: int  # 区块高度
+    tx_hash: str  # 交易hash
+    log_index: int  # 在区块中的序号
+    log: Dict = field(repr=False)  # 原始的log
+
+
+@dataclass
+class EventABI:
+    name: str  # 事件名
+    topic: str  # 事件签名的keccak256 hash, 即topics[0], '0x'开头
+    inputs: List[Tuple[str, str, bool]]  # [(参数名, 类型, 是否indexed), ...]
+    anonymous: bool = False  # 匿名事件没有topics[0]
+    data_codec: ABICodec = field(init=False, repr=False, compare=False)  # 非indexed参数的解码器
+    topic_codecs: List[Optional[ABICodec]] = field(init=False, repr=False, compare=False)  # indexed参数的解码器. None表示topic是hash
+    fields: Dict[str, Tuple[bool, int]] = field(init=False, repr=False, compare=False)  # 参数名 -> (是否indexed, 在topics或data中的位置)
+
+    def __post_init__(self):
+        self.data_codec = get_codec(','.join(t for _, t, indexed in self.inputs if not indexed))
+        self.topic_codecs = [None if t in _HASHED_TYPES or t.endswith(']') else get_codec(t) for _, t, indexed in self.inputs if indexed]
+        self.fields = {}
+        counts = [0, 0]  # 非indexed, indexed
+        for i, (name, _, indexed) in enumerate(self.inputs):
+            self.fields[name or f'arg{i}'] = (indexed, counts[indexed])
+            counts[indexed] += 1
+
+    def _topics(self, log: Dict) -> List[str]:
+        """indexed参数的topic, 个数与ABI不符时抛出ValueError."""
+        topics = log['topics'] if self.anonymous else log['topics'][1:]
+        if len(topics) != len(self.topic_codecs):
+            raise ValueError(f'log does not match event `{self.name}`: {len(topics)} indexed values')
+        return topics
+
+    def _decode_topic(self, i: int, topic: str) -> Any:
+        codec = self.topic_codecs[i]
+        return codec.decode(param_to_bytes(topic)) if codec is not None else param_to_bytes(topic)
+
+    def _decode_data(self, data: str) -> Tuple:
+        values = self.data_codec.decode(param_to_bytes(data))
+        return (values,) if len(self.inputs) - len(self.topic_codecs) == 1 else values
+
+    def decode(self, log: Dict, lazy: bool = False) -> Event:
+        """
+        解码一条log.
+
+        :param log: getLogs或getFilterChanges返回的log
+        :param lazy: True 只检查indexed参数的个数, 参数在第一次访问时才解码
+        :return: Event
+        """
+        topics = self._topics(log)
+        args: Mapping[str, Any]
+        if lazy:
+            args = EventArgs(self, topics, log['data'])
+        else:
+            topic_values = [self._decode_topic(i, t) for i, t in enumerate(topics)]
+            data_values = self._decode_data(log['data'])
+            args = {name: topic_values[pos] if indexed else data_values[pos] for name, (indexed, pos) in self.fields.items()}
+        return Event(self.name, args, log['address'], int(log['blockNumber'], 16), log['transactionHash'], int(log['logIndex'], 16), log)
+
+
+class EventArgs(Mapping):
+    """
+    延迟解码的事件参数. 访问indexed参数时只解码对应的topic, 第一次访问非indexed参数时解码整个data.
+
+    解码结果会被缓存. data与ABI不符时, 访问参数会抛出eth_abi的DecodingError.
+    """
+
+    __slots__ = ('_event', '_topics', '_data', '_values')
+
+    def __init__(self, event: EventABI, topics: List[str], data: str):
+        self._event = event
+        self._topics = topics
+        self._data: Union[str, Tuple] = data
+        self._values: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        indexed, pos = self._event.fields[name]
+        if indexed:
+            value = self._event._decode_topic(pos, self._topics[pos])
+        else:
+            if isinstance(self._data, str):
+                self._data = self._event._decode_data(self._data)
+            value = self._data[pos]
+        self._values[name] = value
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._event.fields)
+
+    def __len__(self) -> int:
+        return len(self._event.fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def parse_events(abi: Union[str, List[Dict]]) -> Dict[str, EventABI]:
+    """
+    从合约的ABI中提取事件.
+
+    :param abi: ABI的json字符串, 或解析后的列表
+    :return: 事件名和topic -> EventABI. 重载的事件只有第一个可以通过名字找到
+    """
+    result: Dict[str, EventABI] = {}
+    for item in json.loads(abi) if isinstance(abi, str) else abi:
+        if item['type'] != 'event':
+            continue
+        inputs = [(i.get('name', ''), i['type'], i.get('indexed', False)) for i in item['inputs']]
+        sig = f'{item["name"]}({",".join(t for _, t, _ in inputs)})'
+        event = EventABI(item['name'], '0x' + sha3.keccak_256(sig.encode()).hexdigest(), inputs, item.get('anonymous', False))
+        result.setdefault(event.name, event)
+        result[event.topic] = event
+    return result
+
+
+class EventDecoder:
+    """按topics[0]选择事件并解码log. 匿名事件无法通过topic识别, 不会被加入."""
+
+    def __init__(self, events: Iterable[EventABI] = ()):
+        """
+        初始化.
+
+        :param events: 事件列表, 比如 ``ContractClass.events.values()``
+        """
+        self.events: Dict[str, EventABI] = {}
+        for event in events:
+            self.add(event)
+
+    def add(self, event: EventABI):
+        """
+        加入一个事件.
+
+        :param event: EventABI
+        """
+        if not event.anonymous:
+            self.events[event.topic] = event
+
+    def decode(self, log: Dict) -> Optional[Event]:
+        """
+        解码一条log.
+
+        :param log: getLogs或getFilterChanges返回的log
+        :return: Event. 不认识的log返回None
+        """
+        if not log['topics']:
+            return None
+        event = self.events.get(log['topics'][0].lower())
+        if event is None:
+            return None
+        try:
+            return event.decode(log)
+        except (ValueError, DecodingError):  # 签名相同但indexed不同的事件, 比如ERC20和ERC721的Transfer
+            return None
+
+    __call__ = decode
+
+
+class EventRegistry(EventDecoder):
+    """
+    (合约地址, topics[0]) -> 事件的注册表, 一次hash查找即可找到log对应的事件.
+
+    同一个topic在不同合约中可以对应不同的ABI (比如ERC20和ERC721的Transfer). 没有为log的合约地址注册时,
+    再查找不限合约地址注册的事件. 默认延迟解码, 返回的Event.args是EventArgs, 只有访问的参数才会被解码.
+
+    ContractClass.bind 会把合约地址和合约的事件注册到全局的 ``event_registry`` 中.
+    """
+
+    def __init__(self, lazy: bool = True):
+        """
+        初始化.
+
+        :param lazy: True 延迟解码事件参数, 见EventArgs
+        """
+        super().__init__()
+        self.lazy = lazy
+        self.contract_events: Dict[Tuple[str, str], EventABI] = {}
+
+    def register(self, address: Optional[PARAM], events: Iterable[EventABI]):
+        """
+        注册一个合约的事件. 重复注册时覆盖.
+
+        :param address: 合约地址. None表示不限合约地址
+        :param events: 事件列表, 比如 ``ContractClass.events.values()``
+        """
+        if address is None:
+            for event in events:
+                self.add(event)
+            return
+        address = param_to_str(address).lower()
+        for event in events:
+            if not event.anonymous:
+                self.contract_events[(address, event.topic)] = event
+
+    def unregister(self, address: PARAM):
+        """
+        删除一个合约的全部事件.
+
+        :param address: 合约地址
+        """
+        address = param_to_str(address).lower()
+        for key in [key for key in self.contract_events if key[0] == address]:
+            del self.contract_events[key]
+
+    def decode(self, log: Dict) -> Optional[Event]:
+        """
+        解码一条log.
+
+        :param log: getLogs, getFilterChanges或回执中的log
+        :return: Event. 没有注册的log返回None
+        """
+        if not log['topics']:
+            return None
+        topic = log['topics'][0].lower()
+        event = self.contract_events.get((log['address'].lower(), topic))
+        if event is None:
+            event = self.events.get(topic)
+            if event is None:
+                return None
+        try:
+            return event.decode(log, self.lazy)
+        except (ValueError, DecodingError):
+            return None
+
+    __call__ = decode
+
+    def decode_logs(self, logs: Iterable[Dict]) -> List[Event]:
+        """
+        解码多条log, 丢弃没有注册的log.
+
+        :param logs: log的列表
+        :return: Event的列表, 顺序与logs相同
+        """
+        decode = self.decode
+        return [event for event in map(decode, logs) if event is not None]
+
+    def decode_receipt(self, receipt: Dict) -> List[Event]:
+        """
+        解码回执中的全部log.
+
+        :param receipt: getTransactionReceipt返回的回执
+        :return: Event的列表
+        """
+        return self.decode_logs(receipt.get('logs') or ())
+
+
+# ContractClass.bind 注册的全局事件表
+event_registry = EventRegistry()
+
+
+def make_log_filter(address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                    from_block: Union[None, int, str] = None, to_block: Union[None, int, str] = None) -> Dict:
+    """
+    生成 ``getLogs`` 和 ``newFilter`` 的过滤条件.
+
+    :param address: 合约地址, 或合约地址的列表. None表示所有合约
+    :param topics: 每个位置的topic, 可以是None (任意), 一个topic, 或topic的列表 (任意一个)
+    :param from_block: 起始区块高度, 或 ``latest`` , ``earliest`` . None表示 ``latest``
+    :param to_block: 结束区块高度 (包含), 或 ``latest`` . None表示 ``latest``
+    :return: 过滤条件
+    """
+    def block(b):
+        return b if isinstance(b, str) else '0x%02x' % b
+
+    result: Dict[str, Any] = {}
+    if from_block is not None:
+        result['fromBlock'] = block(from_block)
+    if to_block is not None:
+        result['toBlock'] = block(to_block)
+    if address is not None:
+        result['address'] = [param_to_str(i) for i in address] if isinstance(address, list) else param_to_str(address)
+    if topics is not None:
+        result['topics'] = [i if i is None else [param_to_str(j) for j in i] if isinstance(i, list) else param_to_str(i) for i in topics]
+    return result
+
+
+def _log_position(log: Dict) -> Tuple[int, int]:
+    return int(log['blockNumber'], 16), int(log['logIndex'], 16)
+
+
+class LogPoller:
+    """
+    通过过滤器持续获取新的log.
+
+    过滤器保存在节点本地, 所以同一个过滤器的请求总是发给创建它的节点.
+    过滤器失效 (比如长时间没有查询被节点清除, 或节点不可用) 时, 重新创建过滤器, 并用getLogs补上中间的log.
+    按 (区块高度, log序号) 去重, 每条log只返回一次.
+    """
+
+    def __init__(self, client: Union['CitaClient', 'AsyncCitaClient'], address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                 decoder: Optional[Callable[[Dict], Any]] = None, poll_interval: Optional[float] = None):
+        """
+        初始化.
+
+        :param client: CitaClient, AsyncLogPoller使用AsyncCitaClient
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同make_log_filter
+        :param decoder: 解码log的函数, 比如EventDecoder. 解码结果为None的log会被丢弃. None表示返回原始log
+        :param poll_interval: 轮询间隔, 单位秒. None表示由client.poll_scheduler根据出块间隔安排
+        """
+        self.client = client
+        self.address = address
+        self.topics = topics
+        self.decoder = decoder
+        self.poll_interval = poll_interval
+        self.filter_id: Optional[str] = None
+        self._installed_at = -1  # 创建过滤器时的最新区块高度
+        self._last: Tuple[int, int] = (-1, -1)  # 已经返回的最后一条log的位置
+        self._closed = False
+
+    def _accept(self, logs: List[Dict]) -> List:
+        """去重, 解码."""
+        result = []
+        for log in sorted(logs, key=_log_position):
+            position = _log_position(log)
+            if position <= self._last:
+                continue
+            self._last = position
+            item = self.decoder(log) if self.decoder is not None else log
+            if item is not None:
+                result.append(item)
+        return result
+
+    def poll(self) -> List:
+        """
+        查询一次新的log.
+
+        :return: 新的log, 或解码后的事件
+        """
+        client: 'CitaClient' = self.client  # type: ignore
+        if self.filter_id is None:
+            self._install()
+            return []
+        try:
+            logs = client.get_filter_changes(self.filter_id)
+        except Exception:
+            from_block = max(self._last[0], self._installed_at)
+            self._install()
+            logs = client.get_logs(self.address, self.topics, from_block, 'latest')
+        return self._accept(logs)
+
+    def _install(self):
+        self._installed_at = self.client.get_latest_block_number()
+        self.filter_id = self.client.new_filter(self.address, self.topics)
+
+    def __iter__(self) -> Iterator[List]:
+        """每轮轮询返回一批新的log, 直到close. 没有新log的轮次不返回."""
+        client: 'CitaClient' = self.client  # type: ignore
+        while not self._closed:
+            batch = self.poll()
+            if batch:
+                yield batch
+            if self.poll_interval is not None:
+                time.sleep(self.poll_interval)
+            else:
+                time.sleep(client.poll_scheduler.next_delay(client.get_block_interval))
+
+    def close(self):
+        """停止轮询, 删除节点上的过滤器."""
+        self._closed = True
+        filter_id, self.filter_id = self.filter_id, None
+        if filter_id is not None:
+            try:
+                self.client.uninstall_filter(filter_id)
+            except Exception:  # 过滤器可能已经失效
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncLogPoller(LogPoller):
+    """LogPoller的asyncio版本. 使用 ``async for`` 遍历, 用 ``await poller.close()`` 停止."""
+
+    async def poll(self) -> List:  # type: ignore
+        client: 'AsyncCitaClient' = self.client  # type: ignore
+        if self.filter_id is None:
+            await self._install()
+            return []
+        try:
+            logs = await client.get_filter_changes(self.filter_id)
+        except Exception:
+            from_block = max(self._last[0], self._installed_at)
+            await self._install()
+            logs = await client.get_logs(self.address, self.topics, from_block, 'latest')
+        return self._accept(logs)
+
+    async def _install(self):  # type: ignore
+        client: 'AsyncCitaClient' = self.client  # type: ignore
+        self._installed_at = await client.get_latest_block_number()
+        self.filter_id = await client.new_filter(self.address, self.topics)
+
+    def __iter__(self):
+        raise TypeError('use `async for` instead')
+
+    async def __aiter__(self) -> AsyncIterator[List]:
+        client: 'AsyncCitaClient' = self.client  # type: ignore
+        while not self._closed:
+            batch = await self.poll()
+            if batch:
+                yield batch
+            await asyncio.sleep(self.poll_interval if self.poll_interval is not None else await client._poll_delay())
+
+    async def close(self):  # type: ignore
+        self._closed = True
+        filter_id, self.filter_id = self.filter_id, None
+        if filter_id is not None:
+            try:
+                await self.client.uninstall_filter(filter_id)  # type: ignore
+            except Exception:
+                pass
+
+    def __enter__(self):
+        raise TypeError('use `async with` instead')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
@@ -0,0 +1,207 @@
+"""
+按顺序跟踪已确认的区块.
+"""
+from typing import Dict, List, Optional, Union, Callable, Iterator, AsyncIterator, TYPE_CHECKING
+import asyncio
+import inspect
+import os
+import time
+
+if TYPE_CHECKING:
+    from .sdk import CitaClient
+    from .async_sdk import AsyncCitaClient
+
+
+class FileCursor:
+    """保存在文件中的跟踪进度. 写入时先写临时文件再替换, 中断时不会留下不完整的文件."""
+
+    def __init__(self, path: str):
+        """
+        初始化.
+
+        :param path: 文件路径
+        """
+        self.path = path
+
+    def load(self) -> Optional[int]:
+        """
+        读取进度.
+
+        :return: 已经处理完的区块高度. 文件不存在时返回None
+        """
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def save(self, height: int):
+        """
+        保存进度.
+
+        :param height: 已经处理完的区块高度
+        """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(height))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class ChainFollower:
+    """
+    按高度顺序返回已确认的区块, 追上最新区块后继续等待新区块.
+
+    cita的区块h在区块h+1出块后才确定交易结果 (见confirm_transaction), 所以只返回高度不超过 ``最新区块 - confirmations`` 的区块.
+    落后时通过BlockIterator并发预取, 调用方处理当前区块时后面的区块已经在请求中.
+
+    每个区块只获取一次, 依次交给所有handler, 再返回给调用方. 调用方取下一个区块时, 当前区块视为处理完成.
+    进度每隔checkpoint_interval秒和停止时保存到cursor, 重新启动后从下一个区块继续.
+    停止时正在处理的区块不会被记录, 重新启动后会再次返回, 所以每个区块至少被处理一次.
+    """
+
+    def __init__(self, client: Union['CitaClient', 'AsyncCitaClient'], start: Optional[int] = None, cursor: Union[None, str, FileCursor] = None,
+                 tx_detail: bool = False, confirmations: int = 1, workers: int = 4, batch_size: int = 10,
+                 poll_interval: Optional[float] = None, checkpoint_interval: float = 1.0):
+        """
+        初始化.
+
+        :param client: CitaClient, AsyncChainFollower使用AsyncCitaClient
+        :param start: 第一个区块的高度. cursor中有进度时忽略. None表示从开始跟踪时最新的已确认区块开始
+        :param cursor: 保存进度的FileCursor, 或文件路径. None表示不保存进度
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :param confirmations: 与最新区块之间保留的区块数
+        :param workers: 落后时同时进行的请求数
+        :param batch_size: 每个请求包含的区块数
+        :param poll_interval: 追上后查询新区块的间隔, 单位秒. None表示由client.poll_scheduler根据出块间隔安排
+        :param checkpoint_interval: 保存进度的最小间隔, 单位秒
+        """
+        assert confirmations >= 0
+        self.client = client
+        self.cursor = FileCursor(cursor) if isinstance(cursor, str) else cursor
+        self.tx_detail = tx_detail
+        self.confirmations = confirmations
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.handlers: List[Callable[[Dict], None]] = []
+
+        saved = self.cursor.load() if self.cursor is not None else None
+        self.height: Optional[int] = saved  # 已经处理完的区块高度
+        self._start = saved + 1 if saved is not None else start
+        self._saved = saved
+        self._saved_at = time.monotonic()
+        self._closed = False
+
+    def add_handler(self, handler: Callable[[Dict], None]):
+        """
+        加入一个处理区块的函数, 每个区块按加入的顺序交给所有handler. handler抛出异常时停止跟踪, 当前区块不会被记录为处理完成.
+
+        :param handler: 参数为区块详情
+        """
+        self.handlers.append(handler)
+
+    def _next_height(self) -> int:
+        return self.height + 1 if self.height is not None else self._start  # type: ignore
+
+    def _ack(self, height: int):
+        self.height = height
+        if time.monotonic() - self._saved_at >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """立即保存进度."""
+        self._saved_at = time.monotonic()
+        if self.cursor is not None and self.height is not None and self.height != self._saved:
+            self.cursor.save(self.height)
+            self._saved = self.height
+
+    def __iter__(self) -> Iterator[Dict]:
+        client: 'CitaClient' = self.client  # type: ignore
+        self._closed = False
+        try:
+            while not self._closed:
+                final = client.get_latest_block_number() - self.confirmations
+                if self._start is None:
+                    self._start = final
+                start = self._next_height()
+                if final < start:
+                    if self.poll_interval is not None:
+                        time.sleep(self.poll_interval)
+                    else:
+                        time.sleep(client.poll_scheduler.next_delay(client.get_block_interval))
+                    continue
+                for block in client.iter_blocks(start, final + 1, self.tx_detail, self.workers, self.batch_size):
+                    for handler in self.handlers:
+                        handler(block)
+                    yield block
+                    self._ack(start)
+                    start += 1
+                    if self._closed:
+                        break
+        finally:
+            self.checkpoint()
+
+    def run(self):
+        """一直跟踪, 只把区块交给handler, 直到close或handler抛出异常."""
+        for _ in self:
+            pass
+
+    def close(self):
+        """在当前区块处理完后停止跟踪, 并保存进度."""
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self.checkpoint()
+
+
+class AsyncChainFollower(ChainFollower):
+    """ChainFollower的asyncio版本, 使用 ``async for`` 遍历. handler可以是协程函数."""
+
+    def __iter__(self):
+        raise TypeError('use `async for` instead')
+
+    async def __aiter__(self) -> AsyncIterator[Dict]:
+        client: 'AsyncCitaClient' = self.client  # type: ignore
+        self._closed = False
+        try:
+            while not self._closed:
+                final = await client.get_latest_block_number() - self.confirmations
+                if self._start is None:
+                    self._start = final
+                start = self._next_height()
+                if final < start:
+                    await asyncio.sleep(self.poll_interval if self.poll_interval is not None else await client._poll_delay())
+                    continue
+                async for block in client.iter_blocks(start, final + 1, self.tx_detail, self.workers, self.batch_size):
+                    for handler in self.handlers:
+                        r = handler(block)
+                        if inspect.isawaitable(r):
+                            await r
+                    yield block
+                    self._ack(start)
+                    start += 1
+                    if self._closed:
+                        break
+        finally:
+            self.checkpoint()
+
+    async def run(self):  # type: ignore
+        async for _ in self:
+            pass
+
+    def __enter__(self):
+        raise TypeError('use `async with` instead')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self.checkpoint()
@@ -0,0 +1,141 @@
+"""
+JSON的编解码.
+
+JSON RPC报文和缓存都通过JSONCodec编解码, 安装了orjson或ujson时默认使用它们, 否则使用标准库json.
+编解码都直接处理bytes, 不经过str的中间拷贝.
+"""
+from typing import Any, Dict, Optional, Type, Union
+import json
+import re
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    import ujson  # type: ignore
+except ImportError:
+    ujson = None  # type: ignore
+
+# 19位以上的数字可能超出64位整数的范围. 字符串中的数字也会匹配, 这时只是多用一次标准库json
+_LONG_DIGITS = re.compile(rb'\d{19,}')
+
+
+def _may_overflow(data: Union[bytes, str]) -> bool:
+    """
+    判断报文中是否可能有超过64位的整数.
+
+    :param data: JSON
+    :return: True 应该使用标准库json解码
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    return _LONG_DIGITS.search(data) is not None
+
+
+class JSONCodec:
+    """JSON编解码器的接口定义, 默认实现使用标准库json."""
+
+    name = 'json'
+
+    def dumps(self, obj: Any) -> bytes:
+        """
+        编码.
+
+        :param obj: 可以json序列化的对象
+        :return: utf-8编码的JSON
+        """
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    def loads(self, data: bytes) -> Any:
+        """
+        解码.
+
+        :param data: utf-8编码的JSON
+        :return: 解码后的对象
+        :raises ValueError: 不是合法的JSON
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    使用orjson. orjson不支持超过64位的整数, 编码时报错, 解码时会变成丢失精度的float.
+    所以编码报错时回退到标准库json, 解码前发现可能有超过64位的整数时直接使用标准库json.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('OrjsonCodec requires orjson. Try `pip install orjson`')
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        if _may_overflow(data):
+            return super().loads(data)
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """使用ujson. ujson不支持超过64位的整数, 编码报错或解码前发现可能有超过64位的整数时使用标准库json."""
+
+    name = 'ujson'
+
+    def __init__(self):
+        if ujson is None:
+            raise ImportError('UjsonCodec requires ujson. Try `pip install ujson`')
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode()
+        except OverflowError:
+            return super().dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        if _may_overflow(data):
+            return super().loads(data)
+        return ujson.loads(data)
+
+
+_CODECS: Dict[str, Type[JSONCodec]] = {'orjson': OrjsonCodec, 'ujson': UjsonCodec, 'json': JSONCodec}
+_default: Optional[JSONCodec] = None
+
+
+def get_json_codec(name: Optional[str] = None) -> JSONCodec:
+    """
+    获取JSON编解码器.
+
+    :param name: ``orjson`` , ``ujson`` 或 ``json`` . None表示默认的编解码器, 见set_json_codec
+    :return: JSONCodec
+    :raises ImportError: 指定的库没有安装
+    """
+    global _default
+    if name is not None:
+        if name not in _CODECS:
+            raise ValueError(f'unknown json codec `{name}`, must be one of {list(_CODECS)}')
+        return _CODECS[name]()
+    if _default is None:
+        if orjson is not None:
+            _default = OrjsonCodec()
+        elif ujson is not None:
+            _default = UjsonCodec()
+        else:
+            _default = JSONCodec()
+    return _default
+
+
+def set_json_codec(codec: JSONCodec):
+    """
+    设置默认的JSON编解码器. 只影响之后创建的client和缓存.
+
+    :param codec: JSONCodec
+    """
+    global _default
+    _default = codec
@@ -1,13 +1,21 @@
-from typing import Dict, Tuple
+from typing import Dict, Tuple, List, Iterable, Iterator, Optional, Deque
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from itertools import islice
+import os
 import random
 import string
+import threading
 
 import sha3
 from ecdsa import SigningKey, SECP256k1
 from secp256k1 import PrivateKey
 
 from .blockchain_pb2 import Transaction, UnverifiedTransaction, Crypto
-from .util import param_to_str, param_to_bytes
+from .util import param_to_str
+
+
+TX_SPEC = Tuple[bytes, bytes, bytes, int, int]  # (私钥, 接收方地址, 字节码, 金额, 调用配额)
 
 
 class SignerBase:
@@ -40,11 +48,89 @@ class SignerBase:
         """
         raise NotImplementedError('virtual method')
 
+    def for_key(self, private_key: bytes) -> 'KeySignerBase':
+        """
+        获取绑定到私钥的签名上下文. 私钥相关的计算只做一次, 适合用同一个私钥签名大量交易.
+
+        :param private_key: 私钥.
+        :return: 签名上下文.
+        """
+        raise NotImplementedError('virtual method')
+
+    def make_raw_txs(self, specs: Iterable[TX_SPEC], valid_until_block: int, processes: Optional[int] = None, chunk_size: int = 256) -> Iterator[bytes]:
+        """
+        使用多进程批量签名交易. 结果按输入顺序逐个返回.
+
+        输入按chunk_size分块交给进程池, 同时最多有 2 * processes 个块在处理中, 所以输入可以是任意长的迭代器, 内存占用不随输入增长.
+
+        :param specs: 交易列表, 每个元素为 (私钥, 接收方地址, 字节码, 金额, 调用配额)
+        :param valid_until_block: 交易的最后期限.
+        :param processes: 进程数. 默认为CPU核数
+        :param chunk_size: 每个工作单元包含的交易数
+        :return: 签名后的bytes的生成器
+        """
+        processes = processes or os.cpu_count() or 1
+        max_pending = processes * 2
+        it = iter(specs)
+        with ProcessPoolExecutor(processes) as executor:
+            pending: Deque[Future] = deque()
+            try:
+                while True:
+                    chunk = list(islice(it, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(_sign_chunk, type(self), self.version, self.chain_id, valid_until_block, chunk))
+                    if len(pending) >= max_pending:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:  # 调用方提前结束迭代时, 取消还未开始的工作单元
+                for f in pending:
+                    f.cancel()
+
+
+class KeySignerBase:
+    """绑定到一个私钥的签名上下文."""
+
+    address: str  # 私钥对应的账户地址, '0x'开头
+
+    def make_raw_tx(self, receiver: bytes, bytecode: bytes, valid_until_block: int, value: int, quota: int) -> bytes:
+        """
+        对交易数据进行签名.
+
+        :param receiver: 接收方地址. 如果是合约部署, 则为b''.
+        :param bytecode: 字节码.
+        :param valid_until_block: 交易的最后期限. 默认为当前区块高度+88
+        :param value: 金额.
+        :param quota: 调用配额.
+        :return: 签名后的bytes.
+        """
+        raise NotImplementedError('virtual method')
+
+    def sign(self, message: bytes) -> bytes:
+        """
+        对消息摘要进行签名.
+
+        :param message: 32字节的消息摘要.
+        :return: 签名.
+        """
+        raise NotImplementedError('virtual method')
+
 
 # 目前支持两种加密方法 secp256k1, ed25519
 class SignerSecp256k1(SignerBase):
-    def __init__(self, version: int = 2, chain_id: int = 1):
+    def __init__(self, version: int = 2, chain_id: int = 1, max_cached_keys: int = 1024):
+        """
+        初始化.
+
+        :param version: 链的版本.
+        :param chain_id: 链id.
+        :param max_cached_keys: 最多缓存多少个私钥的签名上下文.
+        """
         super().__init__(version, chain_id)
+        self.max_cached_keys = max_cached_keys
+        self._key_signers: 'OrderedDict[bytes, KeySignerSecp256k1]' = OrderedDict()
+        self._lock = threading.Lock()
 
     def generate_account(self, private_key: bytes = b'') -> Tuple[str, str, str]:
         """
@@ -78,21 +164,69 @@ class SignerSecp256k1(SignerBase):
         :param quota: 调用配额.
         :return: 签名后的bytes.
         """
-        _, _, sender = self.generate_account(private_key)
-        pri_key = PrivateKey(private_key)
+        return self.for_key(private_key).make_raw_tx(receiver, bytecode, valid_until_block, value, quota)
+
+    def for_key(self, private_key: bytes) -> 'KeySignerSecp256k1':
+        """
+        获取绑定到私钥的签名上下文. 最近使用的max_cached_keys个上下文会被缓存.
+
+        :param private_key: 私钥.
+        :return: 签名上下文.
+        """
+        with self._lock:
+            key_signer = self._key_signers.get(private_key)
+            if key_signer is not None:
+                self._key_signers.move_to_end(private_key)
+                return key_signer
+
+        key_signer = KeySignerSecp256k1(self, private_key)
+        with self._lock:
+            self._key_signers[private_key] = key_signer
+            while len(self._key_signers) > self.max_cached_keys:
+                self._key_signers.popitem(last=False)
+        return key_signer
+
+
+class KeySignerSecp256k1(KeySignerBase):
+    """绑定到一个私钥的secp256k1签名上下文. 复用libsecp256k1的私钥对象, 不再重复推导公钥和地址."""
+
+    def __init__(self, signer: SignerSecp256k1, private_key: bytes):
+        """
+        初始化.
+
+        :param signer: 提供链的版本和chain_id.
+        :param private_key: 私钥.
+        """
+        self.signer = signer
+        self.pri_key = PrivateKey(private_key)
+
+        pub = self.pri_key.pubkey.serialize(compressed=False)[1:]  # 去掉0x04前缀, 与ecdsa的公钥格式一致
+        self.address = '0x' + sha3.keccak_256(pub).hexdigest()[24:]
 
+    def make_raw_tx(self, receiver: bytes, bytecode: bytes, valid_until_block: int, value: int, quota: int) -> bytes:
+        """
+        对交易数据进行签名.
+
+        :param receiver: 接收方地址. 如果是合约部署, 则为b''.
+        :param bytecode: 字节码.
+        :param valid_until_block: 交易的最后期限. 默认为当前区块高度+88
+        :param value: 金额.
+        :param quota: 调用配额.
+        :return: 签名后的bytes.
+        """
+        version = self.signer.version
         tx = Transaction()
         tx.valid_until_block = valid_until_block
         tx.nonce = get_nonce()
-        tx.version = self.version
+        tx.version = version
 
-        if self.version == 0:
-            tx.chain_id = self.chain_id
+        if version == 0:
+            tx.chain_id = self.signer.chain_id
         else:
-            tx.chain_id_v1 = self.chain_id.to_bytes(32, byteorder='big')
+            tx.chain_id_v1 = self.signer.chain_id.to_bytes(32, byteorder='big')
 
         if receiver:
-            if self.version == 0:
+            if version == 0:
                 tx.to = receiver
             else:
                 tx.to_v1 = receiver
@@ -104,18 +238,115 @@ class SignerSecp256k1(SignerBase):
         keccak.update(tx.SerializeToString())
         message = keccak.digest()
 
-        sign_recover = pri_key.ecdsa_sign_recoverable(message, raw=True)
-        sig = pri_key.ecdsa_recoverable_serialize(sign_recover)
-
-        signature = param_to_str(sig[0] + bytes(bytearray([sig[1]])))
-
         unverify_tx = UnverifiedTransaction()
         unverify_tx.transaction.CopyFrom(tx)
-        unverify_tx.signature = param_to_bytes(signature)
+        unverify_tx.signature = self.sign(message)
         unverify_tx.crypto = Crypto.Value('DEFAULT')
 
         return unverify_tx.SerializeToString()
 
+    def sign(self, message: bytes) -> bytes:
+        """
+        对消息摘要进行签名.
+
+        :param message: 32字节的消息摘要.
+        :return: 65字节的可恢复签名 (r + s + recovery_id).
+        """
+        sign_recover = self.pri_key.ecdsa_sign_recoverable(message, raw=True)
+        sig = self.pri_key.ecdsa_recoverable_serialize(sign_recover)
+        return sig[0] + bytes([sig[1]])
+
+
+class TxTemplate:
+    """
+    预先序列化的交易模板, 用于反复调用同一个合约方法.
+
+    模板绑定 (version, chain_id, 接收方地址, quota, value), 这些字段只序列化一次.
+    每次签名时只需要写入 nonce, valid_until_block 和 data 三个字段, 不再构造protobuf对象.
+    生成的数据与 ``make_raw_tx`` 逐字节一致.
+    """
+
+    def __init__(self, signer: SignerBase, receiver: bytes, quota: int, value: int = 0):
+        """
+        初始化.
+
+        :param signer: 提供链的版本, chain_id和私钥的签名上下文.
+        :param receiver: 接收方地址. 如果是合约部署, 则为b''.
+        :param quota: 调用配额.
+        :param value: 金额.
+        """
+        self.signer = signer
+        version, chain_id = signer.version, signer.chain_id
+
+        # 按 blockchain.proto 中 Transaction 的字段编号顺序排列, proto3中等于默认值的字段不参与序列化:
+        # 1 to, 2 nonce, 3 quota, 4 valid_until_block, 5 data, 6 value, 7 chain_id, 8 version, 9 to_v1, 10 chain_id_v1
+        self.head = _pb_bytes(1, receiver) if version == 0 else b''
+        self.middle = _pb_varint(3, quota)
+        tail = [_pb_bytes(6, value.to_bytes(32, byteorder='big'))]
+        if version == 0:
+            tail += [_pb_varint(7, chain_id), _pb_varint(8, version)]
+        else:
+            tail += [_pb_varint(8, version), _pb_bytes(9, receiver), _pb_bytes(10, chain_id.to_bytes(32, byteorder='big'))]
+        self.tail = b''.join(tail)
+
+    def make_raw_tx(self, private_key: bytes, bytecode: bytes, valid_until_block: int) -> bytes:
+        """
+        对交易数据进行签名.
+
+        :param private_key: 私钥.
+        :param bytecode: 字节码.
+        :param valid_until_block: 交易的最后期限.
+        :return: 签名后的bytes, 即序列化的 ``UnverifiedTransaction``
+        """
+        tx = b''.join((self.head,
+                       _pb_bytes(2, get_nonce().encode()),
+                       self.middle,
+                       _pb_varint(4, valid_until_block),
+                       _pb_bytes(5, bytecode),
+                       self.tail))
+        signature = self.signer.for_key(private_key).sign(sha3.keccak_256(tx).digest())
+        # UnverifiedTransaction: 1 transaction, 2 signature, 3 crypto (DEFAULT为0, 不参与序列化)
+        return b''.join((_pb_bytes(1, tx), _pb_bytes(2, signature)))
+
+
+def _varint(n: int) -> bytes:
+    """protobuf的varint编码."""
+    if n < 0x80:
+        return bytes((n,))
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _pb_varint(field: int, value: int) -> bytes:
+    """编码一个varint类型的字段. 等于0时不参与序列化."""
+    if not value:
+        return b''
+    return _varint(field << 3) + _varint(value)
+
+
+def _pb_bytes(field: int, value: bytes) -> bytes:
+    """编码一个bytes/string类型的字段. 为空时不参与序列化."""
+    if not value:
+        return b''
+    return _varint(field << 3 | 2) + _varint(len(value)) + value
+
+
+_worker_signers: Dict[Tuple[type, int, int], SignerBase] = {}  # 工作进程内缓存的signer, 复用其中的私钥上下文
+
+
+def _sign_chunk(signer_cls: type, version: int, chain_id: int, valid_until_block: int, chunk: List[TX_SPEC]) -> List[bytes]:
+    """在工作进程中签名一个工作单元."""
+    key = (signer_cls, version, chain_id)
+    signer = _worker_signers.get(key)
+    if signer is None:
+        signer = _worker_signers[key] = signer_cls(version, chain_id)
+    return [signer.make_raw_tx(private_key, receiver, bytecode, valid_until_block, value, quota)
+            for private_key, receiver, bytecode, value, quota in chunk]
+
 
 def get_nonce(size=6):
     """Get a random string."""
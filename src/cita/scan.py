@@ -0,0 +1,200 @@
+"""
+区块范围的并发扫描.
+"""
+from typing import Dict, List, Tuple, Optional, Union, Any, Callable, Deque, Iterator, AsyncIterator, TYPE_CHECKING
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+import asyncio
+import time
+
+from .util import PARAM
+
+if TYPE_CHECKING:
+    from .sdk import CitaClient
+    from .async_sdk import AsyncCitaClient
+
+
+class _RangeIterator:
+    """
+    把区块范围 [start, end) 按step分段, 最多workers段同时请求, 按顺序返回结果.
+
+    只有调用方取走了最早一段的结果, 才会发出新的请求, 所以内存中最多缓存workers段的结果.
+    子类实现 _fetch 和 _emit.
+    """
+
+    def __init__(self, client: Union['CitaClient', 'AsyncCitaClient'], start: int, end: Optional[int], workers: int, step: int):
+        assert 0 <= start and workers > 0 and step > 0
+        self.client = client
+        self.start = start
+        self.end = end
+        self.workers = workers
+        self.step = step
+        self.count = 0  # 已经返回的区块数
+        self._t0: Optional[float] = None
+        self._t1: Optional[float] = None
+
+    def _ranges(self, end: int) -> Iterator[range]:
+        for i in range(self.start, end, self.step):
+            yield range(i, min(i + self.step, end))
+
+    def _fetch(self, heights: range):
+        """请求一段区块范围. 异步client返回协程."""
+        raise NotImplementedError('virtual method')
+
+    def _emit(self, heights: range, result) -> Iterator:
+        """把一段的请求结果展开为返回给调用方的元素, 并更新统计."""
+        raise NotImplementedError('virtual method')
+
+    def _begin(self):
+        self._t0 = time.monotonic()
+        self._t1 = None
+        self.count = 0
+
+    def __iter__(self) -> Iterator:
+        self._begin()
+        end = self.end if self.end is not None else self.client.get_latest_block_number() + 1  # type: ignore
+        pending: Deque[Tuple[range, Future]] = deque()
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix='cita-range-fetcher')
+        try:
+            for heights in self._ranges(end):
+                pending.append((heights, executor.submit(self._fetch, heights)))
+                if len(pending) < self.workers:
+                    continue
+                heights, fut = pending.popleft()
+                yield from self._emit(heights, fut.result())
+            while pending:
+                heights, fut = pending.popleft()
+                yield from self._emit(heights, fut.result())
+            self._t1 = time.monotonic()
+        finally:  # 提前退出时, 放弃还没有发出的请求
+            for _, fut in pending:
+                fut.cancel()
+            executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        """吞吐量统计. blocks_per_second是已返回的区块数除以开始遍历以来的时间."""
+        if self._t0 is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._t1 if self._t1 is not None else time.monotonic()) - self._t0
+        return {'blocks': self.count, 'elapsed': elapsed, 'blocks_per_second': self.count / elapsed if elapsed > 0 else 0.0}
+
+
+class _AsyncRangeIterator(_RangeIterator):
+    """_RangeIterator的asyncio版本, 使用 ``async for`` 遍历."""
+
+    def __iter__(self):
+        raise TypeError('use `async for` instead')
+
+    async def __aiter__(self) -> AsyncIterator:
+        self._begin()
+        end = self.end if self.end is not None else await self.client.get_latest_block_number() + 1  # type: ignore
+        pending: Deque[Tuple[range, asyncio.Future]] = deque()
+        try:
+            for heights in self._ranges(end):
+                pending.append((heights, asyncio.ensure_future(self._fetch(heights))))
+                if len(pending) < self.workers:
+                    continue
+                heights, task = pending.popleft()
+                for item in self._emit(heights, await task):
+                    yield item
+            while pending:
+                heights, task = pending.popleft()
+                for item in self._emit(heights, await task):
+                    yield item
+            self._t1 = time.monotonic()
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+
+class BlockIterator(_RangeIterator):
+    """
+    按高度顺序遍历区块 [start, end).
+
+    区块按batch_size个一组, 通过JSON RPC batch获取, 最多workers组同时在请求中.
+    只有调用方取走了最早的一组, 才会发出新的请求, 所以内存中最多缓存 ``workers * batch_size`` 个区块.
+    """
+
+    def __init__(self, client: Union['CitaClient', 'AsyncCitaClient'], start: int, end: Optional[int] = None, tx_detail: bool = False, workers: int = 4, batch_size: int = 10):
+        """
+        初始化.
+
+        :param client: CitaClient, AsyncBlockIterator使用AsyncCitaClient
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :param workers: 同时在请求中的组数
+        :param batch_size: 每个请求包含的区块数
+        """
+        super().__init__(client, start, end, workers, batch_size)
+        self.tx_detail = tx_detail
+        self.batch_size = batch_size
+
+    def _fetch(self, heights: range):
+        return self.client.get_blocks_by_number(heights, self.tx_detail)
+
+    def _emit(self, heights: range, blocks: List[Dict]) -> Iterator[Dict]:
+        for height, block in zip(heights, blocks):
+            if not block:
+                raise RuntimeError(f'block {height} not found')
+            self.count += 1
+            yield block
+
+
+class AsyncBlockIterator(_AsyncRangeIterator, BlockIterator):
+    """BlockIterator的asyncio版本, 使用 ``async for`` 遍历."""
+
+
+class LogIterator(_RangeIterator):
+    """
+    按区块顺序遍历区块 [start, end) 中符合条件的log.
+
+    区块范围按chunk_size分段, 每段一个 ``getLogs`` 请求, 最多workers段同时在请求中.
+    """
+
+    def __init__(self, client: Union['CitaClient', 'AsyncCitaClient'], start: int, end: Optional[int] = None, address: Union[None, PARAM, List[PARAM]] = None,
+                 topics: Optional[List] = None, decoder: Optional[Callable[[Dict], Any]] = None, workers: int = 4, chunk_size: int = 1000):
+        """
+        初始化.
+
+        :param client: CitaClient, AsyncLogIterator使用AsyncCitaClient
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同make_log_filter
+        :param decoder: 解码log的函数, 比如EventDecoder. 解码结果为None的log会被丢弃. None表示返回原始log
+        :param workers: 同时在请求中的段数
+        :param chunk_size: 每个请求查询的区块数
+        """
+        super().__init__(client, start, end, workers, chunk_size)
+        self.address = address
+        self.topics = topics
+        self.decoder = decoder
+        self.chunk_size = chunk_size
+        self.logs = 0  # 已经返回的log数
+
+    def _begin(self):
+        super()._begin()
+        self.logs = 0
+
+    def _fetch(self, heights: range):
+        return self.client.get_logs(self.address, self.topics, heights.start, heights.stop - 1)
+
+    def _emit(self, heights: range, logs: List[Dict]) -> Iterator:
+        for log in logs:
+            item = self.decoder(log) if self.decoder is not None else log
+            if item is not None:
+                self.logs += 1
+                yield item
+        self.count += len(heights)
+
+    def stats(self) -> Dict:
+        """吞吐量统计. blocks是已经扫描完的区块数, logs是已返回的log数."""
+        r = super().stats()
+        r['logs'] = self.logs
+        return r
+
+
+class AsyncLogIterator(_AsyncRangeIterator, LogIterator):
+    """LogIterator的asyncio版本, 使用 ``async for`` 遍历."""
@@ -1,16 +1,30 @@
-from typing import Iterable, Dict, List, Tuple, Optional, Union, cast
-from dataclasses import dataclass
+from typing import Iterable, Dict, List, Tuple, Optional, Union, Sequence, Callable, Any, cast, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from dataclasses import dataclass, field
 import json
+import threading
 import time
 import ast
 from pathlib import Path
 import random
 
-import requests
 import sha3  # type: ignore
 
-from .util import PARAM, DEFAULT_QUOTA, LATEST_VERSION, param_to_str, param_to_bytes, join_param, encode_param, decode_param
+from .util import PARAM, DEFAULT_QUOTA, LATEST_VERSION, ABICodec, param_to_str, param_to_bytes, join_param, encode_param, decode_param, get_codec
 from .make_tx import SignerSecp256k1, decode_unverified_transaction
+from .tracker import BlockHeightTracker, PollScheduler
+from .cache import CALL_KEY, CallCache, DataCacheBase
+from .batch import encode_batch_calls
+from .watch import ReceiptWatcher
+from .scan import BlockIterator, LogIterator
+from .follow import ChainFollower, FileCursor
+from .events import EventABI, EventDecoder, LogPoller, parse_events, make_log_filter, event_registry
+from .jsoncodec import JSONCodec, get_json_codec
+from .transport import TransportBase, HttpTransport
+from .endpoint import Node, NodePool, WRITE_METHODS, IDEMPOTENT_METHODS
+
+if TYPE_CHECKING:
+    from .async_sdk import AsyncCitaClient
 
 # CITA built-in contract address
 STORE_ABI_ADDR = '0xffffffffffffffffffffffffffffffffff010001'
@@ -18,27 +32,23 @@ BATCH_TX_ADDR = '0xffffffffffffffffffffffffffffffffff02000e'
 BATCH_TX_CALL = '0x82cc3327'
 
 
-class CitaClient:
+class ClientBase:
     """
-    cita-cli的封装.
+    CitaClient和AsyncCitaClient共用的部分: JSON RPC报文的构造和解析, 缓存的key和查询结果的解码.
 
-    注意成员函数的参数, 如果是Union[str, bytes] 和返回值的编码都使用bytes, 以避免是否要加0x的困惑
+    子类只负责发送请求: CitaClient直接调用transport, AsyncCitaClient在此基础上await.
     """
-    def __init__(self, url: str, timeout: int = 10, call_mode: str = 'latest', crypto_method: str = 'secp256k1', version: int = LATEST_VERSION, chain_id: int = 1):
-        """
-        指定cita环境.
 
-        :param url: cita后端服务的url
-        :param call_mode: 调用时使用已确认区块 `latest` , 还是待确认区块 `pending`
-        :param timeout: JSON RPC或cita-cli的调用超时时间, 单位秒
-        :param crypto_method: 加密机制. 默认secp256k1
-        :param version: 链的版本, 默认为 2
-        :param chain_id: 链id, 默认为 1
-        """
+    def __init__(self, url: Union[str, Sequence[str]], timeout: int, call_mode: str, crypto_method: str, version: int, chain_id: int,
+                 height_tracker: Optional[BlockHeightTracker], poll_scheduler: Optional[PollScheduler], write_policy: str, hedge_percentile: Optional[float],
+                 call_cache: Optional[CallCache], data_cache: Optional[DataCacheBase], json_codec: Optional[JSONCodec]):
+        """初始化, 参数见CitaClient. transport由子类创建."""
         if call_mode not in ('latest', 'pending'):
             raise ValueError('call_mode must be `latest` or `pending`')
 
-        self.url = url
+        urls = [url] if isinstance(url, str) else list(url)
+        self.nodes = NodePool(urls, write_policy, hedge_percentile=hedge_percentile)
+        self.url = urls[0]
         self.call_mode = call_mode
         self.timeout = timeout
         if crypto_method == 'secp256k1':
@@ -46,6 +56,13 @@ class CitaClient:
         else:
             raise NotImplementedError(crypto_method)
 
+        self.height_tracker = height_tracker
+        self.poll_scheduler = poll_scheduler if poll_scheduler is not None else PollScheduler()
+        self.call_cache = call_cache
+        self.data_cache = data_cache
+        self.json_codec = json_codec if json_codec is not None else get_json_codec()
+        self._filter_nodes: Dict[str, Node] = {}  # 过滤器id -> 创建它的节点
+
     def set_call_mode(self, mode):
         """
         设置调用只读方法时, 是使用已确认区块的数据, 还是待确认区块的数据.
@@ -56,44 +73,485 @@ class CitaClient:
             raise ValueError('call_mode must be `latest` or `pending`')
         self.call_mode = mode
 
-    def _jsonrpc(self, method: str, params: List) -> Union[None, str, Dict, List]:
+    def create_key(self) -> Dict[str, str]:
         """
-        执行jsonrpc调用.
+        创建账户. 只有用私钥签名发起交易后, 才会改变链上状态.
 
-        :param method: JSON RPC的方法名
-        :param params: 被调方法的实参列表
-        :return: JSON
+        :return: 如 ``{'address': '0x11...', 'public': '0x22...', 'private': '0x33...'}``
+        """
+        r = self.signer.generate_account()
+        return {'private': r[0], 'public': r[1], 'address': r[2]}
+
+    def decode_transaction_content(self, content: PARAM) -> Dict:
         """
-        req_id = random.randint(1, 10000)
-        req = {
+        把交易内容解析成结构化的各个字段.
+
+        :param content: 交易内容, 就是 JSON RPC ``getTransaction`` 返回的``content``字段.
+        """
+        # TODO: 找到decode_transaction_content的对应物.
+        return decode_unverified_transaction(param_to_bytes(content))
+
+    # 发送请求
+
+    def _failover_plan(self, write: bool, idempotent: bool) -> Tuple[Optional[Tuple[Node, Node, float]], List[Node]]:
+        """
+        确定请求发给哪些节点.
+
+        :return: (对冲请求的 (primary, secondary, delay), 之后依次尝试的节点). 不发对冲请求时前者为None
+        """
+        candidates = self.nodes.candidates(write)
+        delay = self.nodes.hedge_delay() if idempotent else None
+        if delay is None:
+            return None, candidates
+        return (candidates[0], candidates[1], delay), candidates[2:]
+
+    def _broadcast_nodes(self) -> List[Node]:
+        return self.nodes.healthy() or self.nodes.candidates(True)[:1]
+
+    def _accepted(self, status: int, content: bytes) -> bool:
+        """广播时, 节点是否接受了交易. 其他节点可能因为重复交易返回错误."""
+        try:
+            return status < 500 and 'result' in self.json_codec.loads(content)
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _rpc_request(method: str, params: List) -> Dict:
+        return {
             "jsonrpc": "2.0",
-            "id": req_id,
+            "id": random.randint(1, 10000),
             "method": method,
             "params": params
         }
-        resp = requests.post(self.url, json=req, timeout=self.timeout)
+
+    def _rpc_result(self, req: Dict, status: int, content: bytes) -> Union[None, str, Dict, List]:
+        """解析jsonrpc调用的响应."""
         try:
-            rj = resp.json()
-            assert rj['id'] == req_id
+            rj = self.json_codec.loads(content)
+            assert rj['id'] == req['id']
             return rj['result']
         except Exception:
-            raise RuntimeError(f'`{method}` jsonrpc failed. code={resp.status_code} reason={resp.text} original_req={req}')
+            raise RuntimeError(f'`{req["method"]}` jsonrpc failed. code={status} reason={content.decode(errors="replace")} original_req={req}')
 
-    def create_key(self) -> Dict[str, str]:
+    @staticmethod
+    def _batch_request(calls: List[Tuple[str, List]]) -> List[Dict]:
+        base_id = random.randint(1, 10000)
+        return [{
+            "jsonrpc": "2.0",
+            "id": base_id + i,
+            "method": method,
+            "params": params
+        } for i, (method, params) in enumerate(calls)]
+
+    @staticmethod
+    def _batch_route(calls: List[Tuple[str, List]]) -> Tuple[bool, bool]:
+        """:return: (是否为写请求, 是否为幂等的只读请求)"""
+        return any(method in WRITE_METHODS for method, _ in calls), all(method in IDEMPOTENT_METHODS for method, _ in calls)
+
+    def _batch_results(self, calls: List[Tuple[str, List]], req: List[Dict], status: int, content: bytes) -> List[Union[None, str, Dict, List]]:
+        """解析batch请求的响应. 即使节点乱序返回, 也会按id重新排序."""
+        try:
+            rj = self.json_codec.loads(content)
+            id2resp = {i['id']: i for i in rj}
+            resp_list = [id2resp[i['id']] for i in req]
+        except Exception:
+            raise RuntimeError(f'batch jsonrpc failed. code={status} reason={content.decode(errors="replace")} size={len(calls)}')
+
+        result = []
+        for (method, params), resp in zip(calls, resp_list):
+            if 'result' not in resp:
+                raise RuntimeError(f'`{method}` jsonrpc failed. reason={resp.get("error")} original_params={params}')
+            result.append(resp['result'])
+        return result
+
+    # 解析结果
+
+    @staticmethod
+    def _parse_quantity(r: Any) -> int:
+        r = cast(str, r)
+        assert r.startswith('0x')
+        return ast.literal_eval(r)
+
+    def _observe_head(self, height: int) -> int:
+        """记录观察到的最新区块高度."""
+        if self.height_tracker is not None:
+            self.height_tracker.update(height)
+        self.poll_scheduler.observe(height)
+        return height
+
+    def _tracked_height(self) -> Optional[int]:
+        """height_tracker中没有过期的区块高度. 需要查询时返回None."""
+        if self.height_tracker is not None and not self.height_tracker.expired:
+            return self.height_tracker.height
+        return None
+
+    def _make_raw_tx(self, private_key: PARAM, to_addr: PARAM, code: PARAM, valid_until_block: int, value: int, quota: int) -> bytes:
+        return self.signer.make_raw_tx(param_to_bytes(private_key), param_to_bytes(to_addr), param_to_bytes(code), valid_until_block, value, quota)
+
+    # data_cache
+
+    def _cache_get(self, key: str) -> Optional[Any]:
+        return self.data_cache.get(key) if self.data_cache is not None else None
+
+    def _cache_many(self, keys: List[str]) -> Tuple[List[Optional[Any]], List[int]]:
         """
-        创建账户. 只有用私钥签名发起交易后, 才会改变链上状态.
+        批量查找缓存.
 
-        :return: 如 ``{'address': '0x11...', 'public': '0x22...', 'private': '0x33...'}``
+        :return: (与keys一一对应的缓存结果, 没有缓存的序号)
         """
-        r = self.signer.generate_account()
-        return {'private': r[0], 'public': r[1], 'address': r[2]}
+        result = [self._cache_get(key) for key in keys]
+        return result, [i for i, r in enumerate(result) if r is None]
+
+    def _cache_blocks(self, blocks: List[Dict], tx_detail: bool):
+        """按高度和hash缓存区块. 区块一经产生就不会改变."""
+        if self.data_cache is None:
+            return
+        items = []
+        for block in blocks:
+            if block:
+                items.append((f'block:{ast.literal_eval(block["header"]["number"])}:{int(tx_detail)}', block))
+                items.append((f'blockhash:{block["hash"].lower()}:{int(tx_detail)}', block))
+        self.data_cache.put_many(items)
+
+    @staticmethod
+    def _blockhash_key(hash: PARAM, tx_detail: bool) -> Tuple[str, str]:
+        """:return: (hash, 缓存的key)"""
+        hash_str = param_to_str(hash)
+        assert len(hash_str) == 64 + 2
+        return hash_str, f'blockhash:{hash_str.lower()}:{int(tx_detail)}'
+
+    @staticmethod
+    def _block_keys(heights: Iterable[int], tx_detail: bool) -> Tuple[List[int], List[str]]:
+        """:return: (区块高度列表, 缓存的key)"""
+        heights = list(heights)
+        assert all(height >= 0 for height in heights)
+        return heights, [f'block:{height}:{int(tx_detail)}' for height in heights]
+
+    def _got_block(self, r: Any, tx_detail: bool) -> Dict:
+        if r:
+            self._cache_blocks([r], tx_detail)
+        return cast(Dict, r)
+
+    @staticmethod
+    def _receipt_keys(tx_hash_list: Iterable[PARAM]) -> Tuple[List[str], List[str]]:
+        """:return: (交易hash列表, 缓存的key)"""
+        hashes = [param_to_str(tx_hash) for tx_hash in tx_hash_list]
+        return hashes, [f'receipt:{h.lower()}' for h in hashes]
+
+    def _got_receipt(self, key: str, r: Any) -> Dict:
+        if r is None:
+            r = {}
+        assert isinstance(r, dict)
+        if r and self.data_cache is not None:  # 已经生成的回执不会再改变
+            self.data_cache.put(key, r)
+        return r
+
+    def _got_receipts(self, keys: List[str], result: List[Optional[Any]], missing: List[int], receipts: List) -> List[Dict]:
+        for i, r in zip(missing, receipts):
+            result[i] = r if r else {}
+        if self.data_cache is not None:
+            self.data_cache.put_many((keys[i], r) for i, r in zip(missing, receipts) if r)
+        return cast(List[Dict], result)
+
+    def _check_receipt(self, r: Dict) -> Dict:
+        """记录回执所在的区块高度. 交易失败时抛出RuntimeError."""
+        if self.height_tracker is not None and 'blockNumber' in r:
+            self.height_tracker.observe(ast.literal_eval(r['blockNumber']))
+
+        error = r.get('errorMessage')
+        if error:  # 交易失败
+            raise RuntimeError(error)
+        return r
+
+    @staticmethod
+    def _tx_key(tx_hash: PARAM) -> Tuple[str, str]:
+        """:return: (交易hash, 缓存的key)"""
+        h = param_to_str(tx_hash)
+        assert len(h) == 64 + 2
+        return h, f'tx:{h.lower()}'
+
+    def _got_transaction(self, key: str, r: Any) -> Dict:
+        if not r:
+            return {}
+        if self.data_cache is not None and cast(Dict, r).get('blockNumber'):  # 已经上链的交易不会再改变
+            self.data_cache.put(key, r)
+        return cast(Dict, r)
+
+    @staticmethod
+    def _contract_addr(contract_addr: PARAM) -> str:
+        addr = param_to_str(contract_addr)
+        assert len(addr) == 42
+        return addr
+
+    def _code_key(self, contract_addr: PARAM) -> Tuple[str, str]:
+        """:return: (合约地址, 缓存的key)"""
+        addr = self._contract_addr(contract_addr)
+        return addr, f'code:{addr.lower()}'
+
+    def _got_code(self, key: str, r: Any) -> bytes:
+        assert isinstance(r, str) and r.startswith('0x')
+        if r == '0x':  # 合约不存在
+            return b''
+        if self.data_cache is not None:
+            self.data_cache.put(key, r)
+        return param_to_bytes(r)
+
+    @staticmethod
+    def _parse_abi_result(r: Any) -> List:
+        assert isinstance(r, str) and r.startswith('0x')
+        if r == '0x':  # 合约不存在或未绑定ABI
+            return []
+        return json.loads(decode_param('string', param_to_bytes(r)))
+
+    @staticmethod
+    def _count_params(addr: PARAM, call_mode: str) -> List:
+        addr_ = param_to_str(addr)
+        assert len(addr_) == 40 + 2
+        return [addr_, call_mode]
+
+    @staticmethod
+    def _parse_count(r: Any) -> int:
+        if not r or r == '0x':
+            return 0
+        assert isinstance(r, str)
+        return ast.literal_eval(r)
+
+    # call_cache
+
+    def _fixed_call_block(self, height: Optional[int]) -> Optional[Tuple[str, Optional[int]]]:
+        """
+        不需要查询最新区块时, 确定只读调用使用的区块.
+
+        :param height: 指定的区块高度, None表示按call_mode
+        :return: (JSON RPC的区块参数, 缓存使用的区块高度). 不使用缓存时, 高度为None. 需要在缓存的最新区块上调用时返回None
+        """
+        if height is not None:
+            return '0x%02x' % height, height if self.call_cache is not None else None
+        if self.call_cache is None or self.call_mode == 'pending':
+            return self.call_mode, None
+        return None
+
+    def _head_call_block(self, head: int) -> Tuple[str, Optional[int]]:
+        """在缓存的最新区块上调用, 使结果与缓存的key一致."""
+        self.call_cache.advance(head)  # type: ignore
+        return '0x%02x' % head, head
+
+    def _cached_calls(self, req_list: List[Dict], cache_height: Optional[int]) -> Tuple[List[CALL_KEY], List[Optional[bytes]], List[int]]:
+        """
+        查找只读调用的缓存.
+
+        :return: (缓存的key, 与req_list一一对应的缓存结果, 没有缓存的序号)
+        """
+        if cache_height is None:
+            return [], [None] * len(req_list), list(range(len(req_list)))
+        keys = [CallCache.make_key(req, cache_height) for req in req_list]
+        result = [self.call_cache.get(key) for key in keys]  # type: ignore
+        return keys, result, [i for i, value in enumerate(result) if value is None]
+
+    def _got_calls(self, keys: List[CALL_KEY], result: List[Optional[bytes]], missing: List[int], values: List, pinned: bool) -> List[bytes]:
+        for i, r in zip(missing, values):
+            assert isinstance(r, str) and r.startswith('0x')
+            result[i] = param_to_bytes(r)
+            if keys:
+                self.call_cache.put(keys[i], result[i], pinned=pinned)  # type: ignore
+        return cast(List[bytes], result)
+
+
+class CitaClient(ClientBase):
+    """
+    cita-cli的封装.
+
+    注意成员函数的参数, 如果是Union[str, bytes] 和返回值的编码都使用bytes, 以避免是否要加0x的困惑
+    """
+    def __init__(self, url: Union[str, Sequence[str]], timeout: int = 10, call_mode: str = 'latest', crypto_method: str = 'secp256k1', version: int = LATEST_VERSION, chain_id: int = 1,
+                 transport: Optional[TransportBase] = None, height_tracker: Optional[BlockHeightTracker] = None,
+                 poll_scheduler: Optional[PollScheduler] = None, write_policy: str = 'pinned', hedge_percentile: Optional[float] = None,
+                 call_cache: Optional[CallCache] = None, data_cache: Optional[DataCacheBase] = None,
+                 json_codec: Optional[JSONCodec] = None):
+        """
+        指定cita环境.
+
+        :param url: cita后端服务的url. 也可以是多个节点的url列表, 读请求发给负载最低, 延迟最小的健康节点
+        :param call_mode: 调用时使用已确认区块 `latest` , 还是待确认区块 `pending`
+        :param timeout: JSON RPC或cita-cli的调用超时时间, 单位秒
+        :param crypto_method: 加密机制. 默认secp256k1
+        :param version: 链的版本, 默认为 2
+        :param chain_id: 链id, 默认为 1
+        :param transport: JSON RPC的传输层. 默认为每个client创建一个独立连接池的HttpTransport
+        :param height_tracker: 区块高度的缓存. 指定后, 发送交易时使用缓存的高度计算 ``valid_until_block`` , 不再每次都调用 ``blockNumber``
+        :param poll_scheduler: 等待回执时安排轮询时间. 默认根据链的出块间隔自动调整
+        :param write_policy: 有多个节点时, 发送交易的策略. ``pinned`` 发给第一个健康节点; ``balanced`` 与读请求相同; ``broadcast`` 发给所有健康节点
+        :param hedge_percentile: 有多个节点时, 幂等的只读请求如果在最近响应时间的该分位数 (如0.95) 内没有返回, 再发给另一个节点, 使用先返回的结果
+        :param call_cache: 只读调用的结果缓存. 默认不缓存
+        :param data_cache: 区块, 交易和合约代码等不可变数据的缓存. 默认不缓存. 由调用方负责关闭
+        :param json_codec: JSON RPC报文的编解码器. 默认安装了orjson或ujson时使用它们, 否则使用标准库json
+        """
+        super().__init__(url, timeout, call_mode, crypto_method, version, chain_id, height_tracker, poll_scheduler, write_policy, hedge_percentile,
+                         call_cache, data_cache, json_codec)
+        # 外部传入的transport可能被多个client共享, 由调用方负责关闭.
+        self.transport = transport if transport is not None else HttpTransport()
+        self._own_transport = transport is None
+        # 所有confirm_transaction共享一个跟踪最新区块的后台线程, 而不是每个交易各自轮询.
+        self.receipt_watcher = ReceiptWatcher(self)
+        self._executor: Optional[ThreadPoolExecutor] = None  # 用于广播和对冲请求
+
+    def close(self):
+        """关闭client持有的连接池, 停止等待回执."""
+        self.receipt_watcher.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._own_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _post_to(self, node: Node, data: bytes) -> Tuple[int, bytes]:
+        """向一个节点发送请求, 并更新节点的统计信息."""
+        t0 = self.nodes.begin(node)
+        try:
+            status, content = self.transport.post(node.url, data, self.timeout)
+        except Exception:
+            self.nodes.end(node, t0, False)
+            raise
+        self.nodes.end(node, t0, status < 500)
+        return status, content
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor()
+        return self._executor
+
+    def _post(self, data: bytes, write: bool = False, idempotent: bool = False, node: Optional[Node] = None) -> Tuple[int, bytes]:
+        """
+        选择节点发送请求. 连接失败, 超时或HTTP 5xx时, 依次尝试下一个节点.
+
+        :param data: 编码后的请求体
+        :param write: 是否为写请求
+        :param idempotent: 是否为幂等的只读请求, 可以发出对冲请求
+        :param node: 只发给这个节点, 比如过滤器相关的请求
+        :return: (HTTP状态码, 响应体)
+        """
+        if node is not None:
+            return self._post_to(node, data)
+        if write and self.nodes.write_policy == 'broadcast' and len(self.nodes.nodes) > 1:
+            return self._broadcast(data)
+
+        hedge, candidates = self._failover_plan(write, idempotent)
+        last_resp: Optional[Tuple[int, bytes]] = None
+        last_error: Optional[Exception] = None
+        if hedge is not None:
+            try:
+                status, content = self._hedge(data, *hedge)
+                if status < 500:
+                    return status, content
+                last_resp = (status, content)
+            except Exception as e:
+                last_error = e
+
+        for node in candidates:
+            try:
+                status, content = self._post_to(node, data)
+            except Exception as e:
+                last_error = e
+                continue
+            if status < 500:
+                return status, content
+            last_resp = (status, content)
+        if last_resp is not None:
+            return last_resp
+        raise cast(Exception, last_error)
+
+    def _hedge(self, data: bytes, primary: Node, secondary: Node, delay: float) -> Tuple[int, bytes]:
+        """
+        在调用方线程把请求发给primary, 超过delay没有返回时, 由后台线程再发给secondary.
+        primary失败时使用secondary的结果, secondary已经在请求中, 不必等primary失败后才开始重试.
+
+        primary不经过线程池, 所以线程池中排队的时间不会被计入delay, 也不会引起多余的对冲请求.
+        primary成功时, 还在进行中的secondary会在后台完成, 它的结果被丢弃.
+        """
+        primary_done = threading.Event()
+
+        def send_secondary() -> Optional[Tuple[int, bytes]]:
+            if primary_done.wait(delay):  # primary已经返回, 不需要对冲
+                return None
+            return self._post_to(secondary, data)
+
+        hedge = self._get_executor().submit(send_secondary)
+        resp: Optional[Tuple[int, bytes]] = None
+        try:
+            resp = self._post_to(primary, data)
+        except Exception:  # 改用secondary的结果
+            pass
+        finally:
+            primary_done.set()
+        if resp is not None and resp[0] < 500:
+            hedge.cancel()
+            return resp
+
+        # primary失败, 使用secondary的结果. 对冲请求还没有发出时, 在调用方线程发出
+        try:
+            r = None if hedge.cancel() else hedge.result()
+            if r is None:
+                r = self._post_to(secondary, data)
+        except Exception:
+            if resp is not None:
+                return resp
+            raise
+        return r if r[0] < 500 or resp is None else resp
+
+    def _broadcast(self, data: bytes) -> Tuple[int, bytes]:
+        """把写请求同时发给所有健康节点, 返回最先成功的响应."""
+        executor = self._get_executor()
+        futures = [executor.submit(self._post_to, node, data) for node in self._broadcast_nodes()]
+        first: Optional[Tuple[int, bytes]] = None
+        last_error: Optional[Exception] = None
+        for fut in as_completed(futures):
+            try:
+                status, content = fut.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if self._accepted(status, content):
+                return status, content
+            first = first or (status, content)
+        if first is not None:
+            return first
+        raise cast(Exception, last_error)
+
+    def _jsonrpc(self, method: str, params: List, node: Optional[Node] = None) -> Union[None, str, Dict, List]:
+        """
+        执行jsonrpc调用.
+
+        :param method: JSON RPC的方法名
+        :param params: 被调方法的实参列表
+        :param node: 只发给这个节点. 默认由节点池选择
+        :return: JSON
+        """
+        req = self._rpc_request(method, params)
+        status, content = self._post(self.json_codec.dumps(req), method in WRITE_METHODS, method in IDEMPOTENT_METHODS, node)
+        return self._rpc_result(req, status, content)
+
+    def multi_call(self, calls: List[Tuple[str, List]]) -> List[Union[None, str, Dict, List]]:
+        """
+        在一个HTTP请求中执行多个jsonrpc调用 (JSON-RPC 2.0 batch).
+
+        :param calls: [(方法名, 实参列表), ...]
+        :return: 与calls一一对应的结果列表. 即使节点乱序返回, 也会按id重新排序
+        """
+        if not calls:
+            return []
+
+        req = self._batch_request(calls)
+        status, content = self._post(self.json_codec.dumps(req), *self._batch_route(calls))
+        return self._batch_results(calls, req, status, content)
 
     def get_peer_count(self) -> int:
         """兄弟节点个数."""
-        r = self._jsonrpc('peerCount', [])
-        r = cast(str, r)
-        assert r.startswith('0x')
-        return ast.literal_eval(r)
+        return self._parse_quantity(self._jsonrpc('peerCount', []))
 
     def get_peers(self) -> Dict[str, str]:
         """
@@ -107,10 +565,7 @@ class CitaClient:
 
     def get_latest_block_number(self) -> int:
         """最新区块的高度."""
-        r = self._jsonrpc('blockNumber', [])
-        r = cast(str, r)
-        assert r.startswith('0x')
-        return ast.literal_eval(r)
+        return self._observe_head(self._parse_quantity(self._jsonrpc('blockNumber', [])))
 
     def get_block_by_hash(self, hash: PARAM, tx_detail: bool = False) -> Dict:
         """
@@ -120,10 +575,11 @@ class CitaClient:
         :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
         :return: 区块详情
         """
-        hash_str = param_to_str(hash)
-        assert len(hash_str) == 64 + 2
-        r = self._jsonrpc('getBlockByHash', [hash_str, tx_detail])
-        return cast(Dict, r)
+        hash_str, key = self._blockhash_key(hash, tx_detail)
+        r = self._cache_get(key)
+        if r is not None:
+            return r
+        return self._got_block(self._jsonrpc('getBlockByHash', [hash_str, tx_detail]), tx_detail)
 
     def get_block_by_number(self, height: int, tx_detail: bool = False) -> Dict:
         """
@@ -133,9 +589,40 @@ class CitaClient:
         :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
         :return: 区块详情
         """
-        assert height >= 0
-        r = self._jsonrpc('getBlockByNumber', ['0x%02x' % height, tx_detail])
-        return cast(Dict, r)
+        _, keys = self._block_keys([height], tx_detail)
+        r = self._cache_get(keys[0])
+        if r is not None:
+            return r
+        return self._got_block(self._jsonrpc('getBlockByNumber', ['0x%02x' % height, tx_detail]), tx_detail)
+
+    def get_blocks_by_number(self, heights: Iterable[int], tx_detail: bool = False) -> List[Dict]:
+        """
+        批量获取区块详情, 只需要一次网络往返. 指定了data_cache时, 只有没有缓存的区块会发给节点.
+
+        :param heights: 区块高度列表
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :return: 与heights一一对应的区块详情
+        """
+        heights, keys = self._block_keys(heights, tx_detail)
+        result, missing = self._cache_many(keys)
+        blocks = cast(List[Dict], self.multi_call([('getBlockByNumber', ['0x%02x' % heights[i], tx_detail]) for i in missing]))
+        for i, block in zip(missing, blocks):
+            result[i] = block
+        self._cache_blocks(blocks, tx_detail)
+        return cast(List[Dict], result)
+
+    def iter_blocks(self, start: int, end: Optional[int] = None, tx_detail: bool = False, workers: int = 4, batch_size: int = 10) -> BlockIterator:
+        """
+        并发获取区块 [start, end), 按高度顺序返回. 最多workers个batch请求同时进行, 调用方取走区块后才发出新的请求.
+
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :param workers: 同时进行的请求数
+        :param batch_size: 每个请求包含的区块数
+        :return: BlockIterator, 按高度顺序返回区块详情. ``stats()`` 返回每秒获取的区块数
+        """
+        return BlockIterator(self, start, end, tx_detail, workers, batch_size)
 
     def get_meta_data(self) -> Dict:
         """
@@ -144,6 +631,11 @@ class CitaClient:
         r = self._jsonrpc('getMetaData', [self.call_mode])
         return cast(Dict, r)
 
+    def get_block_interval(self) -> float:
+        """出块间隔, 单位秒."""
+        r = self.get_meta_data()
+        return r['blockInterval'] / 1000
+
     def send_raw_transaction(self, data: PARAM) -> str:
         """
         发送原始交易数据.
@@ -166,12 +658,11 @@ class CitaClient:
         :param max_wait_block: 交易至多等待多少个区块. 默认88.
         :return: 交易hash.
         """
-        block_number = self.get_latest_block_number()
-        data = self.signer.make_raw_tx(param_to_bytes(private_key),
-                                       param_to_bytes(to_addr),
-                                       param_to_bytes(code),
-                                       block_number + max_wait_block, value, quota)
-        return self.send_raw_transaction(data)
+        if self.height_tracker is not None:
+            block_number = self.height_tracker.get(self.get_latest_block_number)
+        else:
+            block_number = self.get_latest_block_number()
+        return self.send_raw_transaction(self._make_raw_tx(private_key, to_addr, code, block_number + max_wait_block, value, quota))
 
     def deploy_contract(self, private_key: PARAM, code: PARAM, param: PARAM = b'') -> str:
         """
@@ -188,29 +679,16 @@ class CitaClient:
         """
         等待交易完成.
 
+        由receipt_watcher统一跟踪最新区块: 观察到区块h+1时, 区块h中所有等待确认的交易一起返回.
+
         :param tx_hash: 交易hash.
         :param timeout: 等待回执的时间, 单位秒. -1: 一直等待回执; 0: 无论是否达成共识, 直接返回; 其他值表示超时时间
         :return: 回执结果.
         """
-        r: Dict = {}
-        t0 = time.time()
-        r = self.get_transaction_receipt(tx_hash, 0)
-
-        # 先获得交易回执
-        while 'blockNumber' not in r:
-            time.sleep(1)
-            t1 = time.time()
-            if t1 - t0 >= timeout != -1:
-                raise RuntimeError('timeout')
-            r = self.get_transaction_receipt(tx_hash, 0)
-
-        this_block = ast.literal_eval(r['blockNumber'])
-        while self.get_latest_block_number() - this_block < 1:  # cita是先共识交易顺序, 后执行交易, 下个块公布上次答案, 所以会差1个块.
-            time.sleep(1)
-            t1 = time.time()
-            if t1 - t0 >= timeout and timeout != -1:
-                raise RuntimeError('timeout')
-        return r
+        if timeout == 0:
+            return self.get_transaction_receipt(tx_hash, 0)
+        # cita是先共识交易顺序, 后执行交易, 下个块公布上次答案, 所以会差1个块.
+        return self.receipt_watcher.wait([tx_hash], timeout, confirm=True)[0]
 
     def get_transaction_receipt(self, tx_hash: PARAM, timeout: int = -1) -> Dict:
         """
@@ -221,55 +699,87 @@ class CitaClient:
         :return: 回执结果. 如果交易还没执行且timeout=0, 则返回{}. 否则表示在pending区块中已经加入此交易, 期待共识
         """
         t0 = time.time()
+        (h,), (key,) = self._receipt_keys([tx_hash])
+        r = self._cache_get(key)
 
-        while 1:
-            r = self._jsonrpc('getTransactionReceipt', [param_to_str(tx_hash)])
-            if r is None:
-                r = {}
-            assert isinstance(r, dict)
+        while not r:
+            r = self._got_receipt(key, self._jsonrpc('getTransactionReceipt', [h]))
             if timeout == 0 or r:
                 break
 
             t1 = time.time()
             if t1 - t0 >= timeout and timeout != -1:
                 raise RuntimeError('timeout')
-            time.sleep(1)
+            time.sleep(self.poll_scheduler.next_delay(self.get_block_interval))
+        return self._check_receipt(r)
 
-        error = r.get('errorMessage')
-        if error:  # 交易失败
-            raise RuntimeError(error)
+    def get_transaction_receipts(self, tx_hash_list: Iterable[PARAM]) -> List[Dict]:
+        """
+        批量查看回执结果, 只需要一次网络往返. 不等待, 也不因交易失败抛出异常.
 
-        return r
+        :param tx_hash_list: 交易hash列表
+        :return: 与tx_hash_list一一对应的回执. 还没有回执的交易返回{}, 交易失败的原因见回执中的 ``errorMessage``
+        """
+        hashes, keys = self._receipt_keys(tx_hash_list)
+        result, missing = self._cache_many(keys)
+        receipts = self.multi_call([('getTransactionReceipt', [hashes[i]]) for i in missing])
+        return self._got_receipts(keys, result, missing, receipts)
 
-    def call_readonly_func(self, contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', from_addr: PARAM = b'') -> bytes:
+    def _call_block(self, height: Optional[int]) -> Tuple[str, Optional[int]]:
         """
-        调用合约的只读函数.
+        确定只读调用使用的区块.
+
+        :param height: 指定的区块高度, None表示按call_mode
+        :return: (JSON RPC的区块参数, 缓存使用的区块高度). 不使用缓存时, 高度为None
+        """
+        r = self._fixed_call_block(height)
+        if r is not None:
+            return r
+        return self._head_call_block(self.call_cache.tracker.get(self.get_latest_block_number))  # type: ignore
+
+    def call_readonly_func(self, contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', from_addr: PARAM = b'', height: Optional[int] = None) -> bytes:
+        """
+        调用合约的只读函数. 指定了call_cache时, 优先使用缓存的结果.
 
         :param contract_addr: 合约地址, 20字节
         :param func_addr: 合约内的函数地址, 4字节
         :param param: 合约构造函数的参数经encode_param编码后的bytes. 无参数用 b''
         :param from_addr: 调用者的地址, 默认是 b''
+        :param height: 在指定高度的区块上调用. 默认按call_mode
         :return: 返回值编码的bytes
         """
-        # 构造 CallRequest
-        to_ = param_to_str(contract_addr)
-        assert len(to_) == 40 + 2
-        req = {'to': to_}
+        req = make_call_request(contract_addr, func_addr, param, from_addr)
+        block, cache_height = self._call_block(height)
+        keys, result, missing = self._cached_calls([req], cache_height)
+        if missing:
+            self._got_calls(keys, result, missing, [self._jsonrpc('call', [req, block])], height is not None)
+        return cast(bytes, result[0])
 
-        if from_addr:
-            from_ = param_to_str(from_addr)
-            assert len(from_) == 40 + 2
-            req['from'] = from_
+    def call_readonly_funcs(self, call_list: Iterable[Tuple[PARAM, PARAM, PARAM]], from_addr: PARAM = b'', height: Optional[int] = None) -> List[bytes]:
+        """
+        批量调用合约的只读函数, 只需要一次网络往返. 指定了call_cache时, 只有没有缓存的调用会发给节点.
 
-        data = param_to_str(func_addr)
-        assert len(data) == 8 + 2
-        if param:
-            data += param_to_str(param)[2:]
-        req['data'] = data
+        :param call_list: [(合约地址, 函数地址, 编码后的参数), ...]
+        :param from_addr: 调用者的地址, 默认是 b''
+        :param height: 在指定高度的区块上调用. 默认按call_mode
+        :return: 与call_list一一对应的返回值编码的bytes
+        """
+        req_list = [make_call_request(contract_addr, func_addr, param, from_addr) for contract_addr, func_addr, param in call_list]
+        block, cache_height = self._call_block(height)
+        keys, result, missing = self._cached_calls(req_list, cache_height)
+        values = self.multi_call([('call', [req_list[i], block]) for i in missing])
+        return self._got_calls(keys, result, missing, values, height is not None)
 
-        r = self._jsonrpc('call', [req, self.call_mode])
-        assert isinstance(r, str) and r.startswith('0x')
-        return param_to_bytes(r)
+    def multicall(self, height: Optional[int] = None, from_addr: PARAM = b'', batch_size: int = 500) -> 'Multicall':
+        """
+        合并多个只读合约调用. 用法见 :class:`Multicall` .
+
+        :param height: 在指定高度的区块上调用. 默认按call_mode
+        :param from_addr: 调用者的地址, 默认是 b''
+        :param batch_size: 每个请求最多包含多少个调用
+        :return: Multicall, 在with块中使用
+        """
+        return Multicall(self, height, from_addr, batch_size)
 
     def call_func(self, private_key: PARAM, contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', quota: int = DEFAULT_QUOTA) -> str:
         """
@@ -280,7 +790,7 @@ class CitaClient:
         :param func_addr: 合约内的函数地址
         :param param: 编码后的函数参数列表
         """
-        tx_hash = self.send_transaction(private_key, contract_addr, param_to_bytes(join_param(func_addr, param)), quota=quota)
+        tx_hash = self.send_transaction(private_key, contract_addr, param_to_bytes(func_addr) + param_to_bytes(param), quota=quota)
         return tx_hash
 
     def batch_call_func(self, private_key: PARAM, tx_code_list: List[PARAM], quota: int = DEFAULT_QUOTA) -> str:
@@ -291,21 +801,22 @@ class CitaClient:
         :param tx_code_list: 由ContractClass.get_tx_code生成的交易数据.
         :return: 交易hash
         """
-        data: List[bytes] = []
-        for tx_code in tx_code_list:
-            c = param_to_bytes(tx_code)
-            assert len(c) >= 20, 'bad tx_code'
-            head, tail = c[:20], c[20:]
-            n = len(tail)
-            data += [head, n.to_bytes(4, byteorder='big'), tail]
+        return self.batch_call_func_raw(private_key, make_batch_tx_data(tx_code_list), quota=quota)
 
+    def batch_call_func_raw(self, private_key: PARAM, batch_data: bytes, quota: int = DEFAULT_QUOTA) -> str:
+        """
+        发起批量交易.
+
+        :param private_key: 私钥.
+        :param batch_data: 由make_batch_tx_data或encode_batch_calls生成的 ``multiTxs`` 参数.
+        :return: 交易hash
+        """
         # 调用 BatchTx 合约的 multiTxs 方法.
-        tx_hash = self.call_func(private_key,
-                                 BATCH_TX_ADDR,
-                                 BATCH_TX_CALL,
-                                 encode_param('bytes', b''.join(data)),
-                                 quota=quota)
-        return tx_hash
+        return self.call_func(private_key,
+                              BATCH_TX_ADDR,
+                              BATCH_TX_CALL,
+                              encode_param('bytes', batch_data),
+                              quota=quota)
 
     # def estimate_quota(self, contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', from_addr: PARAM = b'') -> int:
     #     """
@@ -343,14 +854,11 @@ class CitaClient:
         :param contract_addr: 合约地址, 20字节
         :return: 合约代码bytes
         """
-        addr = param_to_str(contract_addr)
-        assert len(addr) == 42
-        r = self._jsonrpc('getCode', [addr, self.call_mode])
-        assert isinstance(r, str) and r.startswith('0x')
-        if r == '0x':  # 合约不存在
-            return b''
-        rb = param_to_bytes(r)
-        return rb
+        addr, key = self._code_key(contract_addr)
+        r = self._cache_get(key)
+        if r is None:
+            r = self._jsonrpc('getCode', [addr, self.call_mode])
+        return self._got_code(key, r)
 
     def get_abi(self, contract_addr: PARAM) -> List:
         """
@@ -359,16 +867,8 @@ class CitaClient:
         :param contract_addr: 合约地址, 20字节
         :return: ABI的json
         """
-        addr = param_to_str(contract_addr)
-        assert len(addr) == 42
-        r = self._jsonrpc('getAbi', [addr, self.call_mode])
-        assert isinstance(r, str) and r.startswith('0x')
-        if r == '0x':  # 合约不存在或未绑定ABI
-            return []
-
-        rb = param_to_bytes(r)
-        rbs = decode_param('string', rb)
-        return json.loads(rbs)
+        addr = self._contract_addr(contract_addr)
+        return self._parse_abi_result(self._jsonrpc('getAbi', [addr, self.call_mode]))  # store_abi可以更新ABI, 所以不缓存
 
     def store_abi(self, private_key: PARAM, contract_addr: PARAM, abi: str) -> str:
         """
@@ -389,12 +889,11 @@ class CitaClient:
         :param tx_hash: 交易hash, 32字节
         :return: JSON结构的交易详情
         """
-        h = param_to_str(tx_hash)
-        assert len(h) == 64 + 2
-        r = self._jsonrpc('getTransaction', [h])
-        if not r:
-            return {}
-        return cast(Dict, r)
+        h, key = self._tx_key(tx_hash)
+        r = self._cache_get(key)
+        if r is not None:
+            return r
+        return self._got_transaction(key, self._jsonrpc('getTransaction', [h]))
 
     def get_transaction_count(self, addr: PARAM) -> int:
         """
@@ -403,14 +902,103 @@ class CitaClient:
         :param addr: 账户地址, 20字节
         :return: 交易数量
         """
-        addr_ = param_to_str(addr)
-        assert len(addr) == 40 + 2
+        return self._parse_count(self._jsonrpc('getTransactionCount', self._count_params(addr, self.call_mode)))
 
-        r = self._jsonrpc('getTransactionCount', [addr_, self.call_mode])
-        if not r or r == '0x':
-            return 0
-        assert isinstance(r, str)
-        return ast.literal_eval(r)
+    def get_logs(self, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                 from_block: Union[None, int, str] = None, to_block: Union[None, int, str] = None) -> List[Dict]:
+        """
+        查询符合条件的log.
+
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 可以是None (任意), 一个topic, 或topic的列表 (任意一个)
+        :param from_block: 起始区块高度, 或 ``latest`` , ``earliest``
+        :param to_block: 结束区块高度 (包含), 或 ``latest``
+        :return: log列表
+        """
+        r = self._jsonrpc('getLogs', [make_log_filter(address, topics, from_block, to_block)])
+        return cast(List[Dict], r)
+
+    def new_filter(self, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                   from_block: Union[None, int, str] = None, to_block: Union[None, int, str] = None) -> str:
+        """
+        在节点上创建log过滤器. 过滤器保存在节点本地, 之后对它的请求都发给同一个节点.
+
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同get_logs
+        :param from_block: 起始区块高度, 或 ``latest`` , ``earliest``
+        :param to_block: 结束区块高度 (包含), 或 ``latest``
+        :return: 过滤器id
+        """
+        node = self.nodes.candidates()[0]
+        r = self._jsonrpc('newFilter', [make_log_filter(address, topics, from_block, to_block)], node)
+        filter_id = cast(str, r)
+        self._filter_nodes[filter_id] = node
+        return filter_id
+
+    def get_filter_changes(self, filter_id: str) -> List[Dict]:
+        """
+        查询过滤器上次查询之后的新log.
+
+        :param filter_id: new_filter返回的过滤器id
+        :return: log列表
+        """
+        r = self._jsonrpc('getFilterChanges', [filter_id], self._filter_nodes.get(filter_id))
+        return cast(List[Dict], r)
+
+    def uninstall_filter(self, filter_id: str) -> bool:
+        """
+        删除过滤器.
+
+        :param filter_id: new_filter返回的过滤器id
+        :return: 是否删除成功
+        """
+        r = self._jsonrpc('uninstallFilter', [filter_id], self._filter_nodes.pop(filter_id, None))
+        return bool(r)
+
+    def iter_logs(self, start: int, end: Optional[int] = None, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                  decoder: Optional[Callable[[Dict], Any]] = None, workers: int = 4, chunk_size: int = 1000) -> LogIterator:
+        """
+        并发查询区块 [start, end) 中的log, 按区块顺序返回. 区块范围按chunk_size分段, 最多workers段同时查询.
+
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同get_logs
+        :param decoder: 解码log的函数, 比如EventDecoder. 解码结果为None的log会被丢弃
+        :param workers: 同时进行的请求数
+        :param chunk_size: 每个请求查询的区块数
+        :return: LogIterator, 返回log或解码后的事件
+        """
+        return LogIterator(self, start, end, address, topics, decoder, workers, chunk_size)
+
+    def poll_logs(self, address: Union[None, PARAM, List[PARAM]] = None, topics: Optional[List] = None,
+                  decoder: Optional[Callable[[Dict], Any]] = None, poll_interval: Optional[float] = None) -> LogPoller:
+        """
+        通过过滤器持续获取新的log. 用法见 :class:`~cita.LogPoller` .
+
+        :param address: 合约地址, 或合约地址的列表. None表示所有合约
+        :param topics: 每个位置的topic, 语义同get_logs
+        :param decoder: 解码log的函数, 比如EventDecoder. 解码结果为None的log会被丢弃
+        :param poll_interval: 轮询间隔, 单位秒. None表示根据出块间隔安排
+        :return: LogPoller, 每轮返回一批新的log或事件
+        """
+        return LogPoller(self, address, topics, decoder, poll_interval)
+
+    def follow(self, start: Optional[int] = None, cursor: Union[None, str, FileCursor] = None, tx_detail: bool = False, confirmations: int = 1,
+               workers: int = 4, batch_size: int = 10, poll_interval: Optional[float] = None) -> ChainFollower:
+        """
+        按高度顺序持续获取已确认的区块. 用法见 :class:`~cita.ChainFollower` .
+
+        :param start: 第一个区块的高度. cursor中有进度时忽略. None表示从最新的已确认区块开始
+        :param cursor: 保存进度的FileCursor, 或文件路径. None表示不保存进度
+        :param tx_detail: True 区块中会包含交易详情, 否则只包含交易hash
+        :param confirmations: 与最新区块之间保留的区块数. 默认1, 即区块h在h+1出块后返回
+        :param workers: 落后时同时进行的请求数
+        :param batch_size: 每个请求包含的区块数
+        :param poll_interval: 追上后查询新区块的间隔, 单位秒. None表示根据出块间隔安排
+        :return: ChainFollower
+        """
+        return ChainFollower(self, start, cursor, tx_detail, confirmations, workers, batch_size, poll_interval)
 
     # def decode_transaction_content(self, content: PARAM) -> Dict:
     #     """
@@ -422,14 +1010,49 @@ class CitaClient:
     #            '--content', param_to_str(content)]
     #     return json.loads(self._raw_cmd(cmd))
 
-    def decode_transaction_content(self, content: PARAM) -> Dict:
-        """
-        把交易内容解析成结构化的各个字段.
 
-        :param content: 交易内容, 就是 JSON RPC ``getTransaction`` 返回的``content``字段.
-        """
-        # TODO: 找到decode_transaction_content的对应物.
-        return decode_unverified_transaction(param_to_bytes(content))
+def make_call_request(contract_addr: PARAM, func_addr: PARAM, param: PARAM = b'', from_addr: PARAM = b'') -> Dict[str, str]:
+    """
+    构造JSON RPC ``call`` 方法的 CallRequest.
+
+    :param contract_addr: 合约地址, 20字节
+    :param func_addr: 合约内的函数地址, 4字节
+    :param param: 编码后的函数参数. 无参数用 b''
+    :param from_addr: 调用者的地址, 默认是 b''
+    :return: CallRequest
+    """
+    to_ = param_to_str(contract_addr)
+    assert len(to_) == 40 + 2
+    req = {'to': to_}
+
+    if from_addr:
+        from_ = param_to_str(from_addr)
+        assert len(from_) == 40 + 2
+        req['from'] = from_
+
+    data = param_to_str(func_addr)
+    assert len(data) == 8 + 2
+    if param:
+        data += param_to_str(param)[2:]
+    req['data'] = data
+    return req
+
+
+def make_batch_tx_data(tx_code_list: Iterable[PARAM]) -> bytes:
+    """
+    把多个tx_code打包成 BatchTx 合约 ``multiTxs`` 方法的参数.
+
+    :param tx_code_list: 由ContractProxy.get_tx_code生成的交易数据.
+    :return: 每个tx_code依次编码为 (合约地址 + 4字节的长度 + 方法地址和参数) 后拼接的bytes
+    """
+    data: List[bytes] = []
+    for tx_code in tx_code_list:
+        c = param_to_bytes(tx_code)
+        assert len(c) >= 20, 'bad tx_code'
+        head, tail = c[:20], c[20:]
+        n = len(tail)
+        data += [head, n.to_bytes(4, byteorder='big'), tail]
+    return b''.join(data)
 
 
 @dataclass
@@ -440,6 +1063,16 @@ class ABI:
     return_types: str  # 返回值
     mutable: bool  # 是否只读
     quota: int  # 调用配额
+    param_codec: ABICodec = field(init=False, repr=False, compare=False)  # 参数的编解码器
+    return_codec: ABICodec = field(init=False, repr=False, compare=False)  # 返回值的编解码器
+
+    def __post_init__(self):
+        self.param_codec = get_codec(self.param_types)
+        self.return_codec = get_codec(self.return_types)
+
+    def encode_args(self, args: Sequence) -> bytes:
+        """编码调用参数, 无参数时为 b''."""
+        return self.param_codec.encode(args) if args else b''
 
 
 class ContractClass:
@@ -459,6 +1092,7 @@ class ContractClass:
         self.client = client
         self.name, self.bytecode, self.abi = self._parse_sol_file(sol_file)
         self.func_mapping: Dict[str, ABI] = self._parse_abi(self.abi, func_name2quota if func_name2quota else {})
+        self.events: Dict[str, EventABI] = parse_events(self.abi)
 
     def get_raw_abi(self) -> str:
         """返回remix提供的原始abi."""
@@ -523,10 +1157,7 @@ class ContractClass:
         :param args: 合约构造函数的参数.
         :return: 部署交易hash.
         """
-        if args == ():
-            param = b''
-        else:
-            param = encode_param(self.func_mapping[''].param_types, args)
+        param = self.func_mapping[''].encode_args(args)
         return self.client.deploy_contract(private_key, self.bytecode, param)
 
     def instantiate(self, private_key: PARAM, *args) -> Tuple['ContractProxy', str, str]:
@@ -557,8 +1188,10 @@ class ContractClass:
 
         tx_hash_list = [self.instantiate_raw(private_key, *args if isinstance(args, tuple) else (args,)) for args in param_list]
 
-        for tx_hash in tx_hash_list:
-            r = self.client.get_transaction_receipt(tx_hash, self.client.timeout)
+        # 所有部署交易一起等待, 而不是逐个轮询
+        receipts = self.client.receipt_watcher.wait(tx_hash_list, self.client.timeout)
+
+        for tx_hash, r in zip(tx_hash_list, receipts):
             contract_addr = r['contractAddress']
             proxy = self.bind(contract_addr, private_key)
             result.append((proxy, contract_addr, tx_hash))
@@ -568,16 +1201,20 @@ class ContractClass:
         """
         绑定到一个以部署的合约地址.
 
+        合约的事件会被注册到全局的 ``event_registry`` 中.
+
         :param private_key: 用于部署合约的私钥
         :return: 合约实例的封装
         """
-        return ContractProxy(self.name, self.func_mapping, self.client, private_key, contract_addr)
+        event_registry.register(contract_addr, self.events.values())
+        return ContractProxy(self.name, self.func_mapping, self.client, private_key, contract_addr, self.events)
 
 
 class ContractProxy:
     """合约对象的代理, 用于转发函数调用. 通过proxy._ContractProxy__contract_addr可以获得合约地址."""
 
-    def __init__(self, class_name: str, func_mapping: Dict[str, ABI], client: CitaClient, private_key: PARAM, contract_addr: PARAM):
+    def __init__(self, class_name: str, func_mapping: Dict[str, ABI], client: CitaClient, private_key: PARAM, contract_addr: PARAM,
+                 events: Optional[Dict[str, EventABI]] = None):
         """
         初始化.
 
@@ -586,6 +1223,7 @@ class ContractProxy:
         :param client: CitaClient对象
         :param private_key: 私钥
         :param contract_addr: 合约部署地址, 20字节
+        :param events: 事件名和topic -> EventABI
         """
         # 注意. 使用特殊的成员变量命名方式, 尽力避免与合约方法的冲突
         self.class_name__ = class_name
@@ -593,6 +1231,7 @@ class ContractProxy:
         self.client__ = client
         self.private_key__ = private_key
         self.contract_addr__ = contract_addr
+        self.events__ = events if events is not None else {}
 
     def do_call_func__(self, func_addr: str, args):
         """
@@ -603,18 +1242,14 @@ class ContractProxy:
         :return: 对普通方法返回tx_hash, 对只读方法返回解码后的返回值.
         """
         abi = self.func_mapping__[func_addr]
-
-        if not args:
-            arg_bytes = b''
-        else:
-            arg_bytes = encode_param(abi.param_types, args)
+        arg_bytes = abi.encode_args(args)
 
         if abi.mutable:  # 普通方法调用, 返回回执哈希
             return self.client__.call_func(self.private_key__, self.contract_addr__, func_addr, param=arg_bytes, quota=abi.quota)
 
         # 只读方法调用, 返回结果
         return_bytes = self.client__.call_readonly_func(self.contract_addr__, func_addr, param=arg_bytes)
-        return decode_param(abi.return_types, return_bytes)
+        return abi.return_codec.decode(return_bytes)
 
     def get_tx_code(self, func_name_or_addr: str, args=()) -> str:
         """
@@ -625,11 +1260,55 @@ class ContractProxy:
         :return: '0x'开头的字符串, 由(合约地址 + 方法地址 + 编码后的参数)拼接而成.
         """
         abi = self.func_mapping__[func_name_or_addr]
-        if args == ():
-            arg_bytes = b''
+        return join_param(self.contract_addr__, abi.func_addr, abi.encode_args(args))
+
+    def get_batch_tx_data(self, func_name_or_addr: str, columns: Sequence[Sequence] = (), contract_addr_list: Optional[Sequence[PARAM]] = None) -> bytes:
+        """
+        按列批量编码对同一个合约方法的多次调用. 结果可以直接交给 CitaClient.batch_call_func_raw.
+
+        :param func_name_or_addr: 合约方法名或方法地址.
+        :param columns: 每个参数一列, 比如 ``(地址列表, 金额列表)`` . 可以使用numpy数组
+        :param contract_addr_list: 每个子调用的合约地址. 默认全部调用本合约
+        :return: ``multiTxs`` 方法的bytes参数
+        """
+        abi = self.func_mapping__[func_name_or_addr]
+        contract_addr = self.contract_addr__ if contract_addr_list is None else contract_addr_list
+        return encode_batch_calls(contract_addr, abi.func_addr, abi.param_types, columns)
+
+    def _event_filter__(self, event_name: Optional[str]) -> Tuple[Optional[List], EventDecoder]:
+        """按事件名生成topics, 以及本合约事件的解码器."""
+        if event_name is None:
+            topics = None
+        elif event_name in self.events__:
+            topics = [self.events__[event_name].topic]
         else:
-            arg_bytes = encode_param(abi.param_types, args)
-        return join_param(self.contract_addr__, abi.func_addr, arg_bytes)
+            raise KeyError(f'event `{event_name}` is not registered in Contract: `{self.class_name__}`')
+        return topics, EventDecoder(self.events__.values())
+
+    def iter_events__(self, start: int = 0, end: Optional[int] = None, event_name: Optional[str] = None, workers: int = 4, chunk_size: int = 1000):
+        """
+        并发查询本合约在区块 [start, end) 中的事件, 按区块顺序返回解码后的Event.
+
+        :param start: 起始区块高度
+        :param end: 结束区块高度, 不包含. None表示到开始遍历时的最新区块为止
+        :param event_name: 事件名或topic. None表示所有事件
+        :param workers: 同时进行的请求数
+        :param chunk_size: 每个请求查询的区块数
+        :return: LogIterator. 异步client返回AsyncLogIterator
+        """
+        topics, decoder = self._event_filter__(event_name)
+        return self.client__.iter_logs(start, end, self.contract_addr__, topics, decoder, workers, chunk_size)
+
+    def poll_events__(self, event_name: Optional[str] = None, poll_interval: Optional[float] = None):
+        """
+        通过过滤器持续获取本合约的新事件.
+
+        :param event_name: 事件名或topic. None表示所有事件
+        :param poll_interval: 轮询间隔, 单位秒. None表示根据出块间隔安排
+        :return: LogPoller, 每轮返回一批解码后的Event. 异步client返回AsyncLogPoller
+        """
+        topics, decoder = self._event_filter__(event_name)
+        return self.client__.poll_logs(self.contract_addr__, topics, decoder, poll_interval)
 
     def __getattr__(self, func_name_or_addr: str) -> "Functor":
         """
@@ -704,3 +1383,141 @@ class Functor:
     @quota.setter
     def quota(self, new_quota: int):
         self.proxy.func_mapping__[self.func_addr].quota = new_quota
+
+
+class Multicall:
+    """
+    把多个只读合约调用合并到一个JSON RPC batch请求中.
+
+    在with块中, 通过 ``m(proxy)`` 包装的代理调用只读方法, 或者 ``m.call(proxy.func, *args)`` , 不会立即发起调用, 而是返回Future.
+    退出with块时, 所有调用合并发送, 每个结果按各自方法的return_types解码后写入Future::
+
+        with client.multicall() as m:
+            a = m(token).balanceOf(addr1)
+            b = m.call(token.balanceOf, addr2)
+        print(a.result(), b.result())
+
+    调用数超过batch_size时分成多个请求. 此时如果没有指定高度, 会先取得最新区块高度, 保证所有调用在同一个区块上执行.
+    """
+
+    def __init__(self, client: Union[CitaClient, 'AsyncCitaClient'], height: Optional[int] = None, from_addr: PARAM = b'', batch_size: int = 500):
+        """
+        初始化.
+
+        :param client: CitaClient, AsyncMulticall使用AsyncCitaClient
+        :param height: 在指定高度的区块上调用. 默认按client的call_mode
+        :param from_addr: 调用者的地址, 默认是 b''
+        :param batch_size: 每个请求最多包含多少个调用
+        """
+        assert batch_size > 0
+        self.client = client
+        self.height = height
+        self.from_addr = from_addr
+        self.batch_size = batch_size
+        self._calls: List[Tuple[Tuple[PARAM, str, bytes], ABI, Future]] = []  # ((合约地址, 方法地址, 编码后的参数), ABI, Future)
+
+    def __call__(self, proxy: ContractProxy) -> 'MulticallProxy':
+        """
+        包装合约代理, 使其只读方法调用加入本次multicall.
+
+        :param proxy: ContractProxy
+        :return: MulticallProxy, 调用只读方法返回Future
+        """
+        return MulticallProxy(proxy.class_name__, proxy.func_mapping__, proxy.client__, proxy.private_key__, proxy.contract_addr__, self)
+
+    def call(self, functor: 'Functor', *args) -> Future:
+        """
+        加入一个只读方法调用.
+
+        :param functor: 合约方法, 如 ``proxy.balanceOf``
+        :param args: 实际参数
+        :return: 解码后的返回值的Future
+        """
+        return self.add(functor.proxy.contract_addr__, functor.proxy.func_mapping__[functor.func_addr], args)
+
+    def add(self, contract_addr: PARAM, abi: ABI, args=()) -> Future:
+        """
+        加入一个只读方法调用.
+
+        :param contract_addr: 合约地址
+        :param abi: 合约方法的ABI
+        :param args: 实际参数
+        :return: 解码后的返回值的Future
+        """
+        if abi.mutable:
+            raise ValueError(f'function `{abi.func_name}` is not read-only')
+        arg_bytes = abi.encode_args(args)
+        fut = self._new_future()
+        self._calls.append(((contract_addr, abi.func_addr, arg_bytes), abi, fut))
+        return fut
+
+    def _new_future(self):
+        return Future()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _take(self) -> List[List]:
+        """取出所有调用, 按batch_size分组."""
+        calls, self._calls = self._calls, []
+        return [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+
+    @staticmethod
+    def _settle(chunk: List, results: Optional[List[bytes]], error: Optional[BaseException]):
+        """把一组调用的结果解码后写入Future. 请求失败时, 这一组的Future都设置为同一个异常."""
+        for i, (_, abi, fut) in enumerate(chunk):
+            if fut.cancelled():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+                continue
+            try:
+                fut.set_result(abi.return_codec.decode(results[i]))  # type: ignore
+            except Exception as e:
+                fut.set_exception(e)
+
+    def execute(self):
+        """发送所有已加入的调用. 退出with块时会自动执行."""
+        chunks, height = self._take(), self.height
+        if len(chunks) > 1 and height is None and self.client.call_mode == 'latest':
+            height = self.client.get_latest_block_number()
+        for chunk in chunks:
+            try:
+                results = self.client.call_readonly_funcs([i[0] for i in chunk], self.from_addr, height)
+            except Exception as e:
+                self._settle(chunk, None, e)
+            else:
+                self._settle(chunk, results, None)
+
+    def cancel(self):
+        """放弃所有还没有发送的调用."""
+        calls, self._calls = self._calls, []
+        for _, _, fut in calls:
+            fut.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        else:
+            self.cancel()
+
+
+class MulticallProxy(ContractProxy):
+    """由Multicall包装的合约代理. 只读方法调用返回Future, 不能调用普通方法."""
+
+    def __init__(self, class_name: str, func_mapping: Dict[str, ABI], client: CitaClient, private_key: PARAM, contract_addr: PARAM, multicall: Multicall):
+        super().__init__(class_name, func_mapping, client, private_key, contract_addr)
+        self.multicall__ = multicall
+
+    def do_call_func__(self, func_addr: str, args):
+        """
+        把只读方法调用加入multicall.
+
+        :param func_addr: 合约方法地址.
+        :param args: 参数, 需配合合约方法的 param_type.
+        :return: 解码后的返回值的Future
+        """
+        return self.multicall__.add(self.contract_addr__, self.func_mapping__[func_addr], args)
@@ -0,0 +1,172 @@
+"""
+本地的区块和回执存储.
+"""
+from typing import Dict, List, Tuple, Optional, Any, Iterable, TYPE_CHECKING
+import threading
+import sqlite3
+import json
+
+from .cache import DataCacheBase
+
+if TYPE_CHECKING:
+    from .sdk import CitaClient
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS transactions (hash TEXT PRIMARY KEY, height INTEGER NOT NULL, idx INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS receipts (hash TEXT PRIMARY KEY, height INTEGER NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+'''
+
+
+class ChainStore(DataCacheBase):
+    """
+    保存在sqlite文件中的区块, 交易和回执.
+
+    :meth:`sync` 从上次同步到的高度开始, 增量获取新区块 (包含交易详情) 和其中所有交易的回执.
+    每一批区块和回执与同步进度在同一个事务中写入, 中断后再次同步会从断点继续.
+
+    作为CitaClient的data_cache时, get_block_by_number, get_block_by_hash, get_blocks_by_number,
+    get_transaction, get_transaction_receipt(s) 优先从这里读取已同步的数据. 存储只由sync写入, 其他查询结果不会保存.
+    """
+
+    def __init__(self, path: str):
+        """
+        打开或创建存储.
+
+        :param path: sqlite文件的路径
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    @property
+    def height(self) -> int:
+        """已经同步到的区块高度. -1表示还没有同步."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'height'").fetchone()
+        return -1 if row is None else int(row[0])
+
+    def sync(self, client: 'CitaClient', end: Optional[int] = None, confirmations: int = 1, workers: int = 4, batch_size: int = 20) -> int:
+        """
+        增量同步区块和回执.
+
+        cita中区块h的交易结果在区块h+1出块后才能确定, 所以默认只同步到最新区块的前一个区块.
+
+        :param client: CitaClient
+        :param end: 同步到哪个高度为止, 包含. None表示同步到最新区块之前confirmations个区块
+        :param confirmations: 与最新区块之间保留的区块数
+        :param workers: 同时获取区块的请求数
+        :param batch_size: 每个请求包含的区块数, 也是每次写入的区块数
+        :return: 本次同步的区块数
+        """
+        target = client.get_latest_block_number() - confirmations
+        if end is not None:
+            target = min(target, end)
+        start = self.height + 1
+        if target < start:
+            return 0
+
+        blocks: List[Dict] = []
+        for block in client.iter_blocks(start, target + 1, tx_detail=True, workers=workers, batch_size=batch_size):
+            blocks.append(block)
+            if len(blocks) >= batch_size:
+                self._write(blocks, client)
+                blocks = []
+        if blocks:
+            self._write(blocks, client)
+        return target - start + 1
+
+    def _write(self, blocks: List[Dict], client: 'CitaClient'):
+        """获取一批区块中所有交易的回执, 与区块一起写入, 并更新同步进度."""
+        block_rows: List[Tuple[int, str, str]] = []
+        tx_rows: List[Tuple[str, int, int]] = []
+        for block in blocks:
+            height = int(block['header']['number'], 16)
+            block_rows.append((height, block['hash'].lower(), json.dumps(block, separators=(',', ':'))))
+            tx_rows += [(tx['hash'].lower(), height, i) for i, tx in enumerate(block['body']['transactions'])]
+
+        receipt_rows: List[Tuple[str, int, str]] = []
+        if tx_rows:
+            receipts = client.get_transaction_receipts([h for h, _, _ in tx_rows])
+            for (h, height, _), r in zip(tx_rows, receipts):
+                if not r:
+                    raise RuntimeError(f'receipt of {h} not found')
+                receipt_rows.append((h, height, json.dumps(r, separators=(',', ':'))))
+
+        with self._lock:
+            with self._db:  # 一个事务
+                self._db.executemany('INSERT OR REPLACE INTO blocks (height, hash, data) VALUES (?, ?, ?)', block_rows)
+                self._db.executemany('INSERT OR REPLACE INTO transactions (hash, height, idx) VALUES (?, ?, ?)', tx_rows)
+                self._db.executemany('INSERT OR REPLACE INTO receipts (hash, height, data) VALUES (?, ?, ?)', receipt_rows)
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('height', ?)", (str(block_rows[-1][0]),))
+
+    def get_block(self, height: int) -> Optional[Dict]:
+        """
+        读取区块, 包含交易详情.
+
+        :param height: 区块高度
+        :return: 区块详情, 没有同步时返回None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT data FROM blocks WHERE height = ?', (height,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_receipt(self, tx_hash: str) -> Optional[Dict]:
+        """
+        读取回执.
+
+        :param tx_hash: 交易hash, '0x'开头
+        :return: 回执, 没有同步时返回None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT data FROM receipts WHERE hash = ?', (tx_hash.lower(),)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_transaction(self, tx_hash: str) -> Optional[Dict]:
+        """
+        读取交易详情, 格式与 ``getTransaction`` 相同.
+
+        :param tx_hash: 交易hash, '0x'开头
+        :return: 交易详情, 没有同步时返回None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT height, idx FROM transactions WHERE hash = ?', (tx_hash.lower(),)).fetchone()
+        if row is None:
+            return None
+        block = self.get_block(row[0])
+        tx = dict(block['body']['transactions'][row[1]])  # type: ignore
+        tx.update(blockNumber=block['header']['number'], blockHash=block['hash'], index=hex(row[1]))  # type: ignore
+        return tx
+
+    def get(self, key: str) -> Optional[Any]:
+        kind, _, rest = key.partition(':')
+        if kind in ('block', 'blockhash'):
+            ident, _, tx_detail = rest.rpartition(':')
+            if kind == 'block':
+                block = self.get_block(int(ident))
+            else:
+                with self._lock:
+                    row = self._db.execute('SELECT data FROM blocks WHERE hash = ?', (ident,)).fetchone()
+                block = None if row is None else json.loads(row[0])
+            if block is not None and tx_detail == '0':
+                block['body']['transactions'] = [tx['hash'] for tx in block['body']['transactions']]
+            return block
+        if kind == 'tx':
+            return self.get_transaction(rest)
+        if kind == 'receipt':
+            return self.get_receipt(rest)
+        return None
+
+    def put(self, key: str, value: Any):
+        pass
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,162 @@
+"""
+链上状态的本地跟踪.
+"""
+from typing import Callable, Optional, Iterable, Dict
+import threading
+import random
+import time
+
+
+class BlockHeightTracker:
+    """
+    缓存最新区块高度.
+
+    计算交易的 ``valid_until_block`` 只需要大致准确的区块高度, 没必要每次发送交易前都调用 ``blockNumber`` .
+    缓存在ttl秒内有效, 过期后由第一个调用者刷新. 另外, 回执中的区块高度也会用来推进缓存.
+    同一条链上的多个CitaClient可以共享一个tracker.
+    """
+
+    def __init__(self, ttl: float = 3.0):
+        """
+        初始化.
+
+        :param ttl: 缓存的有效期, 单位秒. 建议设置为出块间隔
+        """
+        self.ttl = ttl
+        self.height = -1
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        """缓存是否已经过期."""
+        return self.height < 0 or time.monotonic() - self.updated_at >= self.ttl
+
+    def update(self, height: int):
+        """
+        记录从 ``blockNumber`` 获得的最新区块高度, 并重新开始计算有效期.
+
+        :param height: 最新区块高度
+        """
+        with self._lock:
+            self.height = max(self.height, height)
+            self.updated_at = time.monotonic()
+
+    def observe(self, height: int):
+        """
+        记录从回执等途径观察到的区块高度. 只有高度增长时才会推进缓存.
+
+        :param height: 观察到的区块高度
+        """
+        with self._lock:
+            if height > self.height:
+                self.height = height
+                self.updated_at = time.monotonic()
+
+    def get(self, fetch: Callable[[], int]) -> int:
+        """
+        获取缓存的区块高度. 如果缓存过期, 调用fetch刷新. 多个线程同时发现过期时, 只会刷新一次.
+
+        :param fetch: 获取最新区块高度的函数
+        :return: 区块高度
+        """
+        if self.expired:
+            with self._refresh_lock:
+                if self.expired:
+                    self.update(fetch())
+        return self.height
+
+
+class PollScheduler:
+    """
+    根据出块间隔安排轮询时间.
+
+    等待回执和区块高度时, 固定每秒轮询一次, 出块快时会增加延迟, 出块慢时会浪费RPC.
+    scheduler记录观察到新区块的时刻, 在预计下一个区块出块后稍晚一点轮询. 如果到时没有出块, 从min_delay开始指数退避, 最长不超过一个出块间隔.
+    所有延迟都加入随机抖动, 避免多个client同时轮询.
+    """
+
+    def __init__(self, interval: Optional[float] = None, min_delay: float = 0.05, margin: float = 0.1, jitter: float = 0.1, alpha: float = 0.2):
+        """
+        初始化.
+
+        :param interval: 出块间隔, 单位秒. None表示由client从 ``getMetaData`` 的 ``blockInterval`` 获取
+        :param min_delay: 最短的轮询延迟, 单位秒
+        :param margin: 预计出块后再等待的时间, 占出块间隔的比例
+        :param jitter: 随机抖动的幅度, 占延迟的比例
+        :param alpha: 用区块时间戳更新出块间隔时, 指数加权平均的权重
+        """
+        self.interval = interval
+        self.min_delay = min_delay
+        self.margin = margin
+        self.jitter = jitter
+        self.alpha = alpha
+        self.height = -1
+        self.seen_at = 0.0  # 观察到self.height的时刻
+        self.misses = 0  # 预计出块后, 连续没有观察到新区块的次数
+        self._lock = threading.Lock()
+
+    def set_interval(self, interval: float):
+        """
+        设置出块间隔.
+
+        :param interval: 出块间隔, 单位秒
+        """
+        assert interval > 0
+        self.interval = interval
+
+    def observe(self, height: int):
+        """
+        记录观察到的最新区块高度.
+
+        :param height: 最新区块高度
+        """
+        with self._lock:
+            if height > self.height:
+                self.height = height
+                self.seen_at = time.monotonic()
+                self.misses = 0
+
+    def observe_blocks(self, blocks: Iterable[Dict]):
+        """
+        用连续区块的时间戳修正出块间隔.
+
+        :param blocks: 按高度排列的区块详情
+        """
+        prev = None
+        for block in blocks:
+            header = block['header']
+            if prev is not None and int(header['number'], 16) == int(prev['number'], 16) + 1:
+                gap = (header['timestamp'] - prev['timestamp']) / 1000
+                if gap > 0:
+                    with self._lock:
+                        self.interval = gap if self.interval is None else self.interval + self.alpha * (gap - self.interval)
+            prev = header
+
+    def next_delay(self, fetch_interval: Optional[Callable[[], float]] = None) -> float:
+        """
+        计算到下一次轮询的延迟.
+
+        :param fetch_interval: 出块间隔未知时, 用来获取出块间隔的函数. 不指定时按1秒计算
+        :return: 延迟, 单位秒
+        """
+        if self.interval is None and fetch_interval is not None:
+            try:
+                self.set_interval(fetch_interval())
+            except Exception:  # 获取失败 (RPC错误, 连接失败, 返回格式不对等) 时按1秒计算, 之后由区块时间戳修正
+                self.set_interval(1.0)
+        interval = self.interval if self.interval is not None else 1.0
+
+        with self._lock:
+            now = time.monotonic()
+            expected = self.seen_at + interval
+            if self.height < 0:  # 还没有观察到区块, 按出块间隔轮询
+                delay = interval
+            elif now < expected:  # 在预计出块后稍晚一点轮询
+                delay = expected - now + self.margin * interval
+            else:  # 区块晚了, 指数退避
+                delay = min(interval, self.min_delay * 2 ** self.misses)
+                self.misses += 1
+        delay = max(self.min_delay, delay)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
@@ -0,0 +1,133 @@
+"""
+JSON RPC的传输层.
+
+CitaClient只负责组装和解析JSON RPC报文, 报文的收发交给Transport完成. 可以替换为自定义的实现, 比如加入代理, 鉴权等.
+"""
+from typing import Tuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # 只有AsyncHttpTransport需要aiohttp
+    aiohttp = None
+
+
+class TransportBase:
+    """传输层的接口定义."""
+
+    def post(self, url: str, data: bytes, timeout: float) -> Tuple[int, bytes]:
+        """
+        发送一次HTTP POST请求.
+
+        :param url: cita后端服务的url
+        :param data: 编码后的请求体
+        :param timeout: 超时时间, 单位秒
+        :return: (HTTP状态码, 响应体)
+        """
+        raise NotImplementedError('virtual method')
+
+    def close(self):
+        """释放传输层持有的资源, 比如连接池."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HttpTransport(TransportBase):
+    """基于 ``requests.Session`` 的传输层, 复用TCP连接, 避免每次调用都重新握手."""
+
+    def __init__(self, pool_size: int = 10, max_hosts: int = 10, pool_block: bool = False, keep_alive: bool = True, max_retries: int = 0):
+        """
+        初始化连接池.
+
+        :param pool_size: 每个节点(host)最多保持的连接数
+        :param max_hosts: 最多缓存多少个节点(host)的连接池
+        :param pool_block: True 连接数达到pool_size后, 新请求会等待空闲连接; False 临时创建连接, 用完即关闭
+        :param keep_alive: 是否使用HTTP长连接. False 每次请求后关闭连接
+        :param max_retries: 建立连接失败时的重试次数
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, pool_block=pool_block, max_retries=max_retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Content-Type'] = 'application/json'
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def post(self, url: str, data: bytes, timeout: float) -> Tuple[int, bytes]:
+        resp = self.session.post(url, data=data, timeout=timeout)
+        return resp.status_code, resp.content
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncTransportBase:
+    """异步传输层的接口定义."""
+
+    async def post(self, url: str, data: bytes, timeout: float) -> Tuple[int, bytes]:
+        """
+        发送一次HTTP POST请求.
+
+        :param url: cita后端服务的url
+        :param data: 编码后的请求体
+        :param timeout: 超时时间, 单位秒
+        :return: (HTTP状态码, 响应体)
+        """
+        raise NotImplementedError('virtual method')
+
+    async def close(self):
+        """释放传输层持有的资源, 比如连接池."""
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class AsyncHttpTransport(AsyncTransportBase):
+    """基于 ``aiohttp`` 的异步传输层. 同一个事件循环中的所有请求共享一个连接池."""
+
+    def __init__(self, pool_size: int = 100, pool_size_per_host: int = 0, keep_alive: bool = True, keepalive_timeout: float = 15):
+        """
+        初始化连接池. 连接池在第一次请求时, 于当前事件循环中创建.
+
+        :param pool_size: 最多同时打开的连接数, 0表示不限制
+        :param pool_size_per_host: 每个节点(host)最多同时打开的连接数, 0表示不限制
+        :param keep_alive: 是否使用HTTP长连接. False 每次请求后关闭连接
+        :param keepalive_timeout: 空闲连接的保持时间, 单位秒
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncHttpTransport requires aiohttp. Try `pip install cita_sdk_python[async]`')
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keep_alive = keep_alive
+        self.keepalive_timeout = keepalive_timeout
+        self.session: Optional['aiohttp.ClientSession'] = None
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                             limit_per_host=self.pool_size_per_host,
+                                             force_close=not self.keep_alive,
+                                             keepalive_timeout=self.keepalive_timeout if self.keep_alive else None)
+            self.session = aiohttp.ClientSession(connector=connector, headers={'Content-Type': 'application/json'})
+        return self.session
+
+    async def post(self, url: str, data: bytes, timeout: float) -> Tuple[int, bytes]:
+        session = self._get_session()
+        async with session.post(url, data=data, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            return resp.status, await resp.read()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -1,9 +1,12 @@
 """
 定义一些基础工具.
 """
-from typing import Union, List
+from typing import Union, List, Optional, Callable, Tuple, Any
 from binascii import hexlify, unhexlify
-from eth_abi import encode_single, decode_single
+from functools import lru_cache
+import re
+from eth_abi.registry import registry as abi_registry
+from eth_abi.decoding import ContextFramesBytesIO
 
 
 PARAM = Union[str, bytes]  # 用于CitaClient方法的参数类型. 如果是str, 默认都具有'0x'前缀
@@ -53,6 +56,236 @@ def equal_param(lhs: PARAM, rhs: PARAM) -> bool:
     return param_to_bytes(lhs) == param_to_bytes(rhs)
 
 
+_STATIC_TYPE = re.compile(r'(uint|int)(\d*)|address|bool|bytes(\d+)')
+_UINT, _INT, _ADDRESS, _BOOL, _BYTES = range(5)
+
+
+class StaticCodec:
+    """
+    全部由静态基本类型 (uint<N>, int<N>, address, bool, bytes<N>) 组成的参数的快速编解码.
+
+    每个参数固定占用32字节, 直接用 ``int.to_bytes`` 写入预先分配的bytearray, 不经过eth_abi.
+    遇到快速路径不确定的输入 (比如类型不符, 越界, 大小写混合的地址) 时返回None, 由调用方退回eth_abi处理, 从而保证结果与报错都与eth_abi一致.
+    """
+
+    def __init__(self, fields: List[Tuple[int, int]]):
+        """
+        初始化.
+
+        :param fields: 每个参数的 (类型, 位数或字节数)
+        """
+        self.fields = fields
+        self.size = 32 * len(fields)
+
+    @staticmethod
+    def parse(types: str) -> Optional['StaticCodec']:
+        """
+        解析类型字符串.
+
+        :param types: 类型字符串, 如 ``uint256`` 或 ``(address,uint256)``
+        :return: 如果全部是静态基本类型, 返回StaticCodec, 否则返回None
+        """
+        if types[:1] == '(' and types[-1:] == ')':
+            types = types[1:-1]
+        if not types:
+            return None
+
+        fields: List[Tuple[int, int]] = []
+        for t in types.split(','):
+            m = _STATIC_TYPE.fullmatch(t)
+            if m is None:
+                return None
+            if m.group(1):
+                bits = int(m.group(2) or 256)
+                if bits % 8 or not 8 <= bits <= 256 or m.group(2)[:1] == '0':
+                    return None
+                fields.append((_UINT if m.group(1) == 'uint' else _INT, bits))
+            elif t == 'address':
+                fields.append((_ADDRESS, 20))
+            elif t == 'bool':
+                fields.append((_BOOL, 1))
+            else:
+                n = int(m.group(3))
+                if not 1 <= n <= 32 or m.group(3)[0] == '0':
+                    return None
+                fields.append((_BYTES, n))
+        return StaticCodec(fields)
+
+    def encode(self, values: tuple) -> Optional[bytes]:
+        """
+        编码参数.
+
+        :param values: 参数的tuple
+        :return: 编码后的bytes. 如果需要由eth_abi处理, 返回None
+        """
+        buf = bytearray(self.size)
+        if not self.encode_into(buf, 0, values):
+            return None
+        return bytes(buf)
+
+    def encode_into(self, buf: bytearray, pos: int, values: tuple) -> bool:
+        """
+        把参数编码后写入buf. buf中对应的区域必须已经填充为0.
+
+        :param buf: 目标缓冲区
+        :param pos: 写入的起始位置
+        :param values: 参数的tuple
+        :return: 是否写入成功. 如果需要由eth_abi处理, 返回False, 此时buf中的数据不完整
+        """
+        if len(values) != len(self.fields):
+            return False
+
+        for (kind, size), v in zip(self.fields, values):
+            if kind == _UINT:
+                if type(v) is not int or v < 0 or v >> size:
+                    return False
+                buf[pos:pos + 32] = v.to_bytes(32, 'big')
+            elif kind == _INT:
+                if type(v) is not int or not -(1 << (size - 1)) <= v < (1 << (size - 1)):
+                    return False
+                buf[pos:pos + 32] = v.to_bytes(32, 'big', signed=True)
+            elif kind == _ADDRESS:
+                if type(v) is bytes:
+                    if len(v) != 20:
+                        return False
+                    buf[pos + 12:pos + 32] = v
+                elif type(v) is str and len(v) == 42 and v[:2] == '0x':
+                    h = v[2:]
+                    if h != h.lower() and h != h.upper():  # 大小写混合的地址需要eth_abi检查checksum
+                        return False
+                    try:
+                        b = bytes.fromhex(h)
+                    except ValueError:
+                        return False
+                    if len(b) != 20:
+                        return False
+                    buf[pos + 12:pos + 32] = b
+                else:
+                    return False
+            elif kind == _BOOL:
+                if type(v) is not bool:
+                    return False
+                buf[pos + 31] = v
+            else:
+                if type(v) is not bytes or len(v) > size:
+                    return False
+                buf[pos:pos + len(v)] = v
+            pos += 32
+        return True
+
+    def decode(self, bin: bytes) -> Optional[tuple]:
+        """
+        解码返回值.
+
+        :param bin: 编码后的bytes
+        :return: 解码后的tuple. 如果需要由eth_abi处理 (比如数据不足或填充位不为0), 返回None
+        """
+        if len(bin) < self.size:
+            return None
+
+        ret: List[Any] = []
+        pos = 0
+        for kind, size in self.fields:
+            word = bin[pos:pos + 32]
+            if kind == _UINT:
+                v = int.from_bytes(word, 'big')
+                if v >> size:
+                    return None
+                ret.append(v)
+            elif kind == _INT:
+                v = int.from_bytes(word, 'big', signed=True)
+                if not -(1 << (size - 1)) <= v < (1 << (size - 1)):
+                    return None
+                ret.append(v)
+            elif kind == _ADDRESS:
+                if any(word[:12]):
+                    return None
+                ret.append('0x' + word[12:].hex())
+            elif kind == _BOOL:
+                v = int.from_bytes(word, 'big')
+                if v > 1:
+                    return None
+                ret.append(v == 1)
+            else:
+                if any(word[size:]):
+                    return None
+                ret.append(word[:size])
+            pos += 32
+        return tuple(ret)
+
+
+class ABICodec:
+    """
+    一组ABI类型的编解码器.
+
+    类型字符串只在第一次使用时解析一次, 之后的编码解码直接调用eth_abi的encoder/decoder, 不再处理类型字符串.
+    如果全部参数都是静态基本类型, 优先使用StaticCodec.
+    """
+
+    def __init__(self, types: str):
+        """
+        初始化.
+
+        :param types: 类型字符串, 如 ``uint256`` 或 ``(int,bool)`` , 语义同encode_param
+        """
+        self.types = types
+        self.static = StaticCodec.parse(types)
+        self._encoder: Optional[Callable] = None
+        self._decoder: Optional[Callable] = None
+
+    def encode(self, values) -> bytes:
+        r"""
+        返回参数编码后的字符串.
+
+        :param values: 参考encode_param
+        :return: 如b'\x0b\xad\xf0\x0d'...
+        """
+        if not self.types:
+            return b''
+
+        if not isinstance(values, tuple):
+            values = (values,)
+
+        if self.static is not None:
+            r = self.static.encode(values)
+            if r is not None:
+                return r
+
+        if self._encoder is None:
+            self._encoder = abi_registry.get_encoder(self.types if self.types[0] == '(' else f'({self.types})')
+        return self._encoder(values)
+
+    def decode(self, bin: bytes):
+        """
+        返回解码后的python类型的数据.
+
+        :param bin: 参考decode_param
+        :return: python类型的数据. 如果包含2个以上的值, 返回Tuple. 如果只有一个值, 则解开Tuple
+        """
+        if not isinstance(bin, bytes):
+            raise TypeError(f'the bin must be bytes, got {type(bin)}')
+
+        ret = self.static.decode(bin) if self.static is not None else None
+        if ret is None:
+            if self._decoder is None:
+                self._decoder = abi_registry.get_decoder(self.types if self.types and self.types[0] == '(' else f'({self.types})')
+            ret = self._decoder(ContextFramesBytesIO(bin))
+        if len(ret) == 0:
+            return ()
+        return ret if len(ret) >= 2 else ret[0]
+
+
+@lru_cache(maxsize=1024)
+def get_codec(types: str) -> ABICodec:
+    """
+    获取类型字符串对应的编解码器. 最近使用的1024个编解码器会被缓存.
+
+    :param types: 类型字符串, 如 ``uint256`` 或 ``(int,bool)``
+    :return: ABICodec
+    """
+    return ABICodec(types)
+
+
 def encode_param(types: str, values) -> bytes:
     r"""
     返回参数编码后的字符串.
@@ -60,16 +293,7 @@ def encode_param(types: str, values) -> bytes:
     :param types, values: 参考eth_abi.encode_single的文档.
     :return: 如b'\x0b\xad\xf0\x0d'...
     """
-    if not types:
-        return b''
-
-    if types[0] != '(':
-        types = f'({types})'
-
-    if isinstance(values, tuple):
-        return encode_single(types, values)
-    else:
-        return encode_single(types, (values,))
+    return get_codec(types).encode(values)
 
 
 def decode_param(types: str, bin: bytes):
@@ -79,9 +303,4 @@ def decode_param(types: str, bin: bytes):
     :param types, values: 参考eth_abi.decode_single的文档
     :return: python类型的数据. 如果包含2个以上的值, 返回Tuple. 如果只有一个值, 则解开Tuple
     """
-    if (not types) or types[0] != '(':
-        types = f'({types})'
-    ret = decode_single(types, bin)
-    if len(ret) == 0:
-        return ()
-    return ret if len(ret) >= 2 else ret[0]
+    return get_codec(types).decode(bin)
@@ -0,0 +1,462 @@
+"""
+批量等待交易回执.
+"""
+from typing import Any, Dict, List, Set, Tuple, Iterable, Optional, Union, TYPE_CHECKING
+from concurrent.futures import Future, TimeoutError
+import asyncio
+import threading
+import time
+import ast
+
+from .util import PARAM, param_to_str
+
+if TYPE_CHECKING:
+    from .sdk import CitaClient
+    from .async_sdk import AsyncCitaClient
+
+
+class ReceiptWatcher:
+    """
+    同时等待多个交易的回执.
+
+    所有待确认的交易共享一个后台轮询线程. 每一轮只查询一次最新区块高度, 出现新区块时批量获取这些区块的交易列表,
+    只对出现在区块中的交易批量查询回执. 因此等待的开销与区块数成正比, 而不是与交易数成正比.
+    刚加入的交易会先批量查询一次回执, 以免错过加入之前已经上链的交易.
+
+    cita是先共识交易顺序, 后执行交易, 区块h中交易的结果在区块h+1出块后才能确定.
+    需要确认的交易拿到回执后, 按区块分组, 观察到区块h+1时, 区块h中的所有交易一起确认.
+    """
+
+    def __init__(self, client: Union['CitaClient', 'AsyncCitaClient'], poll_interval: Optional[float] = None, max_scan_blocks: int = 32, max_errors: int = 5):
+        """
+        初始化.
+
+        :param client: CitaClient, AsyncReceiptWatcher使用AsyncCitaClient
+        :param poll_interval: 轮询间隔, 单位秒. None表示由client.poll_scheduler根据出块间隔安排
+        :param max_scan_blocks: 一轮中最多扫描的区块数. 新区块更多时, 直接批量查询所有待确认交易的回执
+        :param max_errors: 连续多少轮RPC失败后, 把错误报告给所有等待的调用方. 之前的失败只会在下一轮重试
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self.max_scan_blocks = max_scan_blocks
+        self.max_errors = max_errors
+        self.errors = 0  # 连续失败的轮数
+        self.height = -1  # 已经扫描过的区块高度
+        self._pending: Dict[str, Future] = {}  # 交易hash -> 回执的Future, 由所有等待这个交易的调用方共享
+        self._waiters: Dict[str, int] = {}  # 交易hash -> 等待的调用方个数. 减为0时不再查询这个交易
+        self._unchecked: Set[str] = set()  # 还没有直接查询过回执的交易hash
+        self._confirming: Dict[int, List[Tuple[Future, Dict]]] = {}  # 区块高度 -> 等待下一个区块的 (Future, 回执)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._runner: Optional[Any] = None  # 轮询线程, AsyncReceiptWatcher中是轮询任务
+        self._closed = False
+
+    def watch(self, tx_hash: PARAM, confirm: bool = False) -> Future:
+        """
+        等待一个交易的回执.
+
+        :param tx_hash: 交易hash
+        :param confirm: True 等到交易所在区块的下一个区块出块, 即交易结果确定之后, 才返回回执
+        :return: 回执的Future. 交易失败时, Future的异常为RuntimeError(errorMessage). 可以用 ``add_done_callback`` 注册回调.
+                 每次调用返回独立的Future, cancel只表示调用方不再等待, 不影响其他等待同一个交易的调用方
+        """
+        fut = self._watch(param_to_str(tx_hash).lower())  # 区块中的交易hash是小写的
+        if not confirm:
+            return fut
+
+        confirmed = self._new_future()
+
+        def on_receipt(f: Future):
+            if confirmed.done():  # 调用方已经cancel
+                return
+            if f.cancelled():
+                confirmed.cancel()
+            elif f.exception() is not None:
+                confirmed.set_exception(f.exception())
+            else:
+                r = f.result()
+                block = ast.literal_eval(r['blockNumber'])
+                with self._lock:
+                    if block >= self.height:
+                        self._confirming.setdefault(block, []).append((confirmed, r))
+                        return
+                confirmed.set_result(r)
+
+        def on_cancel(f: Future):
+            if f.cancelled():  # 还在等待回执时, 撤销登记
+                fut.cancel()
+
+        fut.add_done_callback(on_receipt)
+        confirmed.add_done_callback(on_cancel)
+        return confirmed
+
+    def _new_future(self) -> Future:
+        return Future()
+
+    def _start(self):
+        """启动轮询. 调用时持有_lock."""
+        self._runner = threading.Thread(target=self._run, name='cita-receipt-watcher', daemon=True)
+        self._runner.start()
+
+    def _wake(self):
+        """唤醒轮询, 尽快查询新加入的交易."""
+        self._wakeup.set()
+
+    def _watch(self, key: str) -> Future:
+        """登记一个调用方, 返回只属于这个调用方的Future. 它被cancel时撤销登记."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('watcher is closed')
+            shared = self._pending.get(key)
+            if shared is None:
+                shared = self._pending[key] = self._new_future()
+                self._unchecked.add(key)
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+            if self._runner is None:
+                self._start()
+        self._wake()
+
+        fut = self._new_future()
+
+        def forward(f: Future):
+            if fut.done():  # 调用方已经cancel
+                return
+            if f.cancelled():
+                fut.cancel()
+            elif f.exception() is not None:
+                fut.set_exception(f.exception())
+            else:
+                fut.set_result(f.result())
+
+        def on_cancel(f: Future):
+            if f.cancelled():
+                self._release(key)
+
+        fut.add_done_callback(on_cancel)
+        shared.add_done_callback(forward)
+        return fut
+
+    def _release(self, key: str):
+        """撤销一个调用方的登记. 没有调用方等待时, 不再查询这个交易."""
+        with self._lock:
+            n = self._waiters.get(key, 0) - 1
+            if n > 0:
+                self._waiters[key] = n
+                return
+            self._waiters.pop(key, None)
+            shared = self._pending.pop(key, None)
+            self._unchecked.discard(key)
+        if shared is not None:
+            shared.cancel()
+
+    def wait(self, tx_hash_list: Iterable[PARAM], timeout: float = -1, confirm: bool = False) -> List[Dict]:
+        """
+        等待多个交易的回执.
+
+        :param tx_hash_list: 交易hash列表
+        :param timeout: 等待所有回执的时间, 单位秒. -1: 一直等待
+        :param confirm: True 等待交易结果确定
+        :return: 与tx_hash_list一一对应的回执
+        """
+        futures = [self.watch(tx_hash, confirm) for tx_hash in tx_hash_list]
+        deadline = None if timeout == -1 else time.monotonic() + timeout
+        result: List[Dict] = []
+        for fut in futures:
+            try:
+                result.append(fut.result(None if deadline is None else max(0.0, deadline - time.monotonic())))
+            except TimeoutError:
+                for f in futures:  # 不再等待, 没有其他调用方等待的交易不再查询
+                    f.cancel()
+                raise RuntimeError('timeout')
+        return result
+
+    def close(self):
+        """停止轮询, 取消所有还在等待的Future."""
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+            confirming, self._confirming = self._confirming, {}
+            self._waiters.clear()
+            thread = self._runner
+        self._cancel_all(pending, confirming)
+        self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    @staticmethod
+    def _cancel_all(pending: Dict[str, Future], confirming: Dict[int, List[Tuple[Future, Dict]]]):
+        for fut in pending.values():
+            fut.cancel()
+        for waiters in confirming.values():
+            for fut, _ in waiters:
+                fut.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _idle(self) -> bool:
+        """清理已经cancel的确认请求. 没有需要等待的交易时返回True, 轮询结束."""
+        with self._lock:
+            for block in list(self._confirming):
+                self._confirming[block] = [i for i in self._confirming[block] if not i[0].cancelled()]
+                if not self._confirming[block]:
+                    del self._confirming[block]
+            if self._closed or not (self._pending or self._confirming):
+                self._runner = None
+                return True
+            return False
+
+    def _poll_failed(self, error: Exception):
+        """偶尔的失败在下一轮重试, 连续失败时报告给调用方."""
+        self.errors += 1
+        if self.errors >= self.max_errors:
+            self.errors = 0
+            self._fail(error)
+
+    def _run(self):
+        client: 'CitaClient' = self.client  # type: ignore
+        try:
+            while not self._idle():
+                try:
+                    self._poll()
+                    self.errors = 0
+                except Exception as e:
+                    self._poll_failed(e)
+
+                try:
+                    if self.poll_interval is not None:
+                        delay = self.poll_interval
+                    else:
+                        delay = client.poll_scheduler.next_delay(client.get_block_interval)
+                except Exception:
+                    delay = 1.0
+                self._wakeup.wait(delay)  # watch()会提前唤醒, 尽快查询新加入的交易
+                self._wakeup.clear()
+        finally:  # 线程意外退出时, 之后的watch()会重新启动线程
+            with self._lock:
+                if self._runner is threading.current_thread():
+                    self._runner = None
+
+    def _fail(self, error: Exception):
+        """把错误报告给所有等待的调用方."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            confirming, self._confirming = self._confirming, {}
+            self._unchecked.clear()
+            self._waiters.clear()
+        futures = list(pending.values()) + [fut for waiters in confirming.values() for fut, _ in waiters]
+        for fut in futures:
+            if not fut.done():
+                fut.set_exception(error)
+
+    def _take_unchecked(self) -> List[str]:
+        with self._lock:
+            found = list(self._unchecked)
+            self._unchecked.clear()
+        return found
+
+    def _put_back(self, found: List[str]):
+        """查询失败时, 下一轮重新查询这些交易."""
+        with self._lock:
+            self._unchecked.update(key for key in found if key in self._pending)
+
+    def _poll(self):
+        """一轮轮询: 扫描新区块, 确认上一个区块的交易, 批量查询回执."""
+        found = self._take_unchecked()
+        try:
+            self._poll_receipts(found)
+        except Exception:
+            self._put_back(found)
+            raise
+
+    def _poll_receipts(self, found: List[str]):
+        """found是需要直接查询回执的交易hash."""
+        client: 'CitaClient' = self.client  # type: ignore
+        height = client.get_latest_block_number()
+        scan = self._scan_range(height)
+        blocks = client.get_blocks_by_number(scan) if scan else []
+        if blocks:
+            client.poll_scheduler.observe_blocks(blocks)
+        found, in_block = self._collect(height, found, scan is None, blocks)
+        if found:
+            self._resolve(found, in_block, client.get_transaction_receipts(found))
+
+    def _scan_range(self, height: int) -> Optional[range]:
+        """
+        观察到最新区块height后, 确认之前区块中的交易, 计算需要扫描的新区块.
+
+        :return: 需要获取的区块. None表示新区块太多, 直接查询所有待确认交易的回执
+        """
+        self._confirm(height)
+        if self.height < 0 or height - self.height > self.max_scan_blocks:
+            return None
+        return range(self.height + 1, height + 1)
+
+    def _collect(self, height: int, found: List[str], rescan: bool, blocks: List[Dict]) -> Tuple[List[str], Set[str]]:
+        """
+        根据新区块确定需要查询回执的交易.
+
+        :return: (需要查询回执的交易hash, 在新区块中找到的交易hash)
+        """
+        in_block: Set[str] = set()
+        with self._lock:
+            if rescan:
+                found = list(self._pending)
+            for block in blocks:
+                for tx in block['body']['transactions']:
+                    key = (tx if isinstance(tx, str) else tx['hash']).lower()
+                    if key in self._pending:
+                        in_block.add(key)
+            found += [key for key in in_block if key not in found]
+            self.height = max(self.height, height)
+        return found, in_block
+
+    def _resolve(self, found: List[str], in_block: Set[str], receipts: List[Dict]):
+        """把查询到的回执交给等待的调用方."""
+        done = []
+        with self._lock:
+            for key, r in zip(found, receipts):
+                if key not in self._pending:
+                    continue
+                if r:
+                    done.append((self._pending.pop(key), r))
+                    self._waiters.pop(key, None)
+                elif key in in_block:  # 已经上链, 但节点还没有生成回执, 下一轮重新查询
+                    self._unchecked.add(key)
+        for fut, r in done:
+            if fut.cancelled():
+                continue
+            error = r.get('errorMessage')
+            if error:  # 交易失败
+                fut.set_exception(RuntimeError(error))
+            else:
+                fut.set_result(r)
+
+    def _confirm(self, height: int):
+        """观察到区块height后, 确认所有在它之前的区块中的交易."""
+        done: List[Tuple[Future, Dict]] = []
+        with self._lock:
+            for block in [i for i in self._confirming if i < height]:
+                done += self._confirming.pop(block)
+        for fut, r in done:
+            if not fut.cancelled():
+                fut.set_result(r)
+
+
+class AsyncReceiptWatcher(ReceiptWatcher):
+    """
+    ReceiptWatcher的asyncio版本. 轮询在事件循环中的一个任务里进行, watch返回asyncio.Future.
+
+    与ReceiptWatcher一样, 每一轮只查询一次最新区块高度, 批量查询新区块中的交易的回执, 观察到区块h+1时确认区块h中的交易.
+    """
+
+    def __init__(self, client: 'AsyncCitaClient', poll_interval: Optional[float] = None, max_scan_blocks: int = 32, max_errors: int = 5):
+        """
+        初始化.
+
+        :param client: AsyncCitaClient
+        :param poll_interval: 轮询间隔, 单位秒. None表示由client.poll_scheduler根据出块间隔安排
+        :param max_scan_blocks: 一轮中最多扫描的区块数. 新区块更多时, 直接批量查询所有待确认交易的回执
+        :param max_errors: 连续多少轮RPC失败后, 把错误报告给所有等待的调用方. 之前的失败只会在下一轮重试
+        """
+        super().__init__(client, poll_interval, max_scan_blocks, max_errors)
+        self._event: Optional[asyncio.Event] = None  # 在事件循环中创建
+
+    def _new_future(self) -> Future:
+        return asyncio.get_event_loop().create_future()  # type: ignore
+
+    def _start(self):
+        self._event = asyncio.Event()
+        self._runner = asyncio.ensure_future(self._run())
+
+    def _wake(self):
+        if self._event is not None:
+            self._event.set()
+
+    async def wait(self, tx_hash_list: Iterable[PARAM], timeout: float = -1, confirm: bool = False) -> List[Dict]:  # type: ignore
+        """
+        等待多个交易的回执.
+
+        :param tx_hash_list: 交易hash列表
+        :param timeout: 等待所有回执的时间, 单位秒. -1: 一直等待
+        :param confirm: True 等待交易结果确定
+        :return: 与tx_hash_list一一对应的回执
+        """
+        futures = [self.watch(tx_hash, confirm) for tx_hash in tx_hash_list]
+        try:
+            return list(await asyncio.wait_for(asyncio.gather(*futures), None if timeout == -1 else timeout))  # type: ignore
+        except asyncio.TimeoutError:
+            raise RuntimeError('timeout')
+        finally:
+            for f in futures:  # 不再等待, 没有其他调用方等待的交易不再查询
+                f.cancel()
+
+    async def close(self):  # type: ignore
+        """停止轮询, 取消所有还在等待的Future."""
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+            confirming, self._confirming = self._confirming, {}
+            self._waiters.clear()
+            task, self._runner = self._runner, None
+        self._cancel_all(pending, confirming)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def __enter__(self):
+        raise TypeError('use `async with` instead')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _run(self):  # type: ignore
+        client: 'AsyncCitaClient' = self.client  # type: ignore
+        try:
+            while not self._idle():
+                try:
+                    await self._poll()
+                    self.errors = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._poll_failed(e)
+
+                delay = self.poll_interval if self.poll_interval is not None else await client._poll_delay()
+                try:  # watch()会提前唤醒, 尽快查询新加入的交易
+                    await asyncio.wait_for(self._event.wait(), delay)  # type: ignore
+                except asyncio.TimeoutError:
+                    pass
+                self._event.clear()  # type: ignore
+        finally:  # 任务意外退出时, 之后的watch()会重新启动任务
+            with self._lock:
+                if self._runner is asyncio.current_task():
+                    self._runner = None
+
+    async def _poll(self):  # type: ignore
+        found = self._take_unchecked()
+        try:
+            await self._poll_receipts(found)
+        except BaseException:  # 包括CancelledError
+            self._put_back(found)
+            raise
+
+    async def _poll_receipts(self, found: List[str]):  # type: ignore
+        client: 'AsyncCitaClient' = self.client  # type: ignore
+        height = await client.get_latest_block_number()
+        scan = self._scan_range(height)
+        blocks = await client.get_blocks_by_number(scan) if scan else []
+        if blocks:
+            client.poll_scheduler.observe_blocks(blocks)
+        found, in_block = self._collect(height, found, scan is None, blocks)
+        if found:
+            self._resolve(found, in_block, await client.get_transaction_receipts(found))
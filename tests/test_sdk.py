@@ -3,6 +3,8 @@
 """测试CitaClient."""
 from pathlib import Path
 import json
+import ast
+import time
 import pytest
 
 from cita import CitaClient, ContractClass
@@ -290,3 +292,993 @@ def test_generate_account():
     assert pri_key == pri_key2
     assert pub_key == pub_key2
     assert addr == addr2
+
+
+def test_transport():
+    from cita import HttpTransport
+
+    transport = HttpTransport(pool_size=2, pool_block=True)
+    with CitaClient(CITA_URL, transport=transport) as c:
+        heights = [c.get_latest_block_number() for _ in range(5)]
+        assert heights == sorted(heights)
+
+    # 共享的transport不会被client关闭.
+    with CitaClient(CITA_URL, transport=transport) as c:
+        assert c.get_latest_block_number() > 0
+    transport.close()
+
+
+def test_node_pool():
+    from cita.endpoint import NodePool
+
+    pool = NodePool(['a', 'b', 'c'], max_failures=2, eject_time=60)
+    a, b, c = pool.nodes
+    for node, latency in ((a, 0.3), (b, 0.1), (c, 0.2)):
+        pool.end(node, pool.begin(node) - latency, True)
+    assert pool.candidates() == [b, c, a]
+    assert pool.candidates(write=True) == [a, b, c]  # pinned
+
+    pool.begin(b)  # b正在处理请求, 负载升高
+    pool.begin(b)
+    assert pool.candidates()[0] is c
+    pool.end(b, 0, False)
+    pool.end(b, 0, False)
+    assert pool.healthy() == [a, c]
+    assert pool.candidates() == [c, a, b]  # 被摘除的节点排在最后
+    pool.end(b, pool.begin(b), True)
+    assert pool.healthy() == [a, b, c]
+
+
+def test_hedge_delay():
+    from cita.endpoint import NodePool
+
+    assert NodePool(['a', 'b']).hedge_delay() is None  # 没有开启
+    assert NodePool(['a'], hedge_percentile=0.9).hedge_delay() is None  # 只有一个节点
+
+    pool = NodePool(['a', 'b'], hedge_percentile=0.9, hedge_min_samples=10)
+    a = pool.nodes[0]
+    for i in range(1, 10):
+        pool.end(a, pool.begin(a) - i / 100, True)
+    assert pool.hedge_delay() is None  # 样本不足
+    pool.end(a, pool.begin(a) - 0.1, True)
+    assert 0.09 < pool.hedge_delay() < 0.2
+
+
+def test_hedge():
+    import threading
+    from cita import TransportBase
+
+    class FakeTransport(TransportBase):
+        def __init__(self):
+            self.calls = []
+
+        def post(self, url, data, timeout):
+            self.calls.append((url, threading.current_thread()))
+            if url == 'http://slow':
+                time.sleep(0.1)
+                raise ConnectionError('reset')
+            time.sleep(0.05)
+            return 200, json.dumps({'jsonrpc': '2.0', 'id': json.loads(data)['id'], 'result': '0x10'}).encode()
+
+    transport = FakeTransport()
+    c = CitaClient(['http://slow', 'http://fast'], transport=transport)
+    c.nodes.hedge_delay = lambda: 0.02
+    c.nodes.candidates = lambda write=False: list(c.nodes.nodes)
+    t0 = time.monotonic()
+    assert c.get_latest_block_number() == 16
+    assert time.monotonic() - t0 < 0.14  # primary失败时, 对冲请求已经在请求中, 不必从头重试
+    assert transport.calls[0] == ('http://slow', threading.current_thread())  # primary在调用方线程发出
+
+    transport.calls.clear()
+    c.nodes.hedge_delay = lambda: 0.08
+    c.nodes.candidates = lambda write=False: list(reversed(c.nodes.nodes))
+    assert c.get_latest_block_number() == 16
+    time.sleep(0.1)
+    assert [url for url, _ in transport.calls] == ['http://fast']  # primary及时返回, 不发对冲请求
+    c.close()
+
+
+def test_multi_node():
+    c = CitaClient(['http://127.0.0.1:1', CITA_URL])  # 第一个节点无法连接
+    for _ in range(5):
+        assert c.get_latest_block_number() > 0
+    stats = c.nodes.stats()
+    assert stats[0]['failures'] > 0 and stats[1]['failures'] == 0
+    c.close()
+
+
+def test_multi_call():
+    height = client.get_latest_block_number()
+    heights = list(range(max(height - 10, 0), height + 1))
+    blocks = client.get_blocks_by_number(heights)
+    assert [int(b['header']['number'], 16) for b in blocks] == heights
+
+    r = client.multi_call([('blockNumber', []), ('peerCount', [])])
+    assert len(r) == 2 and int(r[0], 16) >= height
+
+    assert client.get_transaction_receipts([b'\x00' * 32, b'\x01' * 32]) == [{}, {}]
+    with pytest.raises(RuntimeError, match='jsonrpc failed'):
+        client.multi_call([('blockNumber', []), ('getTransactionReceipt', ['0x00'])])
+
+
+def test_async_client():
+    import asyncio
+    from cita import AsyncCitaClient, AsyncContractClass
+
+    async def run():
+        async with AsyncCitaClient(CITA_URL) as c:
+            heights = await asyncio.gather(*[c.get_latest_block_number() for _ in range(100)])
+            assert min(heights) > 0
+
+            simple_class = AsyncContractClass(Path('tests/SimpleStorage.sol'), c)
+            private_key = c.create_key()['private']
+            simple_obj, contract_addr, tx_hash = await simple_class.instantiate(private_key, 100)
+            await c.confirm_transaction(tx_hash)
+            assert await simple_obj.get() == 100
+
+            tx_hash = await simple_obj.set(200)
+            await c.confirm_transaction(tx_hash)
+            assert await simple_obj.get() == 200
+
+    asyncio.run(run())
+
+
+def test_async_poll_delay():
+    import asyncio
+    from cita import AsyncCitaClient, PollScheduler
+
+    async def run():
+        async with AsyncCitaClient(CITA_URL, poll_scheduler=PollScheduler(jitter=0)) as c:
+            async def get_block_interval():
+                raise KeyError('blockInterval')
+
+            c.get_block_interval = get_block_interval
+            assert await c._poll_delay() == 1.0  # 获取出块间隔失败时按1秒计算, 与同步版本一致
+
+    asyncio.run(run())
+
+
+def test_transaction_count_bytes_addr(monkeypatch):
+    import asyncio
+    from cita import AsyncCitaClient
+
+    # 同步和异步版本共用参数检查, 地址可以是20字节的bytes
+    addr = b'\x33' * 20
+    c = CitaClient(CITA_URL)
+    monkeypatch.setattr(c, '_jsonrpc', lambda method, params: '0x2')
+    assert c.get_transaction_count(addr) == 2
+    with pytest.raises(AssertionError):
+        c.get_transaction_count('0x1234')
+
+    async def run():
+        async with AsyncCitaClient(CITA_URL) as ac:
+            async def jsonrpc(method, params):
+                return '0x2'
+
+            monkeypatch.setattr(ac, '_jsonrpc', jsonrpc)
+            assert await ac.get_transaction_count(addr) == 2
+            with pytest.raises(AssertionError):
+                await ac.get_transaction_count('0x1234')
+
+    asyncio.run(run())
+
+
+def test_height_tracker():
+    from cita import BlockHeightTracker
+
+    tracker = BlockHeightTracker(ttl=60)
+    c = CitaClient(CITA_URL, height_tracker=tracker)
+    assert tracker.expired
+    height = c.get_latest_block_number()
+    assert not tracker.expired and tracker.height == height
+
+    calls = []
+    assert tracker.get(lambda: calls.append(1) or 0) == height
+    assert calls == []  # 缓存未过期, 不会刷新
+
+    tracker.observe(height - 1)
+    assert tracker.height == height
+    tracker.observe(height + 1)
+    assert tracker.height == height + 1
+
+
+def test_poll_scheduler():
+    from cita import PollScheduler
+
+    scheduler = PollScheduler(jitter=0)
+    assert scheduler.next_delay() == 1.0  # 出块间隔未知
+    assert scheduler.next_delay(lambda: 3.0) == 3.0
+    assert scheduler.interval == 3.0
+
+    scheduler.observe(100)
+    assert 3.0 < scheduler.next_delay() <= 3.0 * (1 + scheduler.margin)  # 预计出块后稍晚一点
+
+    scheduler.seen_at -= 10  # 区块晚了, 指数退避, 不超过出块间隔
+    delays = [scheduler.next_delay() for _ in range(10)]
+    assert delays == sorted(delays) and delays[0] == scheduler.min_delay and delays[-1] == 3.0
+    scheduler.observe(101)
+    assert scheduler.misses == 0
+
+    def broken():
+        raise KeyError('blockInterval')
+
+    assert PollScheduler(jitter=0).next_delay(broken) == 1.0  # 获取出块间隔失败时按1秒计算
+
+    blocks = [{'header': {'number': hex(i), 'timestamp': 1000 * i}} for i in range(10)]
+    scheduler = PollScheduler()
+    scheduler.observe_blocks(blocks)
+    assert scheduler.interval == 1.0
+
+
+def test_receipt_watcher():
+    from cita import ReceiptWatcher
+
+    simple_class = ContractClass(Path('tests/SimpleStorage.sol'), client)
+    private_key = client.create_key()['private']
+    tx_hash_list = [simple_class.instantiate_raw(private_key, i) for i in range(5)]
+
+    with ReceiptWatcher(client) as watcher:
+        called = []
+        fut = watcher.watch(tx_hash_list[0])
+        fut.add_done_callback(lambda f: called.append(f.result()))
+        receipts = watcher.wait(tx_hash_list, client.timeout)
+        assert [r['transactionHash'] for r in receipts] == tx_hash_list
+        assert called == receipts[:1]
+
+        with pytest.raises(RuntimeError):
+            watcher.wait(['0x' + '00' * 32], 0.1)
+
+        receipts = watcher.wait(tx_hash_list, client.timeout, confirm=True)
+        assert all(ast.literal_eval(r['blockNumber']) < client.get_latest_block_number() for r in receipts)
+
+
+class FakeChain:
+    """ReceiptWatcher用到的client接口. 回执在receipts中的交易已经上链."""
+
+    def __init__(self):
+        from cita import PollScheduler
+        self.height = 10
+        self.receipts = {}
+        self.queried = []
+        self.poll_scheduler = PollScheduler(0.01)
+
+    def get_latest_block_number(self):
+        return self.height
+
+    def get_block_interval(self):
+        return 0.01
+
+    def get_blocks_by_number(self, heights, tx_detail=False):
+        return [{'header': {'number': hex(h), 'timestamp': h * 10},
+                 'body': {'transactions': [k for k, r in self.receipts.items() if r['blockNumber'] == hex(h)]}} for h in heights]
+
+    def get_transaction_receipts(self, hashes):
+        self.queried.append(list(hashes))
+        return [self.receipts.get(h) for h in hashes]
+
+
+def test_receipt_watcher_timeout():
+    from cita import ReceiptWatcher
+
+    chain = FakeChain()
+    lost, shared = '0x' + '01' * 32, '0x' + '02' * 32
+    with ReceiptWatcher(chain, poll_interval=0.01) as watcher:
+        other = watcher.watch(shared)
+        with pytest.raises(RuntimeError):
+            watcher.wait([lost, shared], 0.05)
+        assert lost not in watcher._pending  # 超时的交易不再查询
+        assert not other.done() and shared in watcher._pending  # 其他调用方仍在等待
+        chain.receipts[shared] = {'transactionHash': shared, 'blockNumber': hex(11)}
+        chain.height = 11
+        assert other.result(1) == chain.receipts[shared]
+        time.sleep(0.05)
+        assert not watcher._pending and not watcher._waiters
+        assert lost not in chain.queried[-1]
+
+
+def test_receipt_watcher_uppercase():
+    from cita import ReceiptWatcher
+
+    chain = FakeChain()
+    tx_hash = '0x' + 'ab' * 32
+    with ReceiptWatcher(chain, poll_interval=0.01) as watcher:
+        fut = watcher.watch(tx_hash.upper().replace('0X', '0x'))
+        time.sleep(0.05)  # 第一次直接查询时还没有上链
+        assert not fut.done()
+        chain.receipts[tx_hash] = {'transactionHash': tx_hash, 'blockNumber': hex(11)}
+        chain.height = 11
+        assert fut.result(1) == chain.receipts[tx_hash]  # 在新区块中找到
+
+
+class AsyncFakeChain(FakeChain):
+    """AsyncReceiptWatcher用到的client接口."""
+
+    async def get_latest_block_number(self):
+        return self.height
+
+    async def get_blocks_by_number(self, heights, tx_detail=False):
+        return FakeChain.get_blocks_by_number(self, heights, tx_detail)
+
+    async def get_transaction_receipts(self, hashes):
+        return FakeChain.get_transaction_receipts(self, hashes)
+
+    async def _poll_delay(self):
+        return 0.01
+
+
+def test_async_receipt_watcher():
+    import asyncio
+    from cita import AsyncReceiptWatcher
+
+    chain = AsyncFakeChain()
+    tx_hash_list = ['0x' + '%064x' % i for i in range(1, 21)]
+
+    async def run():
+        async with AsyncReceiptWatcher(chain) as watcher:
+            task = asyncio.ensure_future(watcher.wait(tx_hash_list, 1))
+            await asyncio.sleep(0.05)
+            for tx_hash in tx_hash_list:
+                chain.receipts[tx_hash] = {'transactionHash': tx_hash, 'blockNumber': hex(11)}
+            chain.height = 11
+            receipts = await task
+            assert [r['transactionHash'] for r in receipts] == tx_hash_list
+            assert all(len(hashes) == len(tx_hash_list) for hashes in chain.queried)  # 所有交易一起查询
+
+            confirmed = asyncio.ensure_future(watcher.wait(tx_hash_list[:1], 1, confirm=True))
+            await asyncio.sleep(0.05)
+            assert not confirmed.done()  # 等待区块12
+            chain.height = 12
+            assert await confirmed == receipts[:1]
+
+            with pytest.raises(RuntimeError, match='timeout'):
+                await watcher.wait(['0x' + 'ff' * 32], 0.05)
+            await asyncio.sleep(0.05)
+            assert not watcher._pending and not watcher._waiters and watcher._runner is None
+
+    asyncio.run(run())
+
+
+def test_async_confirm_transaction():
+    import asyncio
+    from cita import AsyncCitaClient, AsyncReceiptWatcher
+
+    chain = AsyncFakeChain()
+    tx_hash_list = ['0x' + '%064x' % i for i in range(1, 6)]
+    for tx_hash in tx_hash_list:
+        chain.receipts[tx_hash] = {'transactionHash': tx_hash, 'blockNumber': hex(10)}
+
+    async def run():
+        async with AsyncCitaClient(CITA_URL) as c:
+            c.receipt_watcher = AsyncReceiptWatcher(chain)
+            task = asyncio.ensure_future(asyncio.gather(*[c.confirm_transaction(tx_hash, 1) for tx_hash in tx_hash_list]))
+            await asyncio.sleep(0.05)
+            assert not task.done()  # 等待区块11
+            chain.height = 11
+            assert [r['transactionHash'] for r in await task] == tx_hash_list
+            assert all(len(hashes) == len(tx_hash_list) for hashes in chain.queried)  # 所有交易共享一次轮询
+
+    asyncio.run(run())
+
+
+def test_receipt_watcher_errors():
+    from cita import ReceiptWatcher
+
+    chain = FakeChain()
+    failures = [3]
+    get_latest_block_number = chain.get_latest_block_number
+
+    def flaky():
+        if failures[0] > 0:
+            failures[0] -= 1
+            raise RuntimeError('`blockNumber` jsonrpc failed')
+        return get_latest_block_number()
+
+    chain.get_latest_block_number = flaky
+    tx_hash = '0x' + '03' * 32
+    chain.receipts[tx_hash] = {'transactionHash': tx_hash, 'blockNumber': hex(10)}
+    with ReceiptWatcher(chain, poll_interval=0.01, max_errors=5) as watcher:
+        assert watcher.wait([tx_hash], 1) == [chain.receipts[tx_hash]]  # 偶尔的失败会重试
+
+        confirmed = watcher.watch('0x' + '04' * 32, confirm=True)
+        confirmed.cancel()
+        time.sleep(0.05)
+        assert not watcher._pending and not watcher._waiters
+
+        failures[0] = 100
+        with pytest.raises(RuntimeError, match='blockNumber'):
+            watcher.wait(['0x' + '05' * 32], 1)  # 连续失败时报告给调用方
+
+
+def test_receipt_watcher_interval_error():
+    from cita import ReceiptWatcher, PollScheduler
+
+    def get_block_interval():
+        raise ConnectionError('node is down')
+
+    chain = FakeChain()
+    chain.poll_scheduler = PollScheduler()
+    chain.get_block_interval = get_block_interval
+    tx_hashes = ['0x' + '06' * 32, '0x' + '07' * 32]
+    for tx_hash in tx_hashes:
+        chain.receipts[tx_hash] = {'transactionHash': tx_hash, 'blockNumber': hex(10)}
+    with ReceiptWatcher(chain) as watcher:
+        assert watcher.wait(tx_hashes[:1], 1)
+        assert watcher._runner is None or watcher._runner.is_alive()  # 轮询线程没有因为出块间隔获取失败而退出
+        assert watcher.wait(tx_hashes[1:], 1)
+
+
+def test_key_signer():
+    pri_key, _, addr = client.signer.generate_account()
+    key_signer = client.signer.for_key(param_to_bytes(pri_key))
+    assert key_signer.address == addr
+    assert client.signer.for_key(param_to_bytes(pri_key)) is key_signer  # 缓存的上下文
+
+    raw_tx = key_signer.make_raw_tx(b'\x11' * 20, b'\x01\x02', 100, 0, 1000)
+    r = client.decode_transaction_content(raw_tx)
+    assert r['transaction']['to_v1'] == '0x' + '11' * 20
+    assert r['transaction']['data'] == '0x0102'
+    assert len(param_to_bytes(r['signature'])) == 65
+
+
+def test_make_raw_txs():
+    pri_key = param_to_bytes(client.create_key()['private'])
+    specs = ((pri_key, b'\x11' * 20, b'\x01', value, 1000) for value in range(1000))
+    raw_txs = list(client.signer.make_raw_txs(specs, 100, processes=2, chunk_size=64))
+    assert len(raw_txs) == 1000
+    for value, raw_tx in enumerate(raw_txs[:100]):  # 结果保持输入顺序
+        tx = client.decode_transaction_content(raw_tx)['transaction']
+        assert param_to_bytes(tx['value']) == value.to_bytes(32, byteorder='big')
+
+
+def test_tx_template(monkeypatch):
+    from cita import make_tx
+
+    monkeypatch.setattr(make_tx, 'get_nonce', lambda: 'ABCDEF')
+    pri_key = param_to_bytes(client.create_key()['private'])
+    for receiver in (b'\x11' * 20, b''):
+        template = make_tx.TxTemplate(client.signer, receiver, quota=1000, value=1)
+        for bytecode, valid_until_block in ((b'', 0), (b'\x01' * 300, 100), (b'\x02', 2 ** 40)):
+            assert template.make_raw_tx(pri_key, bytecode, valid_until_block) == \
+                client.signer.make_raw_tx(pri_key, receiver, bytecode, valid_until_block, 1, 1000)
+
+
+def test_call_cache():
+    from cita import CallCache
+
+    cache = CallCache(maxsize=3)
+    req = {'to': '0x' + '11' * 20, 'data': '0x12345678'}
+    cache.advance(10)
+    key = CallCache.make_key(req, 10)
+    assert cache.get(key) is None
+    cache.put(key, b'\x01')
+    assert cache.get(key) == b'\x01'
+    pinned_key = CallCache.make_key(req, 5)
+    cache.put(pinned_key, b'\x02', pinned=True)
+
+    cache.advance(11)  # 最新区块变化, 只保留指定高度的结果
+    assert cache.get(key) is None
+    assert cache.get(pinned_key) == b'\x02'
+    cache.put(key, b'\x01')  # 旧的最新区块上的结果不再缓存
+    assert cache.get(key) is None
+
+    for height in range(3):
+        cache.put(CallCache.make_key(req, height), b'', pinned=True)
+    assert cache.get(pinned_key) is None  # LRU淘汰
+    assert cache.stats()['hits'] == 2
+
+
+def test_data_cache(tmp_path):
+    from cita import DataCache
+
+    path = str(tmp_path / 'cache.db')
+    cache = DataCache(max_bytes=100, path=path)
+    assert cache.get('block:1:0') is None
+    block = {'hash': '0x' + '11' * 32, 'body': {'transactions': []}}
+    cache.put('block:1:0', block)
+    r = cache.get('block:1:0')
+    assert r == block
+    r['hash'] = ''  # 修改结果不影响缓存
+    assert cache.get('block:1:0') == block
+
+    cache.put_many([(f'tx:{i}', {'blockNumber': hex(i)}) for i in range(10)])
+    assert cache.stats()['bytes'] <= 100  # 内存中按字节数淘汰
+    assert cache.get('block:1:0') == block  # 从sqlite文件读取
+    cache.close()
+
+    cache = DataCache(path=path)
+    assert [cache.get(f'tx:{i}') for i in range(10)] == [{'blockNumber': hex(i)} for i in range(10)]
+    assert cache.stats()['disk_hits'] == 10
+    cache.clear()
+    assert cache.get('tx:0') is None
+    cache.close()
+
+
+def test_chain_store(tmp_path, monkeypatch):
+    from cita import ChainStore
+
+    def make_block(height):
+        txs = [{'hash': '0x%064x' % (height * 10 + i), 'content': '0x', 'from': '0x' + '00' * 20} for i in range(height % 3)]
+        return {'hash': '0x%064x' % (10 ** 6 + height), 'header': {'number': hex(height)}, 'body': {'transactions': txs}}
+
+    requested = []
+    monkeypatch.setattr(client, 'get_latest_block_number', lambda: 30)
+    monkeypatch.setattr(client, 'get_blocks_by_number', lambda heights, tx_detail: requested.extend(heights) or [make_block(h) for h in heights])
+    monkeypatch.setattr(client, 'get_transaction_receipts', lambda hashes: [{'transactionHash': h, 'blockNumber': hex(int(h, 16) // 10)} for h in hashes])
+
+    path = str(tmp_path / 'chain.db')
+    store = ChainStore(path)
+    assert store.sync(client, end=9, batch_size=4) == 10
+    assert store.height == 9
+    store.close()
+
+    store = ChainStore(path)
+    assert store.sync(client, batch_size=4) == 20  # 从断点继续, 到最新区块的前一个区块为止
+    assert store.height == 29 and requested == list(range(30))
+    assert store.sync(client) == 0
+
+    block = make_block(14)
+    assert store.get('block:14:1') == block
+    assert store.get(f'blockhash:{block["hash"]}:0')['body']['transactions'] == [tx['hash'] for tx in block['body']['transactions']]
+    tx_hash = block['body']['transactions'][1]['hash']
+    assert store.get(f'tx:{tx_hash}') == dict(block['body']['transactions'][1], blockNumber=hex(14), blockHash=block['hash'], index='0x1')
+    assert store.get(f'receipt:{tx_hash}')['blockNumber'] == hex(14)
+    assert store.get('block:30:1') is None and store.get('code:0x') is None
+    store.close()
+
+
+def test_cached_blocks():
+    from cita import DataCache
+
+    c = CitaClient(CITA_URL, data_cache=DataCache())
+    height = c.get_latest_block_number()
+    blocks = c.get_blocks_by_number(range(max(0, height - 5), height + 1))
+    assert c.data_cache.stats()['misses'] == len(blocks)
+    assert c.get_blocks_by_number(range(max(0, height - 5), height + 1)) == blocks
+    assert c.get_block_by_number(height) == c.get_block_by_hash(blocks[-1]['hash']) == blocks[-1]
+    assert c.data_cache.stats()['misses'] == len(blocks)
+
+
+def test_iter_blocks(monkeypatch):
+    requested = []
+
+    def get_blocks_by_number(heights, tx_detail=False):
+        requested.append(list(heights))
+        time.sleep(0.01 * (len(requested) % 3))  # 乱序完成
+        return [{'header': {'number': hex(h)}} if h < 95 else None for h in heights]
+
+    monkeypatch.setattr(client, 'get_blocks_by_number', get_blocks_by_number)
+    it = client.iter_blocks(3, 50, workers=3, batch_size=10)
+    assert [ast.literal_eval(b['header']['number']) for b in it] == list(range(3, 50))
+    assert sorted(requested) == [list(range(i, min(i + 10, 50))) for i in range(3, 50, 10)]
+    assert it.stats()['blocks'] == 47
+
+    requested.clear()
+    for _ in client.iter_blocks(0, 1000, workers=2, batch_size=10):
+        break
+    assert len(requested) <= 3  # 调用方不取走区块时, 不会继续请求
+
+    with pytest.raises(RuntimeError):
+        list(client.iter_blocks(90, 100))
+
+
+def test_cached_call():
+    from cita import CallCache
+
+    simple_class = ContractClass(Path('tests/SimpleStorage.sol'), client)
+    private_key = client.create_key()['private']
+    simple_obj, contract_addr, tx_hash = simple_class.instantiate(private_key, 100)
+    client.confirm_transaction(tx_hash)
+
+    c = CitaClient(CITA_URL, call_cache=CallCache())
+    obj = simple_class.bind(contract_addr, private_key)
+    obj.client__ = c
+    assert [obj.get() for _ in range(10)] == [100] * 10
+    assert c.call_cache.stats()['hits'] >= 8
+    height = c.get_latest_block_number()
+    assert c.call_readonly_func(contract_addr, obj['get'].address, height=height) == c.call_readonly_func(contract_addr, obj['get'].address, height=height)
+
+
+def test_abi_codec():
+    from cita.util import get_codec
+
+    codec = get_codec('int,bool')
+    assert get_codec('int,bool') is codec  # 同一类型字符串共享编解码器
+    assert codec.encode((-1, True)) == encode_param('(int,bool)', (-1, True))
+    assert codec.decode(codec.encode((-1, True))) == (-1, True)
+    assert get_codec('').encode(()) == b''
+    assert get_codec('').decode(b'') == ()
+
+    simple_class = ContractClass(Path('tests/SimpleStorage.sol'), client)
+    abi = simple_class.func_mapping['add_by_vec']
+    assert abi.param_codec is get_codec('uint256[],uint256[]')
+    assert abi.return_codec.decode(encode_param('uint256', 11)) == 11
+
+
+def test_static_codec():
+    """随机生成静态类型的参数, 快速路径的结果(包括报错)应与eth_abi一致."""
+    import random
+    from eth_abi import encode_single, decode_single
+    from cita.util import get_codec
+
+    def outcome(f, *args):
+        try:
+            return f(*args)
+        except Exception as e:
+            return type(e)
+
+    def rand_value(t):
+        if t == 'address':
+            b = bytes(rnd.getrandbits(8) for _ in range(20))
+            return rnd.choice([b, '0x' + b.hex(), '0x' + b.hex().upper(), b[:19], '0x' + b.hex()[:-1] + 'G'])
+        if t == 'bool':
+            return rnd.choice([True, False, 1])
+        if t.startswith('bytes'):
+            n = int(t[5:])
+            return rnd.choice([bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, n))), b'x' * (n + 1)])
+        bits = int(t.lstrip('uint') or 256)
+        return rnd.choice([rnd.getrandbits(bits), -rnd.getrandbits(bits - 1), 1 << bits, True])
+
+    rnd = random.Random(0)
+    elements = ['uint256', 'uint', 'uint8', 'int', 'int64', 'address', 'bool', 'bytes1', 'bytes32']
+    for _ in range(2000):
+        type_list = [rnd.choice(elements) for _ in range(rnd.randint(1, 4))]
+        types = ','.join(type_list)
+        assert get_codec(types).static is not None
+        values = tuple(rand_value(t) for t in type_list)
+        r = outcome(encode_single, f'({types})', values)
+        assert outcome(encode_param, types, values) == r
+
+        data = bytes(rnd.choice([0, 0, 255, rnd.getrandbits(8)]) for _ in range(32 * len(type_list) + rnd.choice([-1, 0, 0])))
+        r = outcome(decode_single, f'({types})', data)
+        if isinstance(r, tuple) and len(r) == 1:
+            r = r[0]
+        assert outcome(decode_param, types, data) == r
+
+    for types in ('uint7', 'bytes33', 'string', 'uint256[2]', '(uint256,(bool))'):
+        assert get_codec(types).static is None
+
+
+def test_batch_tx_data():
+    from cita.sdk import make_batch_tx_data
+
+    simple_class = ContractClass(Path('tests/SimpleStorage.sol'), client)
+    obj_list = [simple_class.bind('0x' + '%040x' % i, b'') for i in range(1, 4)]
+    values = [101, 202, 303]
+    ans = make_batch_tx_data([obj.get_tx_code('set', value) for obj, value in zip(obj_list, values)])
+    addr_list = [obj.contract_addr__ for obj in obj_list]
+    assert obj_list[0].get_batch_tx_data('set', (values,), addr_list) == ans
+
+    ans = make_batch_tx_data([obj.get_tx_code('reset') for obj in obj_list])
+    assert obj_list[0].get_batch_tx_data('reset', contract_addr_list=addr_list) == ans
+
+    np = pytest.importorskip('numpy')
+    ans = make_batch_tx_data([obj_list[0].get_tx_code('set', value) for value in values])
+    assert obj_list[0].get_batch_tx_data('set', (np.array(values, dtype=np.uint64),)) == ans
+
+
+def test_batch_calls_trailing_zero_address():
+    """以\\0结尾的 ``S20`` 地址, 在逐行编码时也要保持20字节."""
+    np = pytest.importorskip('numpy')
+    from cita import encode_batch_calls
+
+    addrs = [bytes.fromhex('11' * 19 + '00'), bytes.fromhex('22' * 20)]
+    func_addr = '0x12345678'
+    ans = encode_batch_calls(addrs, func_addr, 'address,string', (addrs, ['a', 'b']))
+    assert encode_batch_calls(np.array(addrs, dtype='S20'), func_addr, 'address,string', (np.array(addrs, dtype='S20'), ['a', 'b'])) == ans
+    ans = encode_batch_calls(addrs, func_addr, 'uint256', ([1, 2],))
+    assert encode_batch_calls(np.array(addrs, dtype='S20'), func_addr, 'uint256', ([1, 2],)) == ans
+
+
+def test_batch_submitter(monkeypatch):
+    from cita import BatchSubmitter
+    from cita.sdk import make_batch_tx_data
+
+    simple_class = ContractClass(Path('tests/SimpleStorage.sol'), client, {'set': 30000})
+    simple_obj = simple_class.bind('0x' + '%040x' % 1, b'')
+    tx_code_list = [simple_obj.get_tx_code('set', i) for i in range(10)]
+    quota = simple_obj.func_mapping__['set'].quota
+
+    sent = []
+    monkeypatch.setattr(client, 'batch_call_func_raw', lambda private_key, batch_data, quota: sent.append((batch_data, quota)) or str(len(sent)))
+
+    submitter = BatchSubmitter(client, b'', max_bytes=(len(param_to_bytes(tx_code_list[0])) + 4) * 3, max_in_flight=2)
+    submitter.register(simple_obj.func_mapping__)
+    chunks = list(submitter.submit(tx_code_list))
+    assert [list(chunk.indices) for chunk in chunks] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    for chunk in chunks:
+        batch_data, sent_quota = sent[int(chunk.tx_hash) - 1]
+        assert batch_data == make_batch_tx_data(tx_code_list[chunk.indices.start:chunk.indices.stop])
+        assert sent_quota == chunk.quota == quota * len(chunk.indices) <= submitter.max_quota
+
+    # 没有指定quota的方法使用default_quota, 多个子调用可以放进一个交易
+    sent.clear()
+    submitter = BatchSubmitter(client, b'')
+    submitter.register(ContractClass(Path('tests/SimpleStorage.sol'), client).func_mapping)
+    chunks = list(submitter.submit(tx_code_list))
+    assert [list(chunk.indices) for chunk in chunks] == [list(range(10))]
+    assert chunks[0].quota == submitter.default_quota * 10 <= submitter.max_quota
+
+    sent.clear()
+    chunks = list(BatchSubmitter(client, b'', max_quota=250).submit((tx_code, 100) for tx_code in tx_code_list))
+    assert [len(chunk.indices) for chunk in chunks] == [2, 2, 2, 2, 2]
+
+
+def test_batch_submitter_register(monkeypatch):
+    from cita import BatchSubmitter, DEFAULT_QUOTA
+    from cita.sdk import ABI
+
+    func_mapping = {'set': ABI('set', '0x60fe47b1', 'uint256', '', True, DEFAULT_QUOTA),
+                    'add': ABI('add', '0x1003e2d2', 'uint256', '', True, 30000)}
+    submitter = BatchSubmitter(client, b'')
+    submitter.register(func_mapping)
+    assert submitter.selector_quota == {bytes.fromhex('1003e2d2'): 30000}  # DEFAULT_QUOTA只是上限, 不注册
+    tx_code_list = [b'\x01' * 20 + bytes.fromhex(selector) + bytes(32) for selector in ('60fe47b1', '1003e2d2') * 50]
+    assert [submitter.get_quota(c) for c in tx_code_list[:2]] == [submitter.default_quota, 30000]
+
+    sent = []
+    monkeypatch.setattr(client, 'batch_call_func_raw', lambda private_key, batch_data, quota: sent.append(quota) or '0x%02x' % len(sent))
+    chunks = list(submitter.submit(tx_code_list))
+    assert len(chunks) == 1 and sent == [chunks[0].quota] == [(submitter.default_quota + 30000) * 50]
+    assert chunks[0].quota <= submitter.max_quota
+
+
+def test_batch_submitter_error(monkeypatch):
+    from cita import BatchSubmitter, BatchSubmitError
+
+    tx_code_list = [bytes([i]) * 20 + b'\x12\x34\x56\x78' for i in range(10)]
+    sent = []
+
+    def batch_call_func_raw(private_key, batch_data, quota):
+        sent.append(batch_data)
+        if batch_data.startswith(tx_code_list[2][:20]):
+            raise RuntimeError('`sendRawTransaction` jsonrpc failed')
+        time.sleep(0.05)
+        return '0x%02x' % batch_data[0]
+
+    monkeypatch.setattr(client, 'batch_call_func_raw', batch_call_func_raw)
+    submitter = BatchSubmitter(client, b'', max_quota=100, max_in_flight=3)
+    chunks = []
+    with pytest.raises(BatchSubmitError) as e:
+        for chunk in submitter.submit((tx_code, 100) for tx_code in tx_code_list):
+            chunks.append(chunk)
+    # 出错后不再发送新的交易, 已经发出的交易都会报告给调用方
+    assert [c.tx_hash for c in chunks + e.value.submitted] == ['0x00', '0x01']
+    assert [list(c.indices) for c in e.value.failed] == [[2]]
+    assert len(sent) == 3
+
+    sent.clear()
+    it = submitter.submit((tx_code, 100) for tx_code in tx_code_list[3:])
+    assert next(it).tx_hash == '0x03'
+    it.close()  # 提前停止
+    assert [c.tx_hash for c in submitter.abandoned] == ['0x04', '0x05']
+    assert len(sent) == 3
+
+
+def test_multicall(monkeypatch):
+    simple_class = ContractClass(Path('tests/SimpleStorage.sol'), client)
+    objs = [simple_class.bind('0x' + '%040x' % i, b'') for i in range(1, 6)]
+
+    sent = []
+
+    def call_readonly_funcs(call_list, from_addr=b'', height=None):
+        sent.append((call_list, height))
+        return [encode_param('uint256', int(param_to_str(addr), 16)) for addr, _, _ in call_list]
+
+    monkeypatch.setattr(client, 'call_readonly_funcs', call_readonly_funcs)
+    monkeypatch.setattr(client, 'get_latest_block_number', lambda: 42)
+
+    with client.multicall(batch_size=2) as m:
+        futures = [m(obj).get() for obj in objs[:4]]
+        futures.append(m.call(objs[4].get))
+        with pytest.raises(ValueError):
+            m(objs[0]).set(1)
+        assert not futures[0].done()
+    assert [i.result() for i in futures] == [1, 2, 3, 4, 5]
+    assert [len(call_list) for call_list, _ in sent] == [2, 2, 1]
+    assert all(height == 42 for _, height in sent)  # 分成多个请求时在同一个区块上调用
+
+    sent.clear()
+    with pytest.raises(KeyError):
+        with client.multicall() as m:
+            fut = m(objs[0]).get()
+            raise KeyError()
+    assert fut.cancelled() and not sent
+
+
+def test_events(monkeypatch):
+    from cita import EventDecoder, parse_events, make_log_filter
+
+    abi = [{'type': 'event', 'name': 'Transfer', 'anonymous': False, 'inputs': [
+        {'name': 'from', 'type': 'address', 'indexed': True},
+        {'name': 'to', 'type': 'address', 'indexed': True},
+        {'name': 'value', 'type': 'uint256', 'indexed': False}]},
+        {'type': 'event', 'name': 'Note', 'anonymous': False, 'inputs': [
+            {'name': 'text', 'type': 'string', 'indexed': True}]},
+        {'type': 'function', 'name': 'f', 'inputs': [], 'outputs': []}]
+    events = parse_events(json.dumps(abi))
+    transfer = events['Transfer']
+    assert transfer.topic == '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+    assert events[transfer.topic] is transfer and 'f' not in events
+
+    def make_log(height, index, value):
+        return {'address': '0x' + '11' * 20, 'blockNumber': hex(height), 'logIndex': hex(index), 'transactionHash': '0x' + '22' * 32,
+                'topics': [transfer.topic, '0x' + '00' * 12 + 'aa' * 20, '0x' + '00' * 12 + 'bb' * 20],
+                'data': param_to_str(encode_param('uint256', value))}
+
+    decoder = EventDecoder(events.values())
+    event = decoder(make_log(7, 1, 100))
+    assert event.name == 'Transfer' and event.block_number == 7 and event.log_index == 1
+    assert event.args == {'from': '0x' + 'aa' * 20, 'to': '0x' + 'bb' * 20, 'value': 100}
+    assert decoder(dict(make_log(7, 1, 100), topics=[transfer.topic])) is None  # indexed参数个数不同
+    assert decoder(dict(make_log(7, 1, 100), topics=['0x' + '33' * 32])) is None
+    note = events['Note'].decode({'address': '0x', 'blockNumber': '0x1', 'logIndex': '0x0', 'transactionHash': '0x', 'data': '0x',
+                                  'topics': [events['Note'].topic, '0x' + '44' * 32]})
+    assert note.args == {'text': b'\x44' * 32}  # indexed的string只保存了hash
+
+    assert make_log_filter('0x' + '11' * 20, [transfer.topic, None, ['0x01', '0x02']], 5, 'latest') == {
+        'fromBlock': '0x05', 'toBlock': 'latest', 'address': '0x' + '11' * 20, 'topics': [transfer.topic, None, ['0x01', '0x02']]}
+
+    logs = [make_log(h, i, h * 10 + i) for h in range(0, 100, 3) for i in range(2)]
+    requested = []
+
+    def get_logs(address=None, topics=None, from_block=None, to_block=None):
+        requested.append((from_block, to_block))
+        time.sleep(0.01 * (len(requested) % 3))  # 乱序完成
+        to_block = 1000 if to_block == 'latest' else to_block
+        return [log for log in logs if from_block <= int(log['blockNumber'], 16) <= to_block]
+
+    monkeypatch.setattr(client, 'get_logs', get_logs)
+    it = client.iter_logs(10, 50, decoder=decoder, workers=3, chunk_size=7)
+    assert [e.args['value'] for e in it] == [h * 10 + i for h in range(12, 50, 3) for i in range(2)]
+    assert sorted(requested) == [(i, min(i + 7, 50) - 1) for i in range(10, 50, 7)]
+    assert it.stats()['blocks'] == 40 and it.stats()['logs'] == 26
+
+    # 过滤器失效后重新创建, 用getLogs补上中间的log, 不重复返回
+    filters = {}
+    monkeypatch.setattr(client, 'get_latest_block_number', lambda: 60)
+
+    def new_filter(address=None, topics=None):
+        filter_id = hex(len(filters) + 1)
+        filters[filter_id] = []
+        return filter_id
+
+    monkeypatch.setattr(client, 'new_filter', new_filter)
+    monkeypatch.setattr(client, 'uninstall_filter', lambda filter_id: filters.pop(filter_id, None) is not None)
+
+    def get_filter_changes(filter_id):
+        if filter_id not in filters:
+            raise RuntimeError('filter not found')
+        changes, filters[filter_id] = filters[filter_id], []
+        return changes
+
+    monkeypatch.setattr(client, 'get_filter_changes', get_filter_changes)
+    with client.poll_logs(decoder=decoder, poll_interval=0) as poller:
+        assert poller.poll() == [] and poller.filter_id == '0x1'
+        filters['0x1'] += [make_log(61, 0, 1), make_log(61, 1, 2)]
+        assert [e.args['value'] for e in poller.poll()] == [1, 2]
+        filters.clear()
+        logs[:] = [make_log(61, 1, 2), make_log(62, 0, 3)]
+        assert [e.args['value'] for e in poller.poll()] == [3]
+        assert poller.filter_id == '0x1' and '0x1' in filters
+    assert not filters
+
+
+def test_event_registry():
+    from cita import EventArgs, EventRegistry, parse_events
+
+    def make_abi(name, indexed):
+        return [{'type': 'event', 'name': name, 'inputs': [
+            {'name': 'from', 'type': 'address', 'indexed': True},
+            {'name': 'to', 'type': 'address', 'indexed': True},
+            {'name': 'value', 'type': 'uint256', 'indexed': indexed}]}]
+
+    erc20, erc721 = parse_events(make_abi('Transfer', False)), parse_events(make_abi('Transfer', True))
+    assert erc20['Transfer'].topic == erc721['Transfer'].topic
+    registry = EventRegistry()
+    registry.register('0x' + '11' * 20, erc20.values())
+    registry.register(bytes.fromhex('22' * 20), erc721.values())
+
+    topics = [erc20['Transfer'].topic, '0x' + '00' * 12 + 'aa' * 20, '0x' + '00' * 12 + 'bb' * 20]
+    log20 = {'address': '0x' + '11' * 20, 'blockNumber': '0x1', 'logIndex': '0x0', 'transactionHash': '0x', 'topics': topics,
+             'data': param_to_str(encode_param('uint256', 5))}
+    log721 = dict(log20, address='0x' + '22' * 20, logIndex='0x1', topics=topics + ['0x' + '00' * 31 + '07'], data='0x')
+    unknown = dict(log20, address='0x' + '33' * 20)
+
+    events = registry.decode_receipt({'logs': [log20, unknown, log721]})
+    assert [e.log_index for e in events] == [0, 1]
+    assert isinstance(events[0].args, EventArgs) and events[0].args == {'from': '0x' + 'aa' * 20, 'to': '0x' + 'bb' * 20, 'value': 5}
+    assert events[1].args['value'] == 7 and list(events[1].args) == ['from', 'to', 'value']
+
+    lazy = registry(dict(log20, data='0x01'))  # 只有访问非indexed参数时才解码data
+    assert lazy.args['to'] == '0x' + 'bb' * 20
+    with pytest.raises(Exception):
+        lazy.args['value']
+
+    registry.register(None, erc20.values())  # 不限合约地址
+    assert registry(unknown).args['value'] == 5
+    registry.unregister('0x' + '22' * 20)
+    assert registry(log721) is None  # 回退到不限地址的ERC20 Transfer, indexed个数不符
+
+
+def test_chain_follower(tmp_path, monkeypatch):
+    from cita import ChainFollower
+
+    head = [12]
+    requested = []
+
+    def get_blocks_by_number(heights, tx_detail=False):
+        requested.extend(heights)
+        assert max(heights) < head[0]  # 只获取已确认的区块
+        return [{'header': {'number': hex(h)}} for h in heights]
+
+    def get_latest_block_number():
+        head[0] += 2
+        return head[0]
+
+    monkeypatch.setattr(client, 'get_blocks_by_number', get_blocks_by_number)
+    monkeypatch.setattr(client, 'get_latest_block_number', get_latest_block_number)
+
+    path = str(tmp_path / 'cursor')
+    handled = ([], [])
+    follower = client.follow(5, cursor=path, poll_interval=0, batch_size=4)
+    assert isinstance(follower, ChainFollower)
+    follower.add_handler(lambda b: handled[0].append(int(b['header']['number'], 16)))
+    follower.add_handler(lambda b: handled[1].append(int(b['header']['number'], 16)))
+    heights = []
+    for block in follower:
+        heights.append(int(block['header']['number'], 16))
+        if heights[-1] == 30:
+            break
+    assert heights == handled[0] == handled[1] == list(range(5, 31))
+    assert requested[:26] == heights and len(set(requested)) == len(requested)  # 每个区块只获取一次, 后面的区块已经在预取
+    assert follower.height == 29 and open(path).read() == '29'  # 停止时正在处理的区块会再次返回
+
+    requested.clear()
+    with client.follow(0, cursor=path, poll_interval=0) as follower:
+        follower.add_handler(lambda b: follower.close())
+        follower.run()
+    assert requested[0] == 30 and open(path).read() == '30'
+
+
+def test_json_codec(tmp_path, monkeypatch):
+    from cita import JSONCodec, DataCache, get_json_codec, set_json_codec
+    import cita.jsoncodec
+
+    codec = get_json_codec()
+    assert codec is get_json_codec() and codec.name in ('orjson', 'ujson', 'json')
+    from cita.jsoncodec import _may_overflow
+
+    obj = {'result': {'hash': '0x01', 'body': {'transactions': ['0x02']}}, 'id': 3, 'big': 123456789012345678901234567890}
+    assert codec.loads(codec.dumps(obj)) == obj  # 超过64位的整数使用标准库json
+    assert codec.loads(b'{"big": -123456789012345678901234567891}') == {'big': -123456789012345678901234567891}
+    assert _may_overflow(b'{"big": 123456789012345678901234567890}') and _may_overflow('[18446744073709551616]')
+    assert not _may_overflow(b'{"id": 3, "height": 9223372036854775}')
+
+    class LossyOrjson:  # 与orjson一样, 超过64位的整数解码为float
+        dumps = staticmethod(lambda obj: json.dumps(obj).encode())
+        loads = staticmethod(lambda data: json.loads(data, parse_int=lambda x: int(x) if len(x) < 19 else float(x)))
+
+    monkeypatch.setattr(cita.jsoncodec, 'orjson', LossyOrjson)
+    fast = get_json_codec('orjson')
+    assert fast.loads(fast.dumps(obj)) == obj and isinstance(fast.loads(fast.dumps(obj))['big'], int)
+    assert codec.loads(b'{"a": "\\u4e2d"}') == {'a': '中'}
+    with pytest.raises(ValueError):
+        codec.loads(b'<html>bad gateway</html>')
+    with pytest.raises(ValueError):
+        get_json_codec('simplejson')
+
+    class CountingCodec(JSONCodec):
+        calls = 0
+
+        def loads(self, data):
+            CountingCodec.calls += 1
+            return super().loads(data)
+
+    try:
+        set_json_codec(CountingCodec())
+        cache = DataCache(path=str(tmp_path / 'cache.db'))
+        cache.put('block:1:0', obj)
+        assert cache.get('block:1:0') == obj and CountingCodec.calls == 1
+        assert isinstance(CitaClient(CITA_URL).json_codec, CountingCodec)
+    finally:
+        set_json_codec(codec)